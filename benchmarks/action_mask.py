@@ -0,0 +1,290 @@
+"""
+Vectorized action mask against the original per-action-string implementation.
+
+The original get_invalid_action_mask is kept here as the reference. Randomized states covering
+every rule (available commands, potion slots and targets, choice lists with potion rewards,
+previous command, hand playability and targets, dead monsters, missing or empty game and combat
+states) are checked for identical masks, or identical exceptions on malformed states, then both
+are timed on game states. Exits non-zero on the first difference.
+
+The same check runs through the env's ActionMaskCache with states revisited, then game states
+are replayed in order with step-like previous actions to report the cache hit rate and the
+time per mask with and without it.
+
+Run from the repository root:
+    python -m benchmarks.action_mask --random 20000
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from util.action_masks import ActionMaskCache
+from benchmarks.sample_states import benchmark_states
+
+EXTRA_COMMANDS = ["key", "click", "wait", "state"]
+CHOICE_NAMES = ["gold", "card", "Fire Potion", "POTION", "relic", "x=3", "potion of capacity", "skip"]
+
+
+def reference_invalid_action_mask(env, state):
+    invalid_action_mask = np.zeros(len(env.actions), dtype=bool)
+
+    # Process available commands
+    available_commands = state.get('available_commands', [])
+    for i, action in enumerate(env.actions):
+        command = action.split()[0].lower()
+        if command not in available_commands:
+            invalid_action_mask[i] = True
+
+    # Check if 'game_state' exists
+    game_state = state.get('game_state', None)
+    if not game_state:
+        # If game_state doesn't exist, assume that only START commands are valid
+        for i, action in enumerate(env.actions):
+            if action not in ["START IRONCLAD 0", "START SILENT 0"]:
+                invalid_action_mask[i] = True
+        return ~invalid_action_mask  # Invert mask before returning
+
+    # Check if all potion slots are filled
+    potions = game_state.get('potions', [])
+    all_slots_filled = all(potion['id'] != "Potion Slot" for potion in potions)
+    
+    # Handle Potion actions
+    for i, action in enumerate(env.actions):
+        parts = action.split()
+        if parts[0].lower() == 'potion':
+            use_discard = 0 if parts[1].lower() == 'use' else 1
+            potion_slot = int(parts[2])
+            
+            if potion_slot >= len(potions):
+                invalid_action_mask[i] = True
+                continue
+
+            potion = potions[potion_slot]
+
+            if not potion['can_use'] and use_discard == 0:
+                invalid_action_mask[i] = True
+                continue
+            if not potion['can_discard'] and use_discard == 1:
+                invalid_action_mask[i] = True
+                continue
+            if potion['requires_target']:
+                if len(parts) < 4:
+                    invalid_action_mask[i] = True
+                    continue
+                
+                target_index = int(parts[3])
+                monsters = game_state.get('combat_state', {}).get('monsters', [])
+                valid_monster_indices = [idx for idx, monster in enumerate(monsters) if not monster.get('is_gone', False)]
+                
+                if target_index not in valid_monster_indices:
+                    invalid_action_mask[i] = True
+                    continue
+
+            if not potion['requires_target'] and len(parts) == 4:
+                invalid_action_mask[i] = True
+
+    # Handle choice-related actions
+    choice_list = game_state.get('choice_list', [])
+    screen_type = game_state.get('screen_type', '')
+    if len(choice_list) != 0:
+        for i, action in enumerate(env.actions):
+            parts = action.split()
+            if parts[0].lower() == 'choose':
+                choice_index = int(parts[1])
+                if choice_index >= len(choice_list):
+                    invalid_action_mask[i] = True
+                    continue
+                
+                # Invalidate choosing a potion if all slots are filled
+                if screen_type == "COMBAT_REWARD" and all_slots_filled:
+                    if "potion" in choice_list[choice_index].lower():
+                        invalid_action_mask[i] = True
+
+    # Prevent "RETURN" action immediately after "PROCEED"
+    if env.previous_action is not None:
+        previous_command = env.actions[env.previous_action].split()[0].lower()
+        if previous_command == 'proceed' or previous_command == "choose" or previous_command == "return":
+            for i, action in enumerate(env.actions):
+                if action.split()[0].lower() == 'return':
+                    invalid_action_mask[i] = True
+        if previous_command == 'leave':
+            for i, action in enumerate(env.actions):
+                if action.lower() == 'choose 0':
+                    invalid_action_mask[i] = True
+
+    # Handle combat-related actions
+    combat_state = game_state.get('combat_state', None)
+    if not combat_state:
+        # If combat_state doesn't exist, restrict combat-related actions
+        for i, action in enumerate(env.actions):
+            if action.startswith('PLAY'):
+                invalid_action_mask[i] = True
+        return ~invalid_action_mask  # Invert mask before returning
+
+    hand = combat_state.get('hand', [])
+    monsters = combat_state.get('monsters', [])
+    has_playable_cards = any(card.get('is_playable') for card in hand)
+
+    # If no action has been taken and there are playable cards, invalidate "END"
+    if not env.action_taken and has_playable_cards:
+        for i, action in enumerate(env.actions):
+            if action.lower() == 'end':
+                invalid_action_mask[i] = True
+
+    valid_monster_indices = [i for i, monster in enumerate(monsters) if not monster['is_gone']]
+    for i, action in enumerate(env.actions):
+        parts = action.split()
+        if parts[0].lower() == 'play':
+            card_index = int(parts[1]) - 1
+            if card_index >= len(hand):
+                invalid_action_mask[i] = True
+                continue
+            card = hand[card_index]
+            if not card['is_playable']:
+                invalid_action_mask[i] = True
+                continue
+            if card['has_target'] and len(parts) < 3:
+                invalid_action_mask[i] = True
+                continue
+            if not card['has_target'] and len(parts) == 3:
+                invalid_action_mask[i] = True
+                continue
+            if len(parts) == 3:
+                target_index = int(parts[2])
+                if target_index not in valid_monster_indices:
+                    invalid_action_mask[i] = True
+
+    return ~invalid_action_mask  # Invert mask before returning
+
+
+def random_state(rng, env):
+    """
+    A random, not necessarily consistent, CommunicationMod state exercising every mask rule.
+    """
+    available_commands = rng.sample(env.commands + EXTRA_COMMANDS, rng.randint(0, len(env.commands)))
+    state = {"available_commands": available_commands}
+
+    roll = rng.random()
+    if roll < 0.05:
+        return state
+    if roll < 0.08:
+        state["game_state"] = rng.choice([None, {}])
+        return state
+
+    potions = []
+    for _ in range(rng.randint(0, 6)):
+        empty = rng.random() < 0.3
+        potions.append({
+            "id": "Potion Slot" if empty else rng.choice(["Fire Potion", "Block Potion", "Fairy Potion"]),
+            "can_use": rng.choice([True, False, 0, 1]),
+            "can_discard": rng.choice([True, False]),
+            "requires_target": rng.choice([True, False]),
+        })
+    game_state = {
+        "potions": potions,
+        "choice_list": [rng.choice(CHOICE_NAMES) for _ in range(rng.choice([0, 0, rng.randint(1, 22)]))],
+        "screen_type": rng.choice(["COMBAT_REWARD", "COMBAT_REWARD", "NONE", "MAP", ""]),
+    }
+
+    roll = rng.random()
+    if roll < 0.1:
+        pass
+    elif roll < 0.15:
+        game_state["combat_state"] = rng.choice([None, {}])
+    else:
+        game_state["combat_state"] = {
+            "hand": [{"is_playable": rng.random() < 0.7, "has_target": rng.random() < 0.5} for _ in range(rng.randint(0, 10))],
+            "monsters": [{"is_gone": rng.random() < 0.3} for _ in range(rng.randint(0, 6))],
+        }
+    state["game_state"] = game_state
+    return state
+
+
+def outcome(mask_function, env, state):
+    try:
+        return mask_function(env, state)
+    except Exception as e:
+        return type(e).__name__
+
+
+def check_equivalence(env, states, rng):
+    for index, state in enumerate(states):
+        env.previous_action = rng.choice([None, rng.randrange(len(env.actions))])
+        env.action_taken = rng.random() < 0.5
+        expected = outcome(reference_invalid_action_mask, env, state)
+        actual = outcome(lambda env, state: env.get_invalid_action_mask(state), env, state)
+        if isinstance(expected, str) or isinstance(actual, str):
+            same = expected == actual
+        else:
+            same = actual.dtype == expected.dtype and np.array_equal(actual, expected)
+        if not same:
+            print(f"Mask differs on state {index}: {state}")
+            print(f"previous_action={env.previous_action} action_taken={env.action_taken}")
+            print(f"expected {expected}\nactual   {actual}")
+            return False
+    return True
+
+
+def time_masks(mask_function, env, states, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for state in states:
+            mask_function(env, state)
+    return (time.perf_counter() - start) / (repeats * len(states))
+
+
+def replay(mask_function, env, states, seed):
+    """
+    Masks of `states` in order, with a legal action of the previous mask taken between states
+    as a step would, returns the time per mask.
+    """
+    rng = random.Random(seed)
+    env.previous_action, env.curr_action, env.action_taken = None, None, False
+    elapsed = 0
+    for state in states:
+        env.previous_action = env.curr_action
+        start = time.perf_counter()
+        mask = mask_function(env, state)
+        elapsed += time.perf_counter() - start
+        legal = np.flatnonzero(mask)
+        env.curr_action = int(rng.choice(legal)) if len(legal) else None
+    return elapsed / len(states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark the vectorized action mask.")
+    parser.add_argument("--random", type=int, default=20000, help="Number of randomized states to check")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states, synthetic states are used if nothing matches")
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic states")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    env = SlayTheSpireEnv({})
+    states = benchmark_states(args.count, args.states)
+    random_states = [random_state(rng, env) for _ in range(args.random)]
+    # Revisited states go through the cache, small pools of states repeat their signatures
+    revisits = [rng.choice(random_states[:rng.randint(1, 50)]) for _ in range(len(random_states))]
+    if not check_equivalence(env, random_states + revisits + states, rng):
+        sys.exit(1)
+    print(f"{len(random_states) + len(revisits)} random and {len(states)} game states, masks identical to the reference")
+    print(f"checked through the cache: {env.action_mask_cache.report()}")
+
+    env.previous_action = None
+    reference = time_masks(reference_invalid_action_mask, env, states, args.repeats)
+    vectorized = time_masks(lambda env, state: env.action_metadata.valid_mask(state), env, states, args.repeats)
+    print(f"reference: {reference * 1e6:.1f} us/state, vectorized: {vectorized * 1e6:.1f} us/state ({reference / vectorized:.1f}x)")
+
+    uncached = replay(lambda env, state: env.action_metadata.valid_mask(state, env.previous_action, env.action_taken), env, states, args.seed)
+    env.action_mask_cache = ActionMaskCache(env.action_metadata)
+    cached = replay(lambda env, state: env.get_invalid_action_mask(state), env, states, args.seed)
+    print(f"replayed in order: vectorized {uncached * 1e6:.1f} us/state, cached {cached * 1e6:.1f} us/state ({uncached / cached:.1f}x), {env.action_mask_cache.report()}")
+
+
+if __name__ == "__main__":
+    main()
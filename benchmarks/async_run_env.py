@@ -0,0 +1,150 @@
+"""
+Blocking run_environment workers against one asyncio GameMultiplexer worker when the game's
+response time dominates.
+
+Stand-in middlemen (benchmarks.vec_env) answer every command with the next synthetic state
+after --latency ms. For --seconds both setups play --games games:
+
+- blocking: one process per game running the step loop of run_environment (receive_state,
+  batch-1 inference, evaluate_actions and predict_values, rollout buffer add)
+- async: one process, GameMultiplexer with micro-batched inference
+
+The database tracking is left out of both. Reported are env steps per second, the CPU seconds
+the workers used and the steps per CPU second (steps/sec per core). Torch is limited to one
+thread in every worker.
+
+Run from the repository root:
+    python -m benchmarks.async_run_env --games 8 --latency 20
+"""
+import argparse
+import asyncio
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+import torch as th
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
+
+from slay_the_spire_env import SlayTheSpireEnv
+from model.custom_rollout_buffer import CustomRolloutBuffer
+from environment.async_run_env import GameMultiplexer
+from util.communication import GameConnection, handle_end_of_episode
+from benchmarks.sample_states import synthetic_trajectory
+from benchmarks.vec_env import start_middlemen
+
+# Fresh worker processes, as on Windows, rather than forks of this one
+context = multiprocessing.get_context("spawn")
+
+
+def serve_middlemen(count, latency, ports):
+    ports.put(start_middlemen(count, synthetic_trajectory(500), latency))
+    threading.Event().wait()
+
+
+def blocking_worker(port, seconds, n_steps, results):
+    """
+    The step loop of run_environment without the database tracking, for `seconds`.
+    """
+    th.set_num_threads(1)
+    env = SlayTheSpireEnv({}, incremental_encoding=True)
+    model = MaskablePPO("MultiInputPolicy", env, verbose=0)
+    rollout_buffer = CustomRolloutBuffer(n_steps, env.observation_space, env.action_space, model.device, gamma=model.gamma, gae_lambda=model.gae_lambda)
+    connection = GameConnection.connect(port)
+
+    steps = 0
+    start_cpu = time.process_time()
+    deadline = time.perf_counter() + seconds
+    env.reset()
+    next_state = None
+    while time.perf_counter() < deadline:
+        game_state = next_state if next_state is not None else connection.receive_state()
+        next_state = None
+        env.update_game_state(game_state)
+        obs_slot = rollout_buffer.observation_slot()
+        env.encode_observation(game_state, out={key: view[0] for key, view in obs_slot.items()})
+        obs_tensor = obs_as_tensor(obs_slot, model.device)
+        action_mask = env.get_invalid_action_mask(game_state)
+        with th.no_grad():
+            action_tensor = model.policy.get_distribution(obs_tensor, action_masks=action_mask[np.newaxis]).get_actions()
+        action = int(action_tensor)
+        connection.send_command(env.actions[action])
+
+        reward, done, _ = env.take_action(action)
+        values, log_prob, _ = model.policy.evaluate_actions(obs_tensor, action_tensor)
+        values = model.policy.predict_values(obs_tensor)
+        rollout_buffer.add(None, action_tensor, reward, done, values, log_prob)
+        if len(rollout_buffer) >= n_steps:
+            rollout_buffer.compute_returns_and_advantage(last_values=model.policy.predict_values(obs_tensor), dones=done)
+            rollout_buffer.reset()
+        if done:
+            next_state = handle_end_of_episode(connection)
+            env.reset()
+        steps += 1
+    results.put((steps, time.process_time() - start_cpu))
+    connection.close()
+
+
+def run_blocking(ports, seconds, n_steps):
+    results = context.Queue()
+    workers = [context.Process(target=blocking_worker, args=(port, seconds, n_steps, results)) for port in ports]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(steps for steps, _ in outcomes), sum(cpu for _, cpu in outcomes)
+
+
+async def play_for(multiplexer, seconds):
+    try:
+        await asyncio.wait_for(multiplexer.run(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def async_worker(ports, seconds, n_steps, batch_window, results):
+    th.set_num_threads(1)
+    multiplexer = GameMultiplexer(range(len(ports)), ports, queue.Queue(), n_steps=n_steps, batch_window=batch_window, tracking=False)
+    start_cpu = time.process_time()
+    asyncio.run(play_for(multiplexer, seconds))
+    results.put((multiplexer.steps, time.process_time() - start_cpu, multiplexer.batcher.report()))
+
+
+def run_async(ports, seconds, n_steps, batch_window):
+    results = context.Queue()
+    worker = context.Process(target=async_worker, args=(ports, seconds, n_steps, batch_window, results))
+    worker.start()
+    outcome = results.get()
+    worker.join()
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare blocking run_environment workers with one asyncio multiplexed worker.")
+    parser.add_argument("--games", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=20.0, help="Simulated game response time in ms")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--n-steps", type=int, default=256, help="Rollout buffer size of every game")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="Micro-batch window in ms")
+    args = parser.parse_args()
+
+    ports = context.Queue()
+    middlemen = [context.Process(target=serve_middlemen, args=(args.games, args.latency / 1000, ports), daemon=True) for _ in range(2)]
+    for middleman in middlemen:
+        middleman.start()
+
+    blocking_steps, blocking_cpu = run_blocking(ports.get(), args.seconds, args.n_steps)
+    async_steps, async_cpu, batches = run_async(ports.get(), args.seconds, args.n_steps, args.batch_window / 1000)
+
+    print(f"{args.games} games, {args.latency:.1f} ms simulated game latency, {args.seconds:.0f}s each")
+    print(f"{'':<26}{'steps/s':>10}{'CPU s':>10}{'steps/CPU s':>14}")
+    print(f"{'blocking, 1 per process':<26}{blocking_steps / args.seconds:>10.0f}{blocking_cpu:>10.2f}{blocking_steps / blocking_cpu:>14.0f}")
+    print(f"{'async, 1 process':<26}{async_steps / args.seconds:>10.0f}{async_cpu:>10.2f}{async_steps / async_cpu:>14.0f}")
+    print(batches)
+
+
+if __name__ == "__main__":
+    main()
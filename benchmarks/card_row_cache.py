@@ -0,0 +1,72 @@
+"""
+Card row cache over a stream of consecutive states.
+
+Encodes every card the observation encoders see (hand, deck and card screens) with and
+without the shared card row cache, checks both give the same rows and reports the hit rate.
+
+Run from the repository root:
+    python -m benchmarks.card_row_cache --states "game_state_*.json"
+"""
+import argparse
+import time
+
+from observations.hand_observations import encode_hand_card, MAX_HAND_SIZE
+from observations.deck_observations import encode_deck_card, MAX_DECK_SIZE
+from observations.observation_processing import tokenize_card
+from util.card_cache import card_row_cache_report, clear_card_row_cache
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+
+def card_lookups(states):
+    """
+    (encoder, card) pairs in the order a worker encodes them.
+    """
+    lookups = []
+    for state in states:
+        game_state = state.get("game_state")
+        if game_state is None:
+            continue
+        combat_state = game_state.get("combat_state") or {}
+        lookups.extend((encode_hand_card, card) for card in combat_state.get("hand", [])[:MAX_HAND_SIZE])
+        lookups.extend((encode_deck_card, card) for card in game_state.get("deck", [])[:MAX_DECK_SIZE])
+        screen_state = game_state.get("screen_state") or {}
+        for key in ("cards", "hand", "selected", "selected_cards"):
+            lookups.extend((tokenize_card, card) for card in screen_state.get(key, []))
+    return lookups
+
+
+def time_lookups(lookups, uncached):
+    start = time.perf_counter()
+    if uncached:
+        for encode, card in lookups:
+            encode.uncached(card)
+    else:
+        for encode, card in lookups:
+            encode(card)
+    return (time.perf_counter() - start) / len(lookups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared card row cache.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states, a synthetic run is used if nothing matches")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) or synthetic_trajectory(args.count)
+    lookups = card_lookups(states)
+
+    for encode, card in lookups:
+        if encode(card) != tuple(encode.uncached(card)):
+            raise ValueError(f"Cached row of {card.get('id')} differs from a fresh encode")
+
+    clear_card_row_cache()
+    cached = time_lookups(lookups, uncached=False)
+    uncached = time_lookups(lookups, uncached=True)
+
+    print(f"{len(lookups)} card encodes over {len(states)} states, cached rows identical to fresh encodes")
+    print(f"uncached: {uncached * 1e9:.0f} ns/card, cached: {cached * 1e9:.0f} ns/card ({uncached / cached:.2f}x)")
+    print(card_row_cache_report())
+
+
+if __name__ == "__main__":
+    main()
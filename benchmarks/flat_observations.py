@@ -0,0 +1,73 @@
+"""
+Per-step cost of the Dict observation against the flat observation mode.
+
+Each step encodes a state into a rollout buffer slot, converts the slot to a tensor and samples
+an action from the policy, the way a worker does. The flat vector is first checked to hold
+the Dict components in OBSERVATION_SLICES order.
+
+Run from the repository root:
+    python -m benchmarks.flat_observations --states "game_state_*.json"
+"""
+import argparse
+import time
+
+import numpy as np
+import torch as th
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
+
+from slay_the_spire_env import SlayTheSpireEnv
+from model.custom_rollout_buffer import CustomRolloutBuffer
+from observations.observation_layout import OBSERVATION_SLICES
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+
+def check_layout(states):
+    flat_env = SlayTheSpireEnv({}, flat_observations=True)
+    dict_env = SlayTheSpireEnv({})
+    for state in states:
+        flat = flat_env.encode_flat_observation(state)
+        components = dict_env.flatten_observation(state)
+        for key, components_slice in OBSERVATION_SLICES.items():
+            if not np.array_equal(flat[components_slice], components[key].ravel()):
+                raise ValueError(f"Flat observation slice of '{key}' differs from the Dict component")
+
+
+def time_steps(states, flat_observations):
+    env = SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=flat_observations)
+    model = MaskablePPO("MlpPolicy" if flat_observations else "MultiInputPolicy", env, device="cpu")
+    rollout_buffer = CustomRolloutBuffer(len(states), env.observation_space, env.action_space, "cpu")
+
+    start = time.perf_counter()
+    for state in states:
+        obs_slot = rollout_buffer.observation_slot()
+        if flat_observations:
+            env.encode_flat_observation(state, out=obs_slot[0])
+        else:
+            env.encode_observation(state, out={key: view[0] for key, view in obs_slot.items()})
+        obs_tensor = obs_as_tensor(obs_slot, "cpu")
+        action_mask = env.get_invalid_action_mask(state)
+        with th.no_grad():
+            model.policy.get_distribution(obs_tensor, action_masks=action_mask[np.newaxis]).get_actions()
+        rollout_buffer.pos += 1
+    return (time.perf_counter() - start) / len(states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Dict against flat observations per step.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states, a synthetic run is used if nothing matches")
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic states")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) or synthetic_trajectory(args.count)
+    check_layout(states)
+    th.set_num_threads(1)
+
+    dict_step = time_steps(states, flat_observations=False)
+    flat_step = time_steps(states, flat_observations=True)
+    print(f"{len(states)} states, flat observations identical to the Dict components")
+    print(f"dict: {dict_step * 1e6:.1f} us/step, flat: {flat_step * 1e6:.1f} us/step ({dict_step / flat_step:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Receive cost per state size: the old unframed receive against the framed protocol.
+
+States grow from a few KB to --max-kb by adding cards to the deck. Over a local socket pair a
+stand-in middleman sends one state per command, and the worker side receives it
+
+- unframed: as receive_full_json used to, 4 KB recv calls and a json.loads of everything
+  received so far after each, until one succeeds (quadratic in the state size)
+- framed: GameConnection.receive_state, one header, one payload read and one json.loads
+
+Reported are microseconds per state and per KB and the number of json.loads calls per state.
+The framed cost per KB stays flat as states grow.
+
+Run from the repository root:
+    python -m benchmarks.framing
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+
+from util.communication import GameConnection
+from util.framing import MESSAGE_STATE, send_message, receive_message
+from benchmarks.sample_states import make_card, synthetic_trajectory
+
+
+def sized_state(state, kilobytes, rng):
+    """
+    Copy of a state grown to about `kilobytes` of JSON with extra deck cards.
+    """
+    state = json.loads(json.dumps(state))
+    deck = state["game_state"].setdefault("deck", [])
+    card_size = len(json.dumps(make_card(rng)))
+    while len(json.dumps(state)) < kilobytes * 1024:
+        deck.extend(make_card(rng) for _ in range(max(1, (kilobytes * 1024 - len(json.dumps(state))) // card_size)))
+    return json.dumps(state).encode('utf-8')
+
+
+def unframed_receive(client_socket):
+    """
+    The receive loop of receive_full_json before the framed protocol, returns the state and
+    the number of json.loads calls it took.
+    """
+    data = b''
+    parses = 0
+    while True:
+        part = client_socket.recv(4096)
+        if not part:
+            raise ConnectionError("Socket connection closed")
+        data += part
+        parses += 1
+        try:
+            return json.loads(data.decode('utf-8')), parses
+        except json.JSONDecodeError:
+            continue
+
+
+def serve(server_socket, payload, framed, count):
+    for sequence in range(1, count + 1):
+        if framed:
+            send_message(server_socket, MESSAGE_STATE, sequence, payload)
+            receive_message(server_socket)
+        else:
+            server_socket.sendall(payload)
+            server_socket.recv(4096)
+
+
+def time_receive(payload, framed, count):
+    """
+    Seconds and json.loads calls per received state.
+    """
+    server_socket, client_socket = socket.socketpair()
+    sender = threading.Thread(target=serve, args=(server_socket, payload, framed, count))
+    sender.start()
+    connection = GameConnection(client_socket)
+    elapsed = 0
+    parses = 0
+    for _ in range(count):
+        start = time.perf_counter()
+        if framed:
+            connection.receive_state()
+            parses += 1
+        else:
+            parses += unframed_receive(client_socket)[1]
+        elapsed += time.perf_counter() - start
+        if framed:
+            connection.send_command("END")
+        else:
+            client_socket.sendall(b"END")
+    sender.join()
+    server_socket.close()
+    client_socket.close()
+    return elapsed / count, parses / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare unframed and framed state receiving as states grow.")
+    parser.add_argument("--max-kb", type=int, default=256)
+    parser.add_argument("--count", type=int, default=50, help="States received per size")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    base = next(state for state in synthetic_trajectory(50) if state.get("game_state", {}).get("screen_type") == "NONE")
+    sizes = [16]
+    while sizes[-1] * 2 <= args.max_kb:
+        sizes.append(sizes[-1] * 2)
+
+    print(f"{'KB':>6}{'unframed us':>14}{'us/KB':>8}{'parses':>8}{'framed us':>12}{'us/KB':>8}{'parses':>8}{'speedup':>9}")
+    for kilobytes in sizes:
+        payload = sized_state(base, kilobytes, rng)
+        size_kb = len(payload) / 1024
+        unframed, unframed_parses = time_receive(payload, False, args.count)
+        framed, framed_parses = time_receive(payload, True, args.count)
+        print(f"{size_kb:>6.0f}{unframed * 1e6:>14.0f}{unframed * 1e6 / size_kb:>8.1f}{unframed_parses:>8.1f}"
+              f"{framed * 1e6:>12.0f}{framed * 1e6 / size_kb:>8.1f}{framed_parses:>8.1f}{unframed / framed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
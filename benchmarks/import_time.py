@@ -0,0 +1,116 @@
+"""
+Import-time report for the worker entry points.
+
+Each entry point is imported in a fresh interpreter with `python -X importtime`, which is
+what a newly spawned worker pays before it can connect to its middleman. The report lists
+the total import time and the heaviest top-level packages, and exits non-zero when an entry
+point goes over its budget.
+
+Run from the repository root:
+    python -m benchmarks.import_time --budget 5.0 --output import_time.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "main": "main",
+    "run_env": "environment.run_env",
+    "middleman_process": "middleman_process",
+}
+
+
+def measure_import(module_name):
+    """
+    Import a module in a fresh interpreter and return (total_us, {package: cumulative_us}, error).
+
+    -X importtime prints one line per module after the modules it imported, each nesting
+    level indented by two more spaces. A package's time is the cumulative time of the imports
+    that entered it from another package (torch imported by run_env, not torch.nn imported by
+    torch), so every heavy dependency shows up under its own name. The entry point's own
+    package would only repeat the total and is left out.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative_us)))
+
+    packages = {}
+    total_us = 0
+    entry_package = module_name.split(".")[0]
+    # Read backwards every module comes before the modules it imported, the stack holds its importers
+    importers = []
+    for depth, name, cumulative_us in reversed(imports):
+        while importers and importers[-1][0] >= depth:
+            importers.pop()
+        package = name.split(".")[0]
+        importer_package = importers[-1][1].split(".")[0] if importers else None
+        importers.append((depth, name))
+        if depth == 0:
+            total_us += cumulative_us
+        if package != importer_package and package != entry_package:
+            packages[package] = packages.get(package, 0) + cumulative_us
+
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed"
+    return total_us, packages, error
+
+
+def build_report(top=10):
+    report = {}
+    for entry_point, module_name in ENTRY_POINTS.items():
+        total_us, packages, error = measure_import(module_name)
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        report[entry_point] = {
+            "module": module_name,
+            "total_seconds": total_us / 1e6,
+            "heaviest": [{"module": name, "seconds": us / 1e6} for name, us in heaviest],
+            "error": error,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import time per worker entry point.")
+    parser.add_argument("--budget", type=float, default=None, help="Maximum import time in seconds per entry point")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest packages to list")
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = build_report(args.top)
+    over_budget = False
+    for entry_point, entry in report.items():
+        status = ""
+        if entry["error"]:
+            status = f"  (failed: {entry['error']})"
+        elif args.budget is not None and entry["total_seconds"] > args.budget:
+            status = f"  (over budget of {args.budget:.2f}s)"
+            over_budget = True
+        print(f"{entry_point} [{entry['module']}]: {entry['total_seconds']:.3f}s{status}")
+        for heavy in entry["heaviest"]:
+            print(f"    {heavy['module']:<40} {heavy['seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
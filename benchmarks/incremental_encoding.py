@@ -0,0 +1,79 @@
+"""
+Incremental observation encoding over a stream of consecutive states.
+
+Checks the incremental encoder against a full re-encode on every state (verification mode),
+then times both and reports how often each component was reused. Both are timed into one
+reused observation (a vec env row, where unchanged components are not touched) and into a new
+rollout buffer slot per state (run_env, where they are copied from the previous slot).
+
+Run from the repository root:
+    python -m benchmarks.incremental_encoding --states "game_state_*.json"
+"""
+import argparse
+import time
+
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.observation_layout import empty_observation
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+
+def time_stream(make_encode, states, out, repeats):
+    """
+    Best seconds per state over `repeats` passes, each with a new encoder from `make_encode`.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        encode = make_encode()
+        start = time.perf_counter()
+        for state in states:
+            encode(state, out=out)
+        best = min(best, (time.perf_counter() - start) / len(states))
+    return best
+
+
+def time_slots(make_encode, states, slots, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        encode = make_encode()
+        start = time.perf_counter()
+        for index, state in enumerate(states):
+            encode(state, out={key: array[index] for key, array in slots.items()})
+        best = min(best, (time.perf_counter() - start) / len(states))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incremental observation encoding.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states, a synthetic run is used if nothing matches")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states")
+    parser.add_argument("--repeats", type=int, default=5, help="Passes over the states, the fastest is reported")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) or synthetic_trajectory(args.count)
+    out = empty_observation()
+
+    # Verification mode raises on the first component that differs from a full re-encode
+    verifying_env = SlayTheSpireEnv({}, incremental_encoding=True, verify_encoding=True)
+    for state in states:
+        verifying_env.encode_observation(state, out=out)
+
+    def full_encode():
+        return SlayTheSpireEnv({}).flatten_observation
+
+    def incremental_encode():
+        return SlayTheSpireEnv({}, incremental_encoding=True).encode_observation
+
+    full = time_stream(full_encode, states, out, args.repeats)
+    incremental = time_stream(incremental_encode, states, out, args.repeats)
+    slots = empty_observation(batch_size=len(states))
+    full_slots = time_slots(full_encode, states, slots, args.repeats)
+    incremental_slots = time_slots(incremental_encode, states, slots, args.repeats)
+
+    print(f"{len(states)} states, incremental output identical to a full re-encode")
+    print(f"one observation: full re-encode {full * 1e6:.1f} us/state, incremental {incremental * 1e6:.1f} us/state ({full / incremental:.2f}x)")
+    print(f"slot per state:  full re-encode {full_slots * 1e6:.1f} us/state, incremental {incremental_slots * 1e6:.1f} us/state ({full_slots / incremental_slots:.2f}x)")
+    print(f"reuse per component: {verifying_env.observation_encoder.report()}")
+
+
+if __name__ == "__main__":
+    main()
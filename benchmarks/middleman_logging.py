@@ -0,0 +1,74 @@
+"""
+Cost of the middleman's logging at DEBUG: every state logged in full to a plain log file, as
+middleman_process.py used to, against its buffered, rotating log file with sampled state
+dumps.
+
+The records the middleman (middleman_process.Middleman) logs for one state (the state or its size, the command
+received, the command sent) are logged for every synthetic state with
+
+- full: a FileHandler (one write per record) and every state logged in full
+- sampled: the BufferedRotatingFileHandler, every --every-th state logged in full
+
+Reported are the microseconds per state the forwarding thread spends logging, the CPU
+microseconds per state of the whole process (the logging thread's formatting and writing
+included), the bytes logged per state and the number of log files after rotation at --max-kb.
+
+Run from the repository root:
+    python -m benchmarks.middleman_logging
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+from middleman_process import LOG_STATES_EVERY, logger
+from util.log import configure_logging, stop_logging
+from benchmarks.sample_states import synthetic_trajectory
+
+
+def log_states(lines, log_file, log_states_every, max_bytes):
+    """
+    Seconds per state in the logging calls and CPU seconds per state until the last record
+    is written.
+    """
+    configure_logging(level="DEBUG", stream=None, log_file=log_file, rate_limit=None, max_bytes=max_bytes)
+    cpu_start = time.process_time()
+    elapsed = 0
+    for sequence, line in enumerate(lines, 1):
+        start = time.perf_counter()
+        if log_states_every == 1:
+            logger.debug("Received game state: %s", line)
+        else:
+            logger.debug("Received game state of %d bytes", len(line))
+            if sequence % log_states_every == 0:
+                logger.debug("Game state %d: %s", sequence, line)
+        logger.debug("Received command from gym client: %s", "END")
+        logger.debug("Sent command to game: %s", "END")
+        elapsed += time.perf_counter() - start
+    stop_logging()
+    return elapsed / len(lines), (time.process_time() - cpu_start) / len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and sampled middleman logging at DEBUG.")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states")
+    parser.add_argument("--every", type=int, default=LOG_STATES_EVERY, help="Sampling of the full state dumps")
+    parser.add_argument("--max-kb", type=int, default=1024, help="Rotation size of the sampled log")
+    args = parser.parse_args()
+
+    lines = [json.dumps(state) for state in synthetic_trajectory(args.count)]
+    print(f"{args.count} states, {sum(map(len, lines)) / len(lines) / 1024:.1f} KB each on average")
+    print(f"{'':<10}{'us/state':>10}{'CPU us':>10}{'log B/state':>13}{'files':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, every, max_bytes in (("full", 1, None), ("sampled", args.every, args.max_kb * 1024)):
+            log_file = os.path.join(directory, f"{name}.txt")
+            seconds, cpu = log_states(lines, log_file, every, max_bytes)
+            files = glob.glob(log_file + "*")
+            logged = sum(os.path.getsize(path) for path in files)
+            print(f"{name:<10}{seconds * 1e6:>10.1f}{cpu * 1e6:>10.1f}{logged / len(lines):>13.0f}{len(files):>7}")
+
+
+if __name__ == "__main__":
+    main()
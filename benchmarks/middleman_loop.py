@@ -0,0 +1,76 @@
+"""
+Latency of the middleman's relay loop: middleman_process.py runs as the game runs it, a
+stand-in game writes synthetic states to its stdin and reads the commands from its stdout,
+and a worker (GameConnection) answers every state at once.
+
+Every --blank-every-th state is preceded by an empty line and every --repeat-every-th state
+is written twice, as the game may do. Reported are the microseconds from writing a state to
+reading its command (p50, p99, max) per transport, so the tail shows any stall in the loop.
+
+Run from the repository root:
+    python -m benchmarks.middleman_loop
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from util import transports
+from util.communication import GameConnection
+from benchmarks.sample_states import synthetic_trajectory
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def relay(transport, lines, blank_every, repeat_every, directory):
+    """
+    Seconds from writing each state to the middleman's stdin to reading its command.
+    """
+    middleman = subprocess.Popen([sys.executable, os.path.join(ROOT, "middleman_process.py"), "--transport", transport],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=directory,
+                                 env={**os.environ, "PYTHONPATH": ROOT})
+    port = int(middleman.stdout.readline())
+    connection = GameConnection.connect(port, transport=transport)
+    times = np.empty(len(lines))
+    for index, line in enumerate(lines, 1):
+        start = time.perf_counter()
+        if blank_every and index % blank_every == 0:
+            middleman.stdin.write("\n")
+        middleman.stdin.write(line)
+        if repeat_every and index % repeat_every == 0:
+            middleman.stdin.write(line)
+        middleman.stdin.flush()
+        connection.receive_state()
+        connection.send_command("END")
+        middleman.stdout.readline()
+        times[index - 1] = time.perf_counter() - start
+    connection.close()
+    middleman.stdin.close()
+    middleman.wait()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the state -> command latency through middleman_process.py.")
+    parser.add_argument("--transports", nargs="+", choices=transports.TRANSPORTS, default=list(transports.TRANSPORTS))
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic states")
+    parser.add_argument("--blank-every", type=int, default=50, help="Empty line before every N-th state, 0 for none")
+    parser.add_argument("--repeat-every", type=int, default=50, help="Write every N-th state twice, 0 for none")
+    args = parser.parse_args()
+
+    lines = [json.dumps(state) + "\n" for state in synthetic_trajectory(args.count)]
+    print(f"{'transport':<10}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    # The middleman writes its log into its working directory
+    with tempfile.TemporaryDirectory() as directory:
+        for transport in args.transports:
+            times = relay(transport, lines, args.blank_every, args.repeat_every, directory) * 1e6
+            print(f"{transport:<10}{np.percentile(times, 50):>10.0f}{np.percentile(times, 99):>10.0f}{times.max():>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
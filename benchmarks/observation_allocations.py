@@ -0,0 +1,58 @@
+"""
+Check that encoding into preallocated buffers allocates no observation arrays per step.
+
+Every observation returned over a run of steps is kept alive and tracemalloc measures how much
+numpy array memory is still held afterwards, i.e. the observation bytes allocated per step.
+Exits non-zero if the in-place path allocates anything.
+
+Run from the repository root:
+    python -m benchmarks.observation_allocations
+"""
+import sys
+import tracemalloc
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.observation_layout import empty_observation
+from benchmarks.sample_states import benchmark_states, menu_state
+
+# tracemalloc domain numpy reports its array data allocations under
+NUMPY_DOMAIN = np.lib.tracemalloc_domain
+
+
+def retained_array_bytes_per_step(encode, states):
+    # Warm up vocabularies and any lazily built state before measuring
+    for state in states:
+        encode(state)
+
+    tracemalloc.start()
+    domain_filter = [tracemalloc.DomainFilter(inclusive=True, domain=NUMPY_DOMAIN)]
+    before = tracemalloc.take_snapshot().filter_traces(domain_filter)
+    results = [encode(state) for state in states]
+    after = tracemalloc.take_snapshot().filter_traces(domain_filter)
+    tracemalloc.stop()
+
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del results
+    return retained / len(states)
+
+
+def main(num_states=200):
+    env = SlayTheSpireEnv({})
+    states = benchmark_states(num_states) + [menu_state()]
+
+    # Views into a rollout-buffer-like array, exactly what run_env encodes into
+    buffer = empty_observation(batch_size=1)
+    slot = {key: view[0] for key, view in buffer.items()}
+
+    allocating = retained_array_bytes_per_step(env.flatten_observation, states)
+    in_place = retained_array_bytes_per_step(lambda state: env.flatten_observation(state, out=slot), states)
+
+    print(f"flatten_observation(state):           {allocating:>8.0f} bytes of arrays allocated per step")
+    print(f"flatten_observation(state, out=slot): {in_place:>8.0f} bytes of arrays allocated per step")
+    sys.exit(0 if in_place == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
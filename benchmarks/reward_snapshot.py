@@ -0,0 +1,256 @@
+"""
+Reward snapshots and reward terms against the original deepcopy of the whole state on every
+step and the original calculate_reward.
+
+The original update_game_state and calculate_reward are kept here as the reference. A recorded
+(or synthetic) run, followed by random transitions between independent states that grow and
+shrink the deck and change curses, relics and gold, is replayed through both and the rewards
+must match (up to float rounding, the terms add up in a different order), as must the rewards
+of the whole run evaluated in one batch with replay_rewards. Then both are timed per step, and
+tracemalloc measures the memory allocated within a step (its peak above what is held before it).
+
+Run from the repository root:
+    python -m benchmarks.reward_snapshot --states "game_state_*.json"
+"""
+import argparse
+import contextlib
+import copy
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from util.reward_terms import replay_rewards
+from benchmarks.sample_states import load_recorded_states, synthetic_states, synthetic_trajectory
+
+
+def reference_update_game_state(env, state):
+    env.previous_state = copy.deepcopy(env.state)
+    env.state = state
+
+
+def reference_calculate_reward(env):
+    reward = 0
+    invalid_action_mask = env.get_invalid_action_mask(env.previous_state)
+    if env.previous_state is None or env.state is None or env.previous_action is None:
+        return reward
+
+    previous_game_state = env.previous_state.get('game_state', None)
+    current_game_state = env.state.get('game_state', None)
+    if previous_game_state is None or current_game_state is None:
+        return reward
+
+    previous_combat_state = previous_game_state.get('combat_state', {})
+    current_combat_state = current_game_state.get('combat_state', {})
+    previous_monsters = previous_combat_state.get('monsters', [])
+    current_monsters = current_combat_state.get('monsters', [])
+
+    if len(previous_combat_state) > 0:
+        for prev_monster, curr_monster in zip(previous_monsters, current_monsters):
+            if curr_monster.get('current_hp', 0) < prev_monster.get('current_hp', 0):
+                print("Monster Damage Reward ", env.actions[env.previous_action])
+                max_hp = curr_monster.get('max_hp', 1)
+                health_diff = prev_monster.get('current_hp', 0) - curr_monster.get('current_hp', 0)
+                percentage_damage = health_diff / max_hp
+                reward += percentage_damage * 10
+                if curr_monster.get('current_hp', 0) == 0 and prev_monster.get('current_hp', 0) > 0:
+                    print("Monster Kill Reward ", env.actions[env.previous_action])
+                    reward += 20
+
+    if env.previous_state.get("screen_type", None) == "NONE" and env.state.get("screen_type", None) == "COMBAT_REWARD":
+        print("Combat Ended Reward ")
+        reward += 40
+
+    previous_hp = previous_game_state.get('current_hp', 0)
+    current_hp = current_game_state.get('current_hp', 0)
+    if current_hp < previous_hp:
+        print("HP Damage Penalty ", env.actions[env.previous_action])
+        reward -= (previous_hp - current_hp) * 3
+
+    if current_game_state.get('floor', 0) > previous_game_state.get('floor', 0):
+        print("Floor Climbing Reward ", env.actions[env.previous_action])
+        reward += 10
+
+    if env.actions[env.previous_action].startswith('POTION Use'):
+        print("Potion Use Reward ", env.actions[env.previous_action])
+        reward += 10
+
+    if env.actions[env.previous_action].startswith('POTION Discard'):
+        print("Potion Discard Penalty ", env.actions[env.previous_action])
+        reward -= 10
+
+    previous_relics = previous_game_state.get('relics', [])
+    current_relics = current_game_state.get('relics', [])
+    if len(current_relics) > len(previous_relics):
+        print("Relic taken reward ", env.actions[env.previous_action])
+        reward += 50
+
+    previous_gold = previous_game_state.get('gold', 0)
+    current_gold = current_game_state.get('gold', 0)
+    gold_difference = current_gold - previous_gold
+    if gold_difference > 0:
+        print("Gold Gained Reward ", env.actions[env.previous_action])
+        reward += (gold_difference / 10)
+    elif gold_difference < 0:
+        print("Gold Lost Penalty ", env.actions[env.previous_action])
+        reward += (gold_difference * 0.05)
+
+    previous_deck = previous_game_state.get('deck', [])
+    current_deck = current_game_state.get('deck', [])
+    if len(current_deck) > len(previous_deck):
+        new_card = current_deck[-1]
+        rarity = new_card.get('rarity', 'COMMON').upper()
+        if rarity == 'COMMON':
+            print("Common Card Reward ", env.actions[env.previous_action])
+            reward += 3
+        elif rarity == 'UNCOMMON':
+            print("Uncommon Card Reward", env.actions[env.previous_action])
+            reward += 4.3
+        elif rarity == 'RARE':
+            print("Rare Card Reward ", env.actions[env.previous_action])
+            reward += 10
+
+    previous_curse_count = sum(1 for card in previous_deck if card.get('rarity', '').upper() == 'CURSE')
+    current_curse_count = sum(1 for card in current_deck if card.get('rarity', '').upper() == 'CURSE')
+    if current_curse_count < previous_curse_count:
+        print("Curse Removal Reward ", env.actions[env.previous_action])
+        reward += 15
+
+    reward -= 0.1
+    return reward
+
+
+def snapshot_step(env, state):
+    env.update_game_state(state)
+    return env.calculate_reward()
+
+
+def reference_step(env, state):
+    reference_update_game_state(env, state)
+    return reference_calculate_reward(env)
+
+
+def mixed_states(rng, count):
+    """
+    Independent states in random order, with decks that gain, lose and swap cards and curses.
+    """
+    states = synthetic_states(count, seed=rng.randrange(1 << 30))
+    rng.shuffle(states)
+    for state in states:
+        deck = state["game_state"]["deck"]
+        for card in rng.sample(deck, min(len(deck), rng.randint(0, 3))):
+            card["rarity"] = "CURSE"
+        if rng.random() < 0.2:
+            state["game_state"].pop("combat_state", None)
+        state["screen_type"] = rng.choice([None, "NONE", "COMBAT_REWARD"])
+    return states
+
+
+def start_run(env, seed):
+    """
+    Put the env back at the start of a run, returns the rng choosing the actions between states.
+    """
+    env.update_game_state({})
+    env.update_game_state({})
+    env.curr_action = None
+    return random.Random(seed)
+
+
+def take_action(env, rng):
+    env.previous_action, env.curr_action = env.curr_action, rng.randrange(len(env.actions))
+
+
+def replay(step, env, states, seed):
+    """
+    Reward of every step and the action it was credited to.
+    """
+    rng = start_run(env, seed)
+    rewards, credited = [], []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for state in states:
+            take_action(env, rng)
+            rewards.append(step(env, state))
+            credited.append(env.previous_action)
+    return np.array(rewards), credited
+
+
+def time_steps(step, env, states, repeats, seed):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        elapsed = 0
+        for _ in range(repeats):
+            rng = start_run(env, seed)
+            start = time.perf_counter()
+            for state in states:
+                take_action(env, rng)
+                step(env, state)
+            elapsed += time.perf_counter() - start
+    return elapsed / (repeats * len(states))
+
+
+def allocated_per_step(step, env, states, seed):
+    """
+    Mean bytes allocated within a step on top of what was already held.
+    """
+    rng = start_run(env, seed)
+    total = 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        for state in states:
+            take_action(env, rng)
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            step(env, state)
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+    return total / len(states)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark reward snapshots against deep-copied states.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states (.json or .jsonl)")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states when nothing is recorded")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    states = load_recorded_states(args.states) if args.states else []
+    source = f"recorded ({args.states})" if states else "synthetic"
+    if not states:
+        states = synthetic_trajectory(args.count, seed=args.seed)
+    env = SlayTheSpireEnv({})
+
+    for name, check_states in (("run", states), ("mixed", mixed_states(rng, args.count // 2))):
+        expected, credited = replay(reference_step, env, check_states, args.seed)
+        actual, _ = replay(snapshot_step, env, check_states, args.seed)
+        # The first step has no previous action, after that step i is the transition into state i
+        batch = sum(replay_rewards(check_states, credited[1:], env.action_metadata).values())
+        for label, rewards in (("per step", actual), ("batched", np.concatenate([[0.0], batch]))):
+            differs = np.flatnonzero(~np.isclose(rewards, expected, rtol=1e-9, atol=1e-9))
+            if len(differs):
+                print(f"Rewards ({label}) differ on the {name} states from step {differs[0]}: {expected[differs[0]]} != {rewards[differs[0]]}")
+                sys.exit(1)
+        print(f"{len(check_states)} {name} states, per step and batched rewards match the original")
+
+    reference = time_steps(reference_step, env, states, args.repeats, args.seed)
+    snapshot = time_steps(snapshot_step, env, states, args.repeats, args.seed)
+    reference_bytes = allocated_per_step(reference_step, env, states, args.seed)
+    snapshot_bytes = allocated_per_step(snapshot_step, env, states, args.seed)
+    print(f"{len(states)} {source} states, update_game_state + calculate_reward per step:")
+    print(f"deepcopy: {reference * 1e6:>8.1f} us {reference_bytes / 1024:>8.1f} KiB allocated")
+    print(f"snapshot: {snapshot * 1e6:>8.1f} us {snapshot_bytes / 1024:>8.1f} KiB allocated ({reference / snapshot:.1f}x faster)")
+
+    _, credited = replay(snapshot_step, env, states, args.seed)
+    start = time.perf_counter()
+    terms = replay_rewards(states, credited[1:], env.action_metadata)
+    batched = (time.perf_counter() - start) / len(states)
+    print(f"batched: {batched * 1e6:>9.1f} us per transition, snapshots included")
+    print("reward per term over the run: " + ", ".join(f"{name} {values.sum():.1f}" for name, values in terms.items()))
+
+
+if __name__ == "__main__":
+    main()
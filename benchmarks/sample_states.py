@@ -0,0 +1,342 @@
+"""
+CommunicationMod game states for the benchmarks.
+
+Recorded states (the game_state_*.json files written by middleman_process.save_game_state, or
+.jsonl files with one state per line such as middleman_process.py --record recordings) are used
+when available. Otherwise synthetic states with the same structure are generated for every
+screen type the observation code handles.
+"""
+import glob
+import json
+import random
+
+from util.tokenizers import card_names, card_types, card_rarities, intents, monster_ids, powers, relics_list, potion_types, event_ids, reward_types
+
+SCREEN_TYPES = ["NONE", "MAP", "SHOP_SCREEN", "CARD_REWARD", "GRID", "COMBAT_REWARD", "REST", "EVENT", "CHEST", "BOSS_REWARD", "HAND_SELECT"]
+
+# Screen type -> the commands CommunicationMod offers on it
+AVAILABLE_COMMANDS = {
+    "NONE": ["play", "end", "potion", "key", "click", "wait", "state"],
+    "MAP": ["choose", "potion", "key", "click", "wait", "state"],
+    "SHOP_SCREEN": ["choose", "leave", "potion", "key", "click", "wait", "state"],
+    "CARD_REWARD": ["choose", "skip", "potion", "key", "click", "wait", "state"],
+    "GRID": ["choose", "confirm", "potion", "key", "click", "wait", "state"],
+    "COMBAT_REWARD": ["choose", "proceed", "potion", "key", "click", "wait", "state"],
+    "REST": ["choose", "proceed", "potion", "key", "click", "wait", "state"],
+    "EVENT": ["choose", "potion", "key", "click", "wait", "state"],
+    "CHEST": ["choose", "proceed", "potion", "key", "click", "wait", "state"],
+    "BOSS_REWARD": ["choose", "skip", "potion", "key", "click", "wait", "state"],
+    "HAND_SELECT": ["choose", "confirm", "potion", "key", "click", "wait", "state"],
+}
+
+
+def load_recorded_states(pattern="game_state_*.json"):
+    """
+    Load recorded states matching a glob pattern, in file name (i.e. time) order.
+    """
+    states = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            if path.endswith(".jsonl"):
+                records = [json.loads(line) for line in f if line.strip()]
+                # Recordings of middleman_process.py --record wrap every state with its latency
+                states.extend(record["state"] if "state" in record else record for record in records)
+            else:
+                states.append(json.load(f))
+    return states
+
+
+def make_card(rng, upgrades=None):
+    name = rng.choice(card_names)
+    cost = rng.choice([0, 1, 1, 1, 2, 2, 3, "X", -2])
+    return {
+        "exhausts": rng.random() < 0.1,
+        "is_playable": rng.random() < 0.8,
+        "cost": cost,
+        "name": name,
+        "id": name.replace(" ", ""),
+        "type": rng.choice(card_types),
+        "ethereal": rng.random() < 0.05,
+        "uuid": f"{rng.getrandbits(64):016x}",
+        "upgrades": rng.choice([0, 0, 0, 1]) if upgrades is None else upgrades,
+        "rarity": rng.choice(card_rarities),
+        "has_target": rng.random() < 0.5,
+    }
+
+
+def make_starter_card(rng, name):
+    card = make_card(rng, upgrades=0)
+    card.update({"name": name, "id": f"{name}_R", "cost": 1, "type": "ATTACK" if name == "Strike" else "SKILL",
+                 "rarity": "BASIC", "exhausts": False, "ethereal": False, "has_target": name == "Strike"})
+    return card
+
+
+def make_deck(rng, size):
+    deck = [make_starter_card(rng, "Strike") for _ in range(5)] + [make_starter_card(rng, "Defend") for _ in range(4)]
+    deck += [make_card(rng) for _ in range(max(0, size - len(deck)))]
+    return deck[:size]
+
+
+def make_power(rng):
+    name = rng.choice(powers)
+    return {"id": name.replace(" ", ""), "name": name, "amount": rng.randint(1, 5)}
+
+
+def make_monster(rng):
+    monster_id = rng.choice(monster_ids)
+    max_hp = rng.randint(10, 250)
+    return {
+        "id": monster_id,
+        "name": monster_id,
+        "current_hp": rng.randint(0, max_hp),
+        "max_hp": max_hp,
+        "block": rng.randint(0, 15),
+        "intent": rng.choice(intents),
+        "move_base_damage": rng.randint(0, 20),
+        "move_adjusted_damage": rng.randint(0, 25),
+        "move_hits": rng.randint(1, 3),
+        "half_dead": False,
+        "is_gone": rng.random() < 0.15,
+        "powers": [make_power(rng) for _ in range(rng.randint(0, 3))],
+    }
+
+
+def make_potion(rng, empty=False):
+    if empty:
+        return {"id": "Potion Slot", "name": "Potion Slot", "requires_target": False, "can_use": False, "can_discard": False}
+    potion_id = rng.choice(potion_types)
+    return {"id": potion_id, "name": potion_id, "requires_target": rng.random() < 0.3, "can_use": rng.random() < 0.7, "can_discard": True}
+
+
+def make_map(rng, act=1):
+    """A 15 floor map with 3-7 nodes per floor and edges to the next floor."""
+    symbols = ["M", "M", "M", "?", "?", "E", "R", "$", "T"]
+    floors = []
+    for y in range(15):
+        xs = sorted(rng.sample(range(7), rng.randint(3, 6)))
+        floors.append(xs)
+    nodes = []
+    for y, xs in enumerate(floors):
+        for x in xs:
+            children = []
+            if y + 1 < len(floors):
+                next_xs = floors[y + 1]
+                children = [{"x": cx, "y": y + 1} for cx in next_xs if abs(cx - x) <= 1] or [{"x": rng.choice(next_xs), "y": y + 1}]
+            symbol = "M" if y == 0 else "T" if y == 8 else "R" if y == 14 else rng.choice(symbols)
+            nodes.append({"x": x, "y": y, "symbol": symbol, "children": children, "parents": []})
+    return nodes
+
+
+def map_symbol(nodes, position):
+    """Symbol of the map node at a child position, the game sends next nodes with it."""
+    return next(node["symbol"] for node in nodes if node["x"] == position["x"] and node["y"] == position["y"])
+
+
+def make_screen_state(rng, screen_type, game_state):
+    if screen_type == "MAP":
+        current = rng.choice(game_state["map"])
+        return {"current_node": {"x": current["x"], "y": current["y"], "symbol": current["symbol"]},
+                "next_nodes": [dict(child, symbol=map_symbol(game_state["map"], child)) for child in current["children"]],
+                "first_node_chosen": True, "boss_available": False}
+    if screen_type == "SHOP_SCREEN":
+        return {"cards": [dict(make_card(rng), price=rng.randint(40, 160)) for _ in range(7)],
+                "potions": [dict(make_potion(rng), price=rng.randint(40, 90)) for _ in range(3)],
+                "relics": [{"name": name, "id": name, "counter": -1, "price": rng.randint(140, 300)} for name in rng.sample(relics_list, 3)],
+                "purge_cost": 75, "purge_available": True}
+    if screen_type == "CARD_REWARD":
+        return {"cards": [make_card(rng) for _ in range(3)], "bowl_available": False, "skip_available": True}
+    if screen_type == "GRID":
+        deck = game_state["deck"]
+        return {"cards": deck, "selected_cards": [], "num_cards": 1, "any_number": False, "for_upgrade": True,
+                "for_transform": False, "for_purge": False, "confirm_up": False}
+    if screen_type == "COMBAT_REWARD":
+        return {"rewards": [{"type": reward_type, "reward_type": reward_type} for reward_type in rng.sample(reward_types, 3)]}
+    if screen_type == "REST":
+        return {"has_rested": False, "rest_options": ["rest", "smith"]}
+    if screen_type == "EVENT":
+        return {"event_id": rng.choice(event_ids), "event_name": "", "body_text": "",
+                "options": [{"choice_index": i, "disabled": False, "text": "", "label": ""} for i in range(3)]}
+    if screen_type == "CHEST":
+        return {"chest_type": "SmallChest", "chest_open": False}
+    if screen_type == "BOSS_REWARD":
+        return {"relics": [{"name": name, "id": name, "counter": -1} for name in rng.sample(relics_list, 3)]}
+    if screen_type == "HAND_SELECT":
+        return {"hand": [make_card(rng) for _ in range(5)], "selected": [], "max_cards": 1, "can_pick_zero": False}
+    return {}
+
+
+def make_state(rng, screen_type="NONE", deck_size=None, game_map=None):
+    """One synthetic CommunicationMod message with the given screen type."""
+    deck = make_deck(rng, deck_size if deck_size is not None else rng.randint(10, 40))
+    num_potions = 3
+    potions = [make_potion(rng, empty=rng.random() < 0.4) for _ in range(num_potions)]
+    game_state = {
+        "screen_type": screen_type,
+        "screen_name": screen_type,
+        "room_phase": "COMBAT" if screen_type == "NONE" else "COMPLETE",
+        "room_type": "MonsterRoom",
+        "current_hp": rng.randint(1, 80),
+        "max_hp": 80,
+        "floor": rng.randint(1, 50),
+        "act": 1,
+        "act_boss": "Hexaghost",
+        "gold": rng.randint(0, 400),
+        "seed": rng.getrandbits(48),
+        "class": "IRONCLAD",
+        "ascension_level": 0,
+        "deck": deck,
+        "relics": [{"name": name, "id": name, "counter": rng.choice([-1, -1, 0, 3])} for name in rng.sample(relics_list, rng.randint(1, 12))],
+        "potions": potions,
+        "map": game_map if game_map is not None else make_map(rng),
+        "is_screen_up": screen_type != "NONE",
+        "choice_list": [],
+    }
+    if screen_type == "NONE":
+        hand = [make_card(rng) for _ in range(rng.randint(3, 10))]
+        game_state["combat_state"] = {
+            "player": {"current_hp": game_state["current_hp"], "max_hp": 80, "block": rng.randint(0, 20),
+                       "energy": rng.randint(0, 3), "powers": [make_power(rng) for _ in range(rng.randint(0, 4))], "orbs": []},
+            "monsters": [make_monster(rng) for _ in range(rng.randint(1, 5))],
+            "hand": hand,
+            "draw_pile": deck[:10],
+            "discard_pile": [],
+            "exhaust_pile": [],
+            "turn": rng.randint(1, 10),
+            "cards_discarded_this_turn": 0,
+        }
+    game_state["screen_state"] = make_screen_state(rng, screen_type, game_state)
+    if screen_type in ("MAP", "SHOP_SCREEN", "CARD_REWARD", "COMBAT_REWARD", "REST", "EVENT", "BOSS_REWARD"):
+        choices = {"MAP": lambda: [f"x={c['x']}" for c in game_state["screen_state"]["next_nodes"]],
+                   "SHOP_SCREEN": lambda: ["purge"] + [c["name"].lower() for c in game_state["screen_state"]["cards"]],
+                   "CARD_REWARD": lambda: [c["name"].lower() for c in game_state["screen_state"]["cards"]],
+                   "COMBAT_REWARD": lambda: [r["reward_type"].lower() for r in game_state["screen_state"]["rewards"]],
+                   "REST": lambda: list(game_state["screen_state"]["rest_options"]),
+                   "EVENT": lambda: [f"option {o['choice_index']}" for o in game_state["screen_state"]["options"]],
+                   "BOSS_REWARD": lambda: [r["name"].lower() for r in game_state["screen_state"]["relics"]]}
+        game_state["choice_list"] = choices[screen_type]()
+    return {
+        "available_commands": list(AVAILABLE_COMMANDS.get(screen_type, ["state"])),
+        "ready_for_command": True,
+        "in_game": True,
+        "game_state": game_state,
+    }
+
+
+def synthetic_states(count, seed=0, screen_types=None):
+    """Generate `count` states cycling through the given screen types (all by default)."""
+    rng = random.Random(seed)
+    screen_types = screen_types or SCREEN_TYPES
+    game_map = make_map(rng)
+    states = [make_state(rng, screen_types[i % len(screen_types)], game_map=game_map) for i in range(count)]
+    # States of one run share its seed along with the act's map, as they do in a real game
+    # (per-run caches such as the map index would otherwise never hit)
+    for state in states[1:]:
+        state["game_state"]["seed"] = states[0]["game_state"]["seed"]
+    return states
+
+
+def menu_state():
+    """The state CommunicationMod sends from the main menu, before a run has started."""
+    return {"available_commands": ["start", "state"], "ready_for_command": True, "in_game": False}
+
+
+def benchmark_states(count, pattern="game_state_*.json", seed=0):
+    """Recorded states when any match `pattern`, synthetic ones otherwise."""
+    states = load_recorded_states(pattern) if pattern else []
+    if states:
+        return (states * (count // len(states) + 1))[:count]
+    return synthetic_states(count, seed=seed)
+
+
+def synthetic_trajectory(count, seed=0):
+    """
+    Consecutive states of one synthetic run: combats of several turns separated by reward, card
+    reward and map screens. Deck, relics and map persist between states the way they do in a real
+    game, and every state is a separately parsed JSON message.
+    """
+    rng = random.Random(seed)
+    run = {
+        "seed": rng.getrandbits(48),
+        "act": 1,
+        "floor": 1,
+        "gold": 99,
+        "current_hp": 80,
+        "deck": make_deck(rng, 10),
+        "relics": [{"name": "Burning Blood", "id": "Burning Blood", "counter": -1}],
+        "potions": [make_potion(rng, empty=True) for _ in range(3)],
+        "map": make_map(rng),
+    }
+    states = []
+
+    def emit(screen_type, combat_state=None, screen_state=None, choice_list=None, commands=None):
+        game_state = {
+            "screen_type": screen_type, "screen_name": screen_type, "room_phase": "COMBAT" if combat_state else "COMPLETE",
+            "room_type": "MonsterRoom", "current_hp": run["current_hp"], "max_hp": 80, "floor": run["floor"], "act": run["act"],
+            "act_boss": "Hexaghost", "gold": run["gold"], "seed": run["seed"], "class": "IRONCLAD", "ascension_level": 0,
+            "deck": run["deck"], "relics": run["relics"], "potions": run["potions"], "map": run["map"],
+            "is_screen_up": screen_type != "NONE", "choice_list": choice_list or [], "screen_state": screen_state or {},
+        }
+        if combat_state is not None:
+            game_state["combat_state"] = combat_state
+        message = {"available_commands": commands or AVAILABLE_COMMANDS[screen_type], "ready_for_command": True,
+                   "in_game": True, "game_state": game_state}
+        states.append(json.loads(json.dumps(message)))
+
+    while len(states) < count:
+        # Combat: a few turns of card plays against 1-3 monsters
+        monsters = [make_monster(rng) for _ in range(rng.randint(1, 3))]
+        for monster in monsters:
+            monster.update(is_gone=False, current_hp=monster["max_hp"])
+        player_powers = []
+        for turn in range(rng.randint(2, 6)):
+            hand = [dict(card, is_playable=rng.random() < 0.8) for card in rng.sample(run["deck"], min(5, len(run["deck"])))]
+            for _ in range(rng.randint(1, 4)):
+                target = rng.choice(monsters)
+                target["current_hp"] = max(0, target["current_hp"] - rng.randint(0, 12))
+                target["is_gone"] = target["current_hp"] == 0
+                if rng.random() < 0.3:
+                    run["current_hp"] = max(1, run["current_hp"] - rng.randint(1, 8))
+                if rng.random() < 0.1:
+                    player_powers.append(make_power(rng))
+                combat_state = {
+                    "player": {"current_hp": run["current_hp"], "max_hp": 80, "block": rng.randint(0, 12), "energy": rng.randint(0, 3),
+                               "powers": player_powers, "orbs": []},
+                    "monsters": monsters, "hand": hand, "draw_pile": run["deck"][:5], "discard_pile": [], "exhaust_pile": [],
+                    "turn": turn + 1, "cards_discarded_this_turn": 0,
+                }
+                emit("NONE", combat_state=combat_state)
+                if hand:
+                    hand = hand[1:]
+            if all(monster["is_gone"] for monster in monsters):
+                break
+
+        # Rewards: gold and sometimes a potion or relic, then a card reward
+        run["gold"] += rng.randint(10, 20)
+        rewards = [{"type": "GOLD", "reward_type": "GOLD"}, {"type": "CARD", "reward_type": "CARD"}]
+        emit("COMBAT_REWARD", screen_state={"rewards": rewards}, choice_list=["gold", "card"])
+        if rng.random() < 0.2:
+            empty = [i for i, potion in enumerate(run["potions"]) if potion["id"] == "Potion Slot"]
+            if empty:
+                run["potions"][empty[0]] = make_potion(rng)
+        if rng.random() < 0.15:
+            name = rng.choice(relics_list)
+            run["relics"] = run["relics"] + [{"name": name, "id": name, "counter": -1}]
+        cards = [make_card(rng) for _ in range(3)]
+        emit("CARD_REWARD", screen_state={"cards": cards, "bowl_available": False, "skip_available": True},
+             choice_list=[card["name"].lower() for card in cards])
+        if rng.random() < 0.7:
+            run["deck"] = run["deck"] + [rng.choice(cards)]
+        emit("COMBAT_REWARD", screen_state={"rewards": []}, commands=["proceed", "key", "click", "wait", "state"])
+
+        # Map: pick the next node and climb a floor, a new map every 17 floors
+        current = rng.choice([node for node in run["map"] if node["children"]] or run["map"])
+        next_nodes = [dict(child, symbol=map_symbol(run["map"], child)) for child in current["children"]]
+        emit("MAP", screen_state={"current_node": {"x": current["x"], "y": current["y"], "symbol": current["symbol"]},
+                                  "next_nodes": next_nodes, "first_node_chosen": True, "boss_available": False},
+             choice_list=[f"x={node['x']}" for node in next_nodes])
+        run["floor"] += 1
+        if run["floor"] % 17 == 0:
+            run["act"] += 1
+            run["map"] = make_map(rng)
+
+    return states[:count]
@@ -0,0 +1,59 @@
+"""
+Encode time of get_screen_observation per screen type.
+
+Every state is encoded in place into one preallocated screen vector, the way the worker
+encodes its observations, and the mean time per state is reported for each screen type. Each
+state is encoded several times in a row, so the map index built on the first MAP screen of an
+act is reused the way it is during the act.
+
+Run from the repository root:
+    python -m benchmarks.screen_encoding --states "game_state_*.json"
+"""
+import argparse
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import observations.player_observations  # puts observations/ on sys.path for the screen module
+from observations.screen_observations import get_screen_observation, MAX_SCREEN_OBSERVATION_SIZE, SCREEN_HANDLERS
+from benchmarks.sample_states import benchmark_states
+
+
+def time_screen_types(game_states, repeats):
+    """
+    Mean encode time in seconds per screen type, each state encoded `repeats` times in a row.
+    """
+    by_type = defaultdict(list)
+    for game_state in game_states:
+        by_type[game_state.get("screen_type", "NONE")].append(game_state)
+
+    out = np.zeros(MAX_SCREEN_OBSERVATION_SIZE, dtype=np.float32)
+    timings = {}
+    for screen_type, states in sorted(by_type.items()):
+        start = time.perf_counter()
+        for game_state in states:
+            for _ in range(repeats):
+                get_screen_observation(game_state, out=out)
+        timings[screen_type] = (len(states), (time.perf_counter() - start) / (repeats * len(states)))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screen encoding per screen type.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states, synthetic states are used if nothing matches")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states")
+    parser.add_argument("--repeats", type=int, default=20, help="Consecutive encodes of every state")
+    args = parser.parse_args()
+
+    # The screen encoders read the game_state part of a CommunicationMod message
+    game_states = [state["game_state"] for state in benchmark_states(args.count, args.states) if "game_state" in state]
+
+    print(f"{'screen type':<16} {'states':>8} {'us/state':>10}  layout")
+    for screen_type, (count, seconds) in time_screen_types(game_states, args.repeats).items():
+        layout = "registered" if screen_type in SCREEN_HANDLERS else "type token only"
+        print(f"{screen_type:<16} {count:>8} {seconds * 1e6:>10.2f}  {layout}")
+
+
+if __name__ == "__main__":
+    main()
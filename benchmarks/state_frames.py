@@ -0,0 +1,108 @@
+"""
+Worker cost and message size per state: JSON states against the binary state frames of
+`middleman_process.py --binary`.
+
+Over the same states (recorded ones if any, synthetic otherwise) the per-state work of both
+ends is timed without the socket:
+
+- json: the middleman sends the raw JSON, the worker parses it, updates the env, computes the
+  action mask and encodes the observation (incrementally, as run_env does)
+- frame: the middleman parses, encodes and masks the state into a frame (timed as the
+  middleman's cost), the worker decodes it, updates the env, applies the previous action rules
+  to the mask and copies the observation
+
+Reported are the mean message size and microseconds per state on each side. The worker time
+is what stays on the step loop, the middleman's runs while the worker is busy with others.
+
+Run from the repository root:
+    python -m benchmarks.state_frames
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.observation_layout import empty_flat_observation
+from util.state_frames import FRAME_HEADER, StateFrameEncoder, decode_state_frame
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+
+def json_worker(texts):
+    env = SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=True)
+    observation = empty_flat_observation()
+    start = time.perf_counter()
+    for text in texts:
+        state = json.loads(text)
+        env.update_game_state(state)
+        env.get_invalid_action_mask(state)
+        env.encode_flat_observation(state, out=observation)
+    return (time.perf_counter() - start) / len(texts)
+
+
+def validate(texts):
+    """
+    The middleman's seconds per state without frames, the json.loads it checks states with.
+    """
+    start = time.perf_counter()
+    for text in texts:
+        json.loads(text)
+    return (time.perf_counter() - start) / len(texts)
+
+
+def encode_frames(texts):
+    """
+    Frames of the states and the middleman's seconds per state, parsing included.
+    """
+    encoder = StateFrameEncoder(SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=True))
+    start = time.perf_counter()
+    frames = [encoder.encode(json.loads(text), text) for text in texts]
+    return frames, (time.perf_counter() - start) / len(texts)
+
+
+def frame_worker(frames):
+    env = SlayTheSpireEnv({}, flat_observations=True)
+    observation = empty_flat_observation()
+    start = time.perf_counter()
+    for payload in frames:
+        frame = decode_state_frame(payload)
+        env.update_from_frame(frame)
+        env.get_frame_action_mask(frame)
+        frame.copy_observation(observation)
+    return (time.perf_counter() - start) / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON states and binary state frames per state.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states when nothing is recorded")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) if args.states else []
+    if not states:
+        states = synthetic_trajectory(args.count)
+    texts = [json.dumps(state) for state in states]
+
+    # Warm up both paths (card row cache, mask cache, numpy)
+    json_worker(texts[:100])
+    frame_worker(encode_frames(texts[:100])[0])
+
+    json_seconds = json_worker(texts)
+    validate_seconds = validate(texts)
+    frames, middleman_seconds = encode_frames(texts)
+    frame_seconds = frame_worker(frames)
+
+    json_sizes = np.array([len(text.encode('utf-8')) for text in texts])
+    frame_sizes = np.array([len(payload) for payload in frames])
+    print(f"{len(states)} states")
+    print(f"{'':<8}{'mean KB':>10}{'max KB':>10}{'worker us':>12}{'middleman us':>15}")
+    print(f"{'json':<8}{json_sizes.mean() / 1024:>10.1f}{json_sizes.max() / 1024:>10.1f}{json_seconds * 1e6:>12.0f}{validate_seconds * 1e6:>15.0f}")
+    print(f"{'frame':<8}{frame_sizes.mean() / 1024:>10.1f}{frame_sizes.max() / 1024:>10.1f}{frame_seconds * 1e6:>12.0f}{middleman_seconds * 1e6:>15.0f}")
+    raw_attached = np.array([FRAME_HEADER.unpack_from(payload)[-1] > 0 for payload in frames])
+    print(f"{raw_attached.mean() * 100:.1f}% of the frames carry the raw state (tracked screens)")
+    print(f"worker time per state {json_seconds / frame_seconds:.1f}x lower, messages {json_sizes.mean() / frame_sizes.mean():.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
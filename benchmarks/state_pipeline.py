@@ -0,0 +1,219 @@
+"""
+Micro-benchmarks of the per-step CPU path over recorded CommunicationMod states.
+
+Every state is fed through each get_*_observation function, flatten_observation,
+get_invalid_action_mask, update_game_state and calculate_reward in recorded order, and the
+time of every call is broken down by screen category (combat, map, shop, card reward, grid,
+other, menu). Results are written as JSON so runs on different commits can be compared:
+
+    python -m benchmarks.state_pipeline --states "game_state_*.json" --output before.json
+    (check out another commit)
+    python -m benchmarks.state_pipeline --states "game_state_*.json" --output after.json --compare before.json
+
+States are the files middleman_process.save_game_state dumps (`game_state_*.json`, or .jsonl
+with one state per line). When nothing matches, a synthetic run plus synthetic shop and grid
+screens are used instead.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.player_observations import get_player_observation
+from observations.hand_observations import get_hand_observation
+from observations.monster_observations import get_monster_observation
+from observations.map_observations import get_map_observation
+from observations.potion_observations import get_potion_observation
+from observations.relic_observations import get_relic_observation
+from observations.extra_info_observations import get_extra_info_observation
+from observations.deck_observations import get_deck_observation
+from observations.screen_observations import get_screen_observation
+from benchmarks.sample_states import load_recorded_states, synthetic_states, synthetic_trajectory
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCREEN_CATEGORIES = {
+    "MAP": "map",
+    "SHOP_SCREEN": "shop",
+    "CARD_REWARD": "card_reward",
+    "GRID": "grid",
+}
+
+# Observation functions, called with (game_state, combat_state). Deck and screen get the
+# game_state they are written for, flatten_observation is timed separately as it is called
+OBSERVATION_FUNCTIONS = {
+    "get_player_observation": lambda game_state, combat_state: get_player_observation(game_state),
+    "get_hand_observation": lambda game_state, combat_state: get_hand_observation(combat_state),
+    "get_monster_observation": lambda game_state, combat_state: get_monster_observation(game_state),
+    "get_map_observation": lambda game_state, combat_state: get_map_observation(game_state),
+    "get_potion_observation": lambda game_state, combat_state: get_potion_observation(game_state),
+    "get_relic_observation": lambda game_state, combat_state: get_relic_observation(game_state),
+    "get_extra_info_observation": lambda game_state, combat_state: get_extra_info_observation(game_state),
+    "get_deck_observation": lambda game_state, combat_state: get_deck_observation(game_state),
+    "get_screen_observation": lambda game_state, combat_state: get_screen_observation(game_state),
+}
+
+
+def screen_category(state):
+    game_state = state.get("game_state")
+    if game_state is None:
+        return "menu"
+    screen_type = game_state.get("screen_type", "NONE")
+    if screen_type == "NONE" and game_state.get("combat_state"):
+        return "combat"
+    return SCREEN_CATEGORIES.get(screen_type, "other")
+
+
+def load_states(pattern, count, seed):
+    states = load_recorded_states(pattern) if pattern else []
+    if states:
+        return states, f"recorded ({pattern})"
+    # The synthetic run never visits shops or grids, independent screens cover them
+    return synthetic_trajectory(count, seed=seed) + synthetic_states(count // 2, seed=seed), "synthetic"
+
+
+def time_call(samples, category, call, repeats):
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        call()
+        samples[category].append(time.perf_counter_ns() - start)
+
+
+def run_pipeline(states, repeats, seed):
+    """
+    Time every stage on every state, returns {stage: {category: [ns per call]}}.
+    """
+    rng = random.Random(seed)
+    env = SlayTheSpireEnv({})
+    samples = defaultdict(lambda: defaultdict(list))
+
+    # calculate_reward printed on most transitions before the reward terms, so runs on older
+    # commits stay comparable the output is discarded
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for state in states:
+            category = screen_category(state)
+            game_state = state.get("game_state")
+
+            if game_state is not None:
+                combat_state = game_state.get("combat_state", None)
+                for name, function in OBSERVATION_FUNCTIONS.items():
+                    time_call(samples[name], category, lambda: function(game_state, combat_state), repeats)
+
+            time_call(samples["flatten_observation"], category, lambda: env.flatten_observation(state), repeats)
+
+            # Same bookkeeping as a step: the action taken before this state arrived
+            env.previous_action = env.curr_action
+            env.curr_action = rng.randrange(len(env.actions))
+            time_call(samples["get_invalid_action_mask"], category, lambda: env.get_invalid_action_mask(state), repeats)
+
+            previous = env.state, env.snapshot
+            for _ in range(repeats):
+                env.state, env.snapshot = previous
+                start = time.perf_counter_ns()
+                env.update_game_state(state)
+                samples["update_game_state"][category].append(time.perf_counter_ns() - start)
+
+            time_call(samples["calculate_reward"], category, env.calculate_reward, repeats)
+
+    return samples
+
+
+def summarize(samples):
+    """
+    {stage: {category: {count, mean_us, p50_us, p95_us}}}, with an "all" category per stage.
+    """
+    results = {}
+    for stage, by_category in samples.items():
+        by_category = dict(by_category)
+        by_category["all"] = [sample for values in by_category.values() for sample in values]
+        results[stage] = {}
+        for category, values in sorted(by_category.items()):
+            values = np.array(values, dtype=np.float64) / 1e3
+            results[stage][category] = {
+                "count": int(len(values)),
+                "mean_us": float(values.mean()),
+                "p50_us": float(np.percentile(values, 50)),
+                "p95_us": float(np.percentile(values, 95)),
+            }
+    return results
+
+
+def environment_info(source, state_count, repeats):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "states": source,
+        "state_count": state_count,
+        "repeats": repeats,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the mean time ratio against a baseline report, return the stages over `threshold`.
+    """
+    regressions = []
+    print(f"\n{'stage':<28} {'category':<12} {'baseline us':>12} {'current us':>12} {'ratio':>7}")
+    for stage, by_category in results.items():
+        for category, current in by_category.items():
+            previous = baseline.get(stage, {}).get(category)
+            if previous is None or previous["mean_us"] == 0:
+                continue
+            ratio = current["mean_us"] / previous["mean_us"]
+            flag = ""
+            if threshold is not None and ratio > threshold:
+                regressions.append((stage, category, ratio))
+                flag = "  regression"
+            print(f"{stage:<28} {category:<12} {previous['mean_us']:>12.2f} {current['mean_us']:>12.2f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-step state pipeline by screen category.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states (.json or .jsonl)")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states when nothing is recorded")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed calls per state and stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this file")
+    parser.add_argument("--compare", default=None, help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=None, help="Exit non-zero when a mean is this many times slower than --compare")
+    args = parser.parse_args()
+
+    states, source = load_states(args.states, args.count, args.seed)
+    results = summarize(run_pipeline(states, args.repeats, args.seed))
+    report = {"environment": environment_info(source, len(states), args.repeats), "results": results}
+
+    print(f"{len(states)} {source} states, {args.repeats} calls per state and stage")
+    print(f"{'stage':<28} {'category':<12} {'calls':>7} {'mean us':>9} {'p50 us':>9} {'p95 us':>9}")
+    for stage, by_category in results.items():
+        for category, stats in by_category.items():
+            print(f"{stage:<28} {category:<12} {stats['count']:>7} {stats['mean_us']:>9.2f} {stats['p50_us']:>9.2f} {stats['p95_us']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Step latency with the old unconditional prints against leveled logging.
+
+The step loop of run_env (update_game_state, encode_observation, get_invalid_action_mask, step)
+is replayed over game states three ways:
+
+- print: every step prints "Game State Received" and one line per non-zero reward term, as
+  run_env and calculate_reward used to
+- debug: configure_logging at DEBUG, the same messages go through the background writer
+- default: configure_logging at the default level, as the workers run
+
+Output goes to os.devnull (or --output), a terminal is slower still. Exits non-zero if the
+default level writes anything during the steps.
+
+Run from the repository root:
+    python -m benchmarks.step_logging
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+from slay_the_spire_env import SlayTheSpireEnv
+from util.log import DEFAULT_LOG_LEVEL, configure_logging, get_logger, stop_logging
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+# The per-step message of run_env
+logger = get_logger("run_env")
+
+
+def run_steps(env, states, seed, announce):
+    rng = random.Random(seed)
+    env.reset()
+    elapsed = 0
+    for state in states:
+        start = time.perf_counter()
+        announce(env, None)
+        env.update_game_state(state)
+        env.encode_observation(state, out=env.step_observation)
+        env.get_invalid_action_mask(state)
+        _, _, _, info = env.step(rng.randrange(len(env.actions)))
+        announce(env, info)
+        elapsed += time.perf_counter() - start
+    return elapsed / len(states)
+
+
+def print_announce(env, info):
+    if info is None:
+        print("Environment 0: Game State Received")
+        return
+    for term, value in info["reward_terms"].items():
+        if value:
+            print(f"{term} {value} {env.actions[env.previous_action]}")
+
+
+def log_announce(env, info):
+    if info is None:
+        logger.debug("Environment %d: Game State Received", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare step latency with prints and with leveled logging.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states")
+    parser.add_argument("--count", type=int, default=2000, help="Number of synthetic states when nothing is recorded")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.devnull, help="Where prints and log records are written")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) if args.states else []
+    if not states:
+        states = synthetic_trajectory(args.count, seed=args.seed)
+    env = SlayTheSpireEnv({})
+    run_steps(env, states, args.seed, log_announce)  # warm up the caches
+
+    with open(args.output, "w") as output:
+        with contextlib.redirect_stdout(output):
+            printed = run_steps(env, states, args.seed, print_announce)
+
+        configure_logging(level="DEBUG", stream=output, rate_limit=None)
+        debug = run_steps(env, states, args.seed, log_announce)
+        stop_logging()
+
+    written = io.StringIO()
+    configure_logging(stream=written)
+    default = run_steps(env, states, args.seed, log_announce)
+    stop_logging()
+
+    print(f"{len(states)} states, us per step")
+    print(f"print:            {printed * 1e6:>8.1f}")
+    print(f"logging DEBUG:    {debug * 1e6:>8.1f}")
+    print(f"logging {DEFAULT_LOG_LEVEL + ':':<9} {default * 1e6:>8.1f} ({len(written.getvalue().splitlines())} lines written)")
+    sys.exit(1 if written.getvalue() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Overhead of the StepTimings instrumentation of run_env.
+
+The step loop of run_env (update_game_state, encode_observation, action mask, policy forward
+pass, take_action, evaluate_actions and predict_values, rollout buffer add) is replayed over
+game states with the same laps run_env records, without the socket and the database. Reported
+are the per-phase histograms, the cost of the laps of one step measured on their own and that
+cost as a share of the mean step time. Exits non-zero when it is over --budget percent.
+
+Run from the repository root:
+    python -m benchmarks.step_timing
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch as th
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
+
+from slay_the_spire_env import SlayTheSpireEnv
+from model.custom_rollout_buffer import CustomRolloutBuffer
+from util.step_timing import StepTimings
+from benchmarks.sample_states import load_recorded_states, synthetic_trajectory
+
+# Laps run_env records in a step without a finished rollout or episode
+STEP_PHASES = ["receive", "update_game_state", "encode_observation", "action_mask", "policy", "send",
+               "process_game_state", "take_action", "evaluate_actions", "buffer_add"]
+
+
+def run_steps(env, model, states, timings):
+    rollout_buffer = CustomRolloutBuffer(len(states), env.observation_space, env.action_space, model.device, gamma=model.gamma, gae_lambda=model.gae_lambda)
+    env.reset()
+    for game_state in states:
+        timings.start()
+        env.update_game_state(game_state)
+        timings.lap("update_game_state")
+        obs_slot = rollout_buffer.observation_slot()
+        env.encode_observation(game_state, out={key: view[0] for key, view in obs_slot.items()})
+        obs_tensor = obs_as_tensor(obs_slot, model.device)
+        timings.lap("encode_observation")
+        action_mask = env.get_invalid_action_mask(game_state)
+        timings.lap("action_mask")
+        with th.no_grad():
+            action_tensor = model.policy.get_distribution(obs_tensor, action_masks=action_mask[np.newaxis]).get_actions()
+        action = int(action_tensor)
+        timings.lap("policy")
+        reward, done, _ = env.take_action(action)
+        timings.lap("take_action")
+        values, log_prob, _ = model.policy.evaluate_actions(obs_tensor, action_tensor)
+        values = model.policy.predict_values(obs_tensor)
+        timings.lap("evaluate_actions")
+        rollout_buffer.add(None, action_tensor, reward, done, values, log_prob)
+        timings.lap("buffer_add")
+        timings.end_step()
+
+
+def lap_cost(repeats):
+    """
+    Seconds the laps of one step cost on their own.
+    """
+    timings = StepTimings(flush_interval=float("inf"))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        timings.start()
+        for phase in STEP_PHASES:
+            timings.lap(phase)
+        timings.end_step()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the overhead of the run_env step timings.")
+    parser.add_argument("--states", default="game_state_*.json", help="Glob of recorded states")
+    parser.add_argument("--count", type=int, default=1000, help="Number of synthetic states when nothing is recorded")
+    parser.add_argument("--budget", type=float, default=1.0, help="Largest acceptable overhead in percent of the step time")
+    parser.add_argument("--output", help="File the timings are flushed to")
+    args = parser.parse_args()
+
+    states = load_recorded_states(args.states) if args.states else []
+    if not states:
+        states = synthetic_trajectory(args.count)
+    env = SlayTheSpireEnv({}, incremental_encoding=True)
+    model = MaskablePPO("MultiInputPolicy", env, verbose=0)
+    run_steps(env, model, states[:100], StepTimings(flush_interval=float("inf")))  # warm up
+
+    timings = StepTimings(args.output, flush_interval=float("inf"))
+    run_steps(env, model, states, timings)
+    report = timings.report()
+    cost = lap_cost(10000)
+    overhead = cost / (report["step"]["mean_ms"] / 1e3) * 100
+
+    print(f"{len(states)} states, ms per phase")
+    print(f"{'phase':<20}{'mean':>8}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for phase, stats in report.items():
+        print(f"{phase:<20}{stats['mean_ms']:>8.3f}{stats['p50_ms']:>8.3f}{stats['p95_ms']:>8.3f}{stats['p99_ms']:>8.3f}")
+    print(f"instrumentation: {cost * 1e6:.1f} us per step ({len(STEP_PHASES)} laps), {overhead:.2f}% of the mean step")
+    if args.output:
+        timings.flush()
+    sys.exit(1 if overhead > args.budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark the precompiled vocabularies against the keras Tokenizer path they replace.
+
+Run from the repository root:
+    python -m benchmarks.tokenizer_benchmark
+"""
+import time
+
+from util import tokenizers
+
+# (source texts, vocabulary) for every vocabulary used by the observation modules
+VOCABULARIES = {
+    "card": (tokenizers.card_names, tokenizers.card_tokenizer),
+    "card_type": (tokenizers.card_types, tokenizers.card_type_tokenizer),
+    "card_rarity": (tokenizers.card_rarities, tokenizers.card_rarity_tokenizer),
+    "intent": (tokenizers.intents, tokenizers.intent_tokenizer),
+    "monster_id": (tokenizers.monster_ids, tokenizers.monster_id_tokenizer),
+    "screen_type": (tokenizers.screen_types, tokenizers.screen_type_tokenizer),
+    "power": (tokenizers.powers, tokenizers.power_tokenizer),
+    "map_symbol": (tokenizers.map_symbols, tokenizers.map_symbol_tokenizer),
+    "relic": (tokenizers.relics_list, tokenizers.relic_tokenizer),
+    "potion": (tokenizers.potion_types, tokenizers.potion_tokenizer),
+    "rest": (tokenizers.rest_options, tokenizers.rest_tokenizer),
+    "event_id": (tokenizers.event_ids, tokenizers.event_id_tokenizer),
+    "reward_type": (tokenizers.reward_types, tokenizers.reward_type_tokenizer),
+}
+
+# Texts the game sends that are not in the source lists (ids, upgraded names, unknowns)
+EXTRA_TEXTS = ["Strike_R", "Defend_G", "Bash+1", "Unknown Thing", "", "?"]
+
+
+def load_keras_tokenizer_class():
+    try:
+        from keras.preprocessing.text import Tokenizer
+    except ImportError:
+        try:
+            from keras_preprocessing.text import Tokenizer
+        except ImportError:
+            return None
+    return Tokenizer
+
+
+def keras_encode(tokenizer, text):
+    """The lookup every observation module used to perform."""
+    sequences = tokenizer.texts_to_sequences([text])
+    return sequences[0][0] if sequences and sequences[0] else 0
+
+
+def time_per_call(function, texts, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - start) / (repeats * len(texts))
+
+
+def main(repeats=200):
+    Tokenizer = load_keras_tokenizer_class()
+    if Tokenizer is None:
+        print("keras is not installed, only timing the precompiled vocabularies")
+
+    print(f"{'vocabulary':<12} {'texts':>6} {'keras us':>10} {'vocab us':>10} {'speedup':>8} {'match':>6}")
+    for name, (texts, vocabulary) in VOCABULARIES.items():
+        sample = list(texts) + EXTRA_TEXTS
+        vocab_time = time_per_call(vocabulary.encode, sample, repeats)
+
+        if Tokenizer is None:
+            print(f"{name:<12} {len(sample):>6} {'-':>10} {vocab_time * 1e6:>10.3f} {'-':>8} {'-':>6}")
+            continue
+
+        keras_tokenizer = Tokenizer()
+        keras_tokenizer.fit_on_texts(texts)
+        keras_time = time_per_call(lambda text: keras_encode(keras_tokenizer, text), sample, max(1, repeats // 10))
+        match = all(keras_encode(keras_tokenizer, text) == vocabulary.encode(text) for text in sample)
+        print(f"{name:<12} {len(sample):>6} {keras_time * 1e6:>10.3f} {vocab_time * 1e6:>10.3f} "
+              f"{keras_time / vocab_time:>7.1f}x {str(match):>6}")
+
+    # Bulk API over a deck sized batch of card names
+    deck = (["Strike", "Defend"] * 20)[:40]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        tokenizers.card_tokenizer.encode_many(deck)
+    print(f"encode_many (40 cards): {(time.perf_counter() - start) / repeats * 1e6:.2f} us per deck")
+
+
+if __name__ == "__main__":
+    main()
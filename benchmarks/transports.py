@@ -0,0 +1,81 @@
+"""
+Round trip latency of the middleman <-> worker transports (util/transports.py).
+
+A stand-in middleman in its own process listens on each transport in turn and answers every
+command with a state of --sizes bytes, the worker sends a command and waits for the state,
+as a worker does every step. The game and the work on both ends are left out, so what is
+measured is the cost of the transport: microseconds per round trip (p50, p99, mean) per state
+size. 8 KB is about a binary state frame (middleman_process.py --binary), 32 KB a late game
+JSON state.
+
+Run from the repository root:
+    python -m benchmarks.transports
+"""
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from util import transports
+from util.framing import MESSAGE_STATE, MESSAGE_COMMAND, send_message, receive_message
+
+context = multiprocessing.get_context("spawn")
+
+
+def echo_middleman(transport, port, size, ready):
+    """
+    Answer every command with a MESSAGE_STATE of `size` bytes until the worker disconnects.
+    """
+    server = transports.listen(transport, port, "localhost")
+    ready.set()
+    connection, _ = server.accept()
+    payload = b"x" * size
+    try:
+        while True:
+            _, sequence, _ = receive_message(connection)
+            send_message(connection, MESSAGE_STATE, sequence, payload)
+    except ConnectionError:
+        pass
+    connection.close()
+    server.close()
+
+
+def round_trips(transport, port, size, count):
+    """
+    Seconds of each of `count` command -> state round trips, after a warm up.
+    """
+    ready = context.Event()
+    middleman = context.Process(target=echo_middleman, args=(transport, port, size, ready))
+    middleman.start()
+    ready.wait()
+    connection = transports.connect(transport, port, timeout=10)
+    warm_up = count // 10
+    times = np.empty(warm_up + count)
+    for index in range(warm_up + count):
+        start = time.perf_counter()
+        send_message(connection, MESSAGE_COMMAND, index, b"END")
+        receive_message(connection)
+        times[index] = time.perf_counter() - start
+    connection.close()
+    middleman.join()
+    return times[warm_up:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the round trip latency of each middleman transport.")
+    parser.add_argument("--transports", nargs="+", choices=transports.TRANSPORTS, default=list(transports.TRANSPORTS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[64, 8 * 1024, 32 * 1024], help="State sizes in bytes")
+    parser.add_argument("--count", type=int, default=5000, help="Round trips per transport and size")
+    parser.add_argument("--port", type=int, default=29999, help="Port the stand-in middleman uses")
+    args = parser.parse_args()
+
+    print(f"{'transport':<10}{'bytes':>8}{'p50 us':>10}{'p99 us':>10}{'mean us':>10}")
+    for size in args.sizes:
+        for transport in args.transports:
+            times = round_trips(transport, args.port, size, args.count) * 1e6
+            print(f"{transport:<10}{size:>8}{np.percentile(times, 50):>10.1f}{np.percentile(times, 99):>10.1f}{times.mean():>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
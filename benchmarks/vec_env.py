@@ -0,0 +1,104 @@
+"""
+SlayTheSpireVecEnv driven by MaskablePPO.learn against in-process stand-in middlemen.
+
+Each stand-in serves a synthetic run over its own port, answering every command with the next
+state after --latency ms (the game's think time). The benchmark reports the env steps per second
+MaskablePPO.learn reaches over N games from one process, how long picking N actions takes as N
+batch-1 forward passes (one per worker, as run_env does) against one batched pass, and the model
+parameter memory of N worker copies against the single shared model.
+
+Run from the repository root:
+    python -m benchmarks.vec_env --games 4 --steps 1024
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+
+import torch as th
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
+
+from environment.vec_env import SlayTheSpireVecEnv
+from util.framing import MESSAGE_STATE, send_message, receive_message
+from benchmarks.sample_states import synthetic_trajectory
+
+
+def serve_states(server, states, latency):
+    connection, _ = server.accept()
+    with connection:
+        index = 0
+        while True:
+            time.sleep(latency)
+            index += 1
+            send_message(connection, MESSAGE_STATE, index, json.dumps(states[index % len(states)]).encode('utf-8'))
+            try:
+                receive_message(connection)
+            except ConnectionError:
+                return
+
+
+def start_middlemen(count, states, latency):
+    ports = []
+    for _ in range(count):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("localhost", 0))
+        server.listen(1)
+        ports.append(server.getsockname()[1])
+        threading.Thread(target=serve_states, args=(server, states, latency), daemon=True).start()
+    return ports
+
+
+def time_inference(policy, observations, masks, repeats):
+    """
+    Seconds to pick one action per game with batch-1 passes and with one batched pass.
+    """
+    count = masks.shape[0]
+    rows = [obs_as_tensor({key: array[index:index + 1] for key, array in observations.items()}, policy.device) for index in range(count)]
+    batch = obs_as_tensor(observations, policy.device)
+    with th.no_grad():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for index, row in enumerate(rows):
+                policy.get_distribution(row, action_masks=masks[index:index + 1]).get_actions()
+        single = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            policy.get_distribution(batch, action_masks=masks).get_actions()
+        batched = (time.perf_counter() - start) / repeats
+    return single, batched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SlayTheSpireVecEnv with MaskablePPO.learn.")
+    parser.add_argument("--games", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=1024, help="Env steps to learn from (over all games)")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated game response time in ms")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    states = synthetic_trajectory(500)
+    ports = start_middlemen(args.games, states, args.latency / 1000)
+    env = SlayTheSpireVecEnv(ports, tracking=False)
+    n_steps = max(args.steps // args.games, 8)
+    model = MaskablePPO("MultiInputPolicy", env, n_steps=n_steps, batch_size=n_steps, n_epochs=1, verbose=0)
+
+    start = time.perf_counter()
+    model.learn(total_timesteps=n_steps * args.games)
+    elapsed = time.perf_counter() - start
+
+    observations = env.reset()
+    single, batched = time_inference(model.policy, observations, env.action_masks(), args.repeats)
+    parameter_bytes = sum(parameter.numel() * parameter.element_size() for parameter in model.policy.parameters())
+    env.close()
+
+    print(f"{args.games} games, {args.latency:.1f} ms simulated game latency")
+    print(f"MaskablePPO.learn: {n_steps * args.games} env steps in {elapsed:.2f}s ({n_steps * args.games / elapsed:.0f} steps/s, rollout and update)")
+    print(f"picking {args.games} actions: {single * 1e3:.2f} ms as batch-1 passes, {batched * 1e3:.2f} ms batched ({single / batched:.1f}x)")
+    print(f"policy parameters: {args.games} worker copies {args.games * parameter_bytes / 2**20:.1f} MiB, shared {parameter_bytes / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
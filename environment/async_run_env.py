@@ -0,0 +1,357 @@
+import asyncio
+import os
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch as th
+from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
+from slay_the_spire_env import SlayTheSpireEnv
+from model.custom_rollout_buffer import CustomRolloutBuffer
+from util.communication import AsyncGameConnection, handle_end_of_episode_async
+from util.lazy_import import lazy_import
+from util.card_cache import card_row_cache_report
+from util.action_masks import single_valid_action
+from util.state_frames import StateFrame
+from util.step_timing import check_first_action
+from util.log import configure_logging, get_logger
+
+plotting = lazy_import("util.plotting")
+data_processor = lazy_import("util.data_processor")
+game_over_tracking = lazy_import("util.game_over_tracking")
+card_tracking = lazy_import("util.card_tracking")
+
+logger = get_logger("async_run_env")
+
+# Seconds a batch waits for the other games to ask for an action after its first request
+DEFAULT_BATCH_WINDOW = 0.002
+
+# Policy forward passes of a batched action request: picking the action and evaluate_actions
+FORWARD_PASSES_PER_REQUEST = 2
+
+
+class InferenceBatcher:
+    """
+    Collects the action requests of the games of one worker and answers them with one forward
+    pass. A batch runs as soon as every game still connected is waiting for an action, or
+    `window` seconds after its first request so a game that is still animating does not hold
+    up the others.
+    """
+
+    def __init__(self, model, games, window=DEFAULT_BATCH_WINDOW):
+        self.model = model
+        self.games = games
+        self.window = window
+        self.pending = []
+        self.first_request = asyncio.Event()
+        self.all_waiting = asyncio.Event()
+        self.batches = 0
+        self.requests = 0
+
+    async def request(self, observation, action_mask):
+        """
+        (action, value, log_prob) tensors for one game, shaped as a batch of one like the
+        policy outputs run_env adds to its rollout buffer.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((observation, action_mask, future))
+        self.first_request.set()
+        if len(self.pending) >= self.games:
+            self.all_waiting.set()
+        return await future
+
+    def leave(self):
+        # A disconnected game no longer counts towards a full batch
+        self.games -= 1
+        if self.pending and len(self.pending) >= self.games:
+            self.all_waiting.set()
+
+    async def run(self):
+        while True:
+            await self.first_request.wait()
+            if len(self.pending) < self.games:
+                try:
+                    await asyncio.wait_for(self.all_waiting.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self.pending = self.pending, []
+            self.first_request.clear()
+            self.all_waiting.clear()
+            try:
+                results = self.infer(batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def infer(self, batch):
+        policy = self.model.policy
+        observations = [observation for observation, _, _ in batch]
+        if isinstance(observations[0], dict):
+            stacked = {key: np.concatenate([observation[key] for observation in observations]) for key in observations[0]}
+        else:
+            stacked = np.concatenate(observations)
+        action_masks = np.stack([action_mask for _, action_mask, _ in batch])
+
+        with th.no_grad():
+            obs_tensor = obs_as_tensor(stacked, policy.device)
+            actions = policy.get_distribution(obs_tensor, action_masks=action_masks).get_actions()
+            # Unmasked log probabilities, as run_env stores them
+            values, log_probs, _ = policy.evaluate_actions(obs_tensor, actions)
+
+        self.batches += 1
+        self.requests += len(batch)
+        return [(actions[index:index + 1], values[index:index + 1], log_probs[index:index + 1]) for index in range(len(batch))]
+
+    def report(self):
+        return f"Inference batches: {self.batches}, mean size {self.requests / max(self.batches, 1):.2f}"
+
+
+class MultiplexedGame:
+    """
+    What one game of a multiplexed worker keeps to itself: its env, rollout buffer, game_id
+    and episode statistics.
+    """
+
+    def __init__(self, env_id, port, flat_observations):
+        self.env_id = env_id
+        self.port = port
+        self.env = SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=flat_observations)
+        self.rollout_buffer = None
+        # Value of the state after the last transition of a full buffer, shipped at the next decision
+        self.last_values = None
+        self.game_id = None
+        self.episode_rewards = []
+        self.episode_lengths = []
+        self.reward_queue = deque(maxlen=10)
+        self.highest_reward = float('-inf')
+        self.episode = 0
+
+
+class GameMultiplexer:
+    """
+    run_environment for many games in one process. Every game has its own asyncio connection
+    to its middleman and is handled as soon as its next state arrives, the action requests of
+    games that are ready at about the same time share one forward pass (InferenceBatcher). A
+    worker no longer sits idle while its single game animates.
+
+    The database tracking and plots block, they run on a tracking thread while the event loop
+    serves the other games (the game they belong to awaits them, so its calls keep their
+    order). With tracking=False they are skipped. `transport` is "tcp" or "unix", the shared
+    memory transport has no asyncio streams.
+    """
+
+    def __init__(self, env_ids, ports, experience_queue, n_steps=2048, flat_observations=False,
+                 batch_window=DEFAULT_BATCH_WINDOW, tracking=True, host="localhost", transport="tcp"):
+        self.experience_queue = experience_queue
+        self.n_steps = n_steps
+        self.flat_observations = flat_observations
+        self.batch_window = batch_window
+        self.tracking = tracking
+        self.host = host
+        self.transport = transport
+        self.games = [MultiplexedGame(env_id, port, flat_observations) for env_id, port in zip(env_ids, ports)]
+
+        self.device = th.device("cuda" if th.cuda.is_available() else "cpu")
+        self.model = MaskablePPO("MlpPolicy" if flat_observations else "MultiInputPolicy", self.games[0].env, ent_coef=0.03, gamma=0.97, learning_rate=0.0003, clip_range=0.3, verbose=1, device=self.device)
+        for game in self.games:
+            game.rollout_buffer = CustomRolloutBuffer(
+                buffer_size=n_steps,
+                observation_space=game.env.observation_space,
+                action_space=game.env.action_space,
+                device=self.model.device,
+                gamma=self.model.gamma,
+                gae_lambda=self.model.gae_lambda,
+                n_envs=1
+            )
+
+        self.reload_interval = 100
+        self.reload_counter = 0
+        self.steps = 0
+        self.batcher = None
+        # One thread, so the tracking calls of all games run in order and SQLAlchemy and pyplot
+        # are only ever used from it
+        self.tracking_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracking")
+        self.first_action_sent = False
+        self.start_time = time.perf_counter()
+
+    async def run(self):
+        self.batcher = InferenceBatcher(self.model, len(self.games), self.batch_window)
+        batch_task = asyncio.create_task(self.batcher.run())
+        try:
+            await asyncio.gather(*(self.play(game) for game in self.games))
+        finally:
+            batch_task.cancel()
+            self.tracking_executor.shutdown(wait=True)
+
+    async def track(self, call):
+        """
+        Run a blocking tracking or plotting call on the tracking thread. The lazily imported
+        modules are first touched inside `call`, so their imports happen there too.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.tracking_executor, call)
+
+    async def play(self, game):
+        connection = await AsyncGameConnection.connect(game.port, self.host, self.transport)
+        try:
+            first_state = None
+            while await self.play_episode(game, connection, first_state):
+                # The first state of the next episode, received going through the game over screens
+                first_state = await handle_end_of_episode_async(connection)
+                if first_state is None:
+                    break
+        finally:
+            self.batcher.leave()
+            connection.close()
+
+    async def play_episode(self, game, connection, first_state=None):
+        """
+        One episode of a game, the loop body of run_environment, starting from `first_state`
+        when it was already received. False once the game can't go on.
+        """
+        env = game.env
+        rollout_buffer = game.rollout_buffer
+        done = False
+        total_reward = 0
+        reward_term_totals = defaultdict(float)
+        episode_length = 0
+        forced_steps = 0
+        carried_reward = 0
+        env.reset()
+
+        if self.tracking:
+            game.game_id = await self.track(lambda: data_processor.get_next_game_id())
+            if game.game_id is None:
+                logger.error("Environment %d: Error fetching the next game ID. Exiting.", game.env_id)
+                return False
+
+        while not done:
+            if first_state is not None:
+                game_state, first_state = first_state, None
+            else:
+                try:
+                    game_state = await connection.receive_state()
+                except ConnectionError as e:
+                    logger.error("Connection error in environment %d: %s", game.env_id, e)
+                    return False
+            logger.debug("Environment %d: Game State Received", game.env_id)
+
+            # A middleman started with --binary already encoded and masked the state
+            frame = None
+            if isinstance(game_state, StateFrame):
+                frame = game_state
+                game_state = frame.state
+                env.update_from_frame(frame)
+                action_mask = env.get_frame_action_mask(frame)
+            else:
+                env.update_game_state(game_state)
+                action_mask = env.get_invalid_action_mask(game_state)
+            forced_action = single_valid_action(action_mask)
+
+            if forced_action is None:
+                if len(rollout_buffer) >= self.n_steps:
+                    # Shipped only now, so forced steps after its last transition still added their
+                    # reward and the end of the episode to it (see run_env)
+                    rollout_buffer.compute_returns_and_advantage(last_values=game.last_values, dones=rollout_buffer.dones[rollout_buffer.pos - 1])
+                    self.experience_queue.put(rollout_buffer)
+                    rollout_buffer.reset()
+                    self.reload_model()
+
+                # Encoded straight into this game's rollout buffer slot, the batcher stacks the slots
+                obs_slot = rollout_buffer.observation_slot()
+                if frame is not None:
+                    frame.copy_observation(obs_slot[0] if self.flat_observations else {key: view[0] for key, view in obs_slot.items()})
+                elif self.flat_observations:
+                    env.encode_flat_observation(game_state, out=obs_slot[0])
+                else:
+                    env.encode_observation(game_state, out={key: view[0] for key, view in obs_slot.items()})
+                action_tensor, values, log_prob = await self.batcher.request(obs_slot, action_mask)
+                action = int(action_tensor)
+            else:
+                # Nothing to decide, answered without the batcher and not stored (see run_env)
+                action = forced_action
+                forced_steps += 1
+            chosen_command = env.actions[action]
+            await connection.send_command(chosen_command)
+            if not self.first_action_sent:
+                self.first_action_sent = True
+                check_first_action(f"Environments {[g.env_id for g in self.games]}", time.perf_counter() - self.start_time)
+
+            if self.tracking:
+                await self.track(lambda: data_processor.process_game_state(game_state, chosen_command, game.game_id))
+
+            reward, done, info = env.take_action(action)
+            total_reward += reward
+            for term, value in info["reward_terms"].items():
+                reward_term_totals[term] += value
+            episode_length += 1
+
+            self.steps += 1
+
+            if forced_action is not None:
+                # Only a transition of this episode takes the reward, before the episode's first
+                # decision it is carried (see run_env)
+                last = rollout_buffer.pos - 1
+                if last >= 0 and not rollout_buffer.dones[last]:
+                    rollout_buffer.rewards[last] += reward
+                    rollout_buffer.dones[last] = done
+                else:
+                    carried_reward += reward
+                    if done:
+                        logger.debug("Environment %d: Episode ended before its first decision, its reward of %.2f is not stored", game.env_id, carried_reward)
+            else:
+                rollout_buffer.add(None, action_tensor, reward + carried_reward, done, values, log_prob)
+                carried_reward = 0
+                # values were predicted for the current state, run_env predicts them again
+                game.last_values = values
+
+            if done and self.tracking:
+                screen_state = game_state['game_state'].get('screen_state', {})
+                victory = screen_state.get('victory', False)
+                floor_reached = game_state['game_state'].get('floor', 0)
+
+                def track_game_over():
+                    game_over_tracking.update_game_stats_on_game_over(game_state, game.game_id, total_reward)
+                    card_tracking.track_card_performance(game_state['game_state'], floor_reached, victory)
+                await self.track(track_game_over)
+
+        game.episode_rewards.append(total_reward)
+        game.episode_lengths.append(episode_length)
+        game.reward_queue.append(total_reward)
+        game.highest_reward = max(game.highest_reward, total_reward)
+        rolling_avg = sum(game.reward_queue) / len(game.reward_queue)
+        logger.info("Environment %d: %d of %d steps had a single legal action, %d forward passes skipped",
+                    game.env_id, forced_steps, episode_length, forced_steps * FORWARD_PASSES_PER_REQUEST)
+
+        if game.episode % 10 == 0:
+            if self.tracking:
+                await self.track(lambda: plotting.plot_performance_metrics(game.episode_rewards, game.episode_lengths, [rolling_avg], game.highest_reward))
+            logger.info("Environment %d: Observation reuse per component: %s", game.env_id, env.observation_encoder.report())
+            logger.info("Environment %d: %s", game.env_id, card_row_cache_report())
+            logger.info("Environment %d: %s", game.env_id, env.action_mask_cache.report())
+            logger.info("Environment %d: Reward per term last episode: %s", game.env_id, ", ".join(f"{term} {value:.1f}" for term, value in reward_term_totals.items()))
+            logger.info("Environment %d: %s", game.env_id, self.batcher.report())
+
+        game.episode += 1
+        return True
+
+    def reload_model(self):
+        self.reload_counter += 1
+        if self.reload_counter % self.reload_interval == 0 and os.path.exists("maskable_ppo_slay_the_spire.zip"):
+            self.model = MaskablePPO.load("maskable_ppo_slay_the_spire", env=self.games[0].env)
+            self.batcher.model = self.model
+            logger.info("Environments %s: Reloaded updated model weights.", [game.env_id for game in self.games])
+
+
+def run_environment_async(env_ids, ports, experience_queue, n_steps=2048, flat_observations=False, batch_window=DEFAULT_BATCH_WINDOW, transport="tcp"):
+    """
+    Process entry point of a worker that plays the games on `ports` (one env id each) with a
+    GameMultiplexer, the multiplexed counterpart of run_environment.
+    """
+    configure_logging()
+    multiplexer = GameMultiplexer(env_ids, ports, experience_queue, n_steps=n_steps, flat_observations=flat_observations, batch_window=batch_window, transport=transport)
+    asyncio.run(multiplexer.run())
@@ -1,35 +1,54 @@
 import torch as th
-import socket
+import numpy as np
 import os
-from collections import deque
+import time
+from collections import deque, defaultdict
 from sb3_contrib.ppo_mask import MaskablePPO
+from stable_baselines3.common.utils import obs_as_tensor
 from slay_the_spire_env import SlayTheSpireEnv
 from model.custom_rollout_buffer import CustomRolloutBuffer
-from util.communication import receive_full_json, handle_end_of_episode
-from util.plotting import plot_performance_metrics
-from util.data_processor import process_game_state
-import json
-from util.data_processor import process_game_state, get_next_game_id
-from util.game_over_tracking import update_game_stats_on_game_over
-from util.card_tracking import track_card_performance
-
-def run_environment(env_id, port, experience_queue, n_steps=2048):
+from util.communication import GameConnection, handle_end_of_episode
+from util.lazy_import import lazy_import
+from util.card_cache import card_row_cache_report
+from util.action_masks import single_valid_action
+from util.state_frames import StateFrame
+from util.log import configure_logging, get_logger
+from util.step_timing import StepTimings, check_first_action
+
+# Plotting (matplotlib) and the database trackers (SQLAlchemy, dotenv) are loaded on first use
+# so a freshly spawned worker does not pay for them before it can connect to its middleman
+plotting = lazy_import("util.plotting")
+data_processor = lazy_import("util.data_processor")
+game_over_tracking = lazy_import("util.game_over_tracking")
+card_tracking = lazy_import("util.card_tracking")
+
+logger = get_logger("run_env")
+
+# Policy forward passes of a step with a decision: picking the action, evaluate_actions and predict_values
+FORWARD_PASSES_PER_STEP = 3
+
+def run_environment(env_id, port, experience_queue, n_steps=2048, flat_observations=False, transport="tcp"):
     """
     Function to run a single agent in a separate environment.
+
+    With flat_observations the env, rollout buffer and policy use one flat float32 vector per
+    step (MlpPolicy) instead of the 9 component Dict (MultiInputPolicy). `transport` is the
+    middleman's --transport (util/transports.py).
     """
+    worker_start_time = time.perf_counter()
+    configure_logging()
+    first_action_sent = False
     episode_rewards = []
     episode_lengths = []
     reward_queue = deque(maxlen=10)
     highest_reward = float('-inf')
     
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.settimeout(10)
-    client_socket.connect(("localhost", port))
+    connection = GameConnection.connect(port, transport=transport)
 
     # Initialize the environment
-    env = SlayTheSpireEnv({})
+    env = SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=flat_observations)
     device = th.device("cuda" if th.cuda.is_available() else "cpu")
-    model = MaskablePPO("MultiInputPolicy", env, ent_coef=0.03, gamma=0.97, learning_rate=0.0003, clip_range=0.3, verbose=1, device=device)
+    model = MaskablePPO("MlpPolicy" if flat_observations else "MultiInputPolicy", env, ent_coef=0.03, gamma=0.97, learning_rate=0.0003, clip_range=0.3, verbose=1, device=device)
     
     reload_interval = 100
     reload_counter = 0
@@ -46,98 +65,192 @@ def run_environment(env_id, port, experience_queue, n_steps=2048):
 
     current_step = 0
     episode = 0
+    # Value of the state after the last transition of a full buffer. The rollout is shipped at
+    # the next decision, so the forced steps in between still reach its last transition
+    last_values = None
+    # First state of the next episode, received while going through the game over screens
+    next_state = None
+
+    # Wall time of every phase of the step loop, flushed to step_timings_<env_id>.jsonl
+    timings = StepTimings(f"step_timings_{env_id}.jsonl", name=f"Environment {env_id}")
 
     while True:
         done = False
         total_reward = 0
+        reward_term_totals = defaultdict(float)
         episode_length = 0
+        # Steps with a single legal action, answered without the policy and not stored
+        forced_steps = 0
+        # Reward of such steps before the episode's first stored transition, added to it
+        carried_reward = 0
         obs = env.reset()
 
         # Fetch the next game ID from the database
-        game_id = get_next_game_id()
+        timings.start()
+        game_id = data_processor.get_next_game_id()
+        timings.lap("next_game_id")
         if game_id is None:
-            print(f"Error fetching the next game ID. Exiting.")
+            logger.error("Environment %d: Error fetching the next game ID. Exiting.", env_id)
             break
 
         while not done:
-            try:
-                game_state = receive_full_json(client_socket)
-            except json.JSONDecodeError as e:
-                print(f"Failed to decode JSON in environment {env_id}: {e}")
-                continue
-            except ConnectionError as e:
-                print(f"Connection error in environment {env_id}: {e}")
-                break
-            print(f"Environment {env_id}: Game State Received")
-
-            env.update_game_state(game_state)
-            obs = env.flatten_observation(game_state)
-            obs_tensor = {key: th.tensor(value, dtype=th.float32).unsqueeze(0).to(device) for key, value in obs.items()}
-
-            action_mask = env.get_invalid_action_mask(game_state)
-            action_mask_tensor = th.tensor(action_mask, dtype=th.bool).unsqueeze(0).to(device)
-            obs_numpy = {key: value.cpu().numpy() for key, value in obs_tensor.items()}
-            action_mask_numpy = action_mask_tensor.cpu().numpy()
-
-            action, _states = model.predict(obs_numpy, action_masks=action_mask_numpy)
-            action = int(action)
+            timings.start()
+            if next_state is not None:
+                game_state, next_state = next_state, None
+            else:
+                try:
+                    game_state = connection.receive_state(timings)
+                except ConnectionError as e:
+                    logger.error("Connection error in environment %d: %s", env_id, e)
+                    break
+            logger.debug("Environment %d: Game State Received", env_id)
+
+            # A middleman started with --binary already encoded and masked the state
+            frame = None
+            if isinstance(game_state, StateFrame):
+                frame = game_state
+                game_state = frame.state
+                env.update_from_frame(frame)
+            else:
+                env.update_game_state(game_state)
+            timings.lap("update_game_state")
+
+            if frame is not None:
+                action_mask = env.get_frame_action_mask(frame)
+            else:
+                action_mask = env.get_invalid_action_mask(game_state)
+            forced_action = single_valid_action(action_mask)
+            timings.lap("action_mask")
+
+            if forced_action is None:
+                if len(rollout_buffer) >= n_steps:
+                    rollout_buffer.compute_returns_and_advantage(last_values=last_values, dones=rollout_buffer.dones[rollout_buffer.pos - 1])
+                    timings.lap("gae")
+                    experience_queue.put(rollout_buffer)
+                    rollout_buffer.reset()
+                    timings.lap("queue_put")
+
+                    reload_counter += 1
+                    if reload_counter % reload_interval == 0:
+                        if os.path.exists("maskable_ppo_slay_the_spire.zip"):
+                            model = MaskablePPO.load("maskable_ppo_slay_the_spire", env=env)
+                            logger.info("Environment %d: Reloaded updated model weights.", env_id)
+                        timings.lap("model_reload")
+
+                # Encode straight into the rollout buffer slot for this step, the policy reads the same
+                # memory (as_tensor does not copy on CPU) so the buffer needs no copy in add()
+                obs_slot = rollout_buffer.observation_slot()
+                if frame is not None:
+                    frame.copy_observation(obs_slot[0] if flat_observations else {key: view[0] for key, view in obs_slot.items()})
+                elif flat_observations:
+                    env.encode_flat_observation(game_state, out=obs_slot[0])
+                else:
+                    env.encode_observation(game_state, out={key: view[0] for key, view in obs_slot.items()})
+                obs_tensor = obs_as_tensor(obs_slot, device)
+                timings.lap("encode_observation")
+
+                with th.no_grad():
+                    action_tensor = model.policy.get_distribution(obs_tensor, action_masks=action_mask[np.newaxis]).get_actions()
+                action = int(action_tensor)
+                timings.lap("policy")
+            else:
+                # Nothing to decide, so no observation, forward passes or transition
+                action = forced_action
+                forced_steps += 1
             chosen_command = env.actions[action]
-            client_socket.sendall(chosen_command.encode('utf-8'))
+            connection.send_command(chosen_command)
+            timings.lap("send")
+            if not first_action_sent:
+                first_action_sent = True
+                first_action_seconds = time.perf_counter() - worker_start_time
+                check_first_action(f"Environment {env_id}", first_action_seconds)
+                # Also written to the step timings file with the first flush
+                timings.add("first_action", first_action_seconds)
 
             # Call the central processing function to handle game state checks and updates
-            process_game_state(game_state, chosen_command, game_id)
+            data_processor.process_game_state(game_state, chosen_command, game_id)
+            timings.lap("process_game_state")
 
-            new_obs, reward, done, info = env.step(action)
+            # The observation was already encoded into the buffer slot, only the reward is needed
+            reward, done, info = env.take_action(action)
             total_reward += reward
+            for term, value in info["reward_terms"].items():
+                reward_term_totals[term] += value
             episode_length += 1
+            timings.lap("take_action")
 
-            new_obs_tensor = {key: th.tensor(value, dtype=th.float32).unsqueeze(0).to(device) for key, value in new_obs.items()}
-            action_tensor = th.tensor(action, dtype=th.long).to(device)
-            values, log_prob, entropy = model.policy.evaluate_actions(obs_tensor, action_tensor)
-            values = model.policy.predict_values(obs_tensor)
-
-            rollout_buffer.add(
-                obs_tensor,
-                action_tensor,
-                reward,
-                done,
-                values,
-                log_prob
-            )
-
-            obs = new_obs
-            current_step += 1
-
-            if len(rollout_buffer) >= n_steps:
-                rollout_buffer.compute_returns_and_advantage(last_values=model.policy.predict_values(new_obs_tensor), dones=done)
-                experience_queue.put(rollout_buffer)
-                rollout_buffer.reset()
-
-                reload_counter += 1
-                if reload_counter % reload_interval == 0:
-                    if os.path.exists("maskable_ppo_slay_the_spire.zip"):
-                        model = MaskablePPO.load("maskable_ppo_slay_the_spire", env=env)
-                        print(f"Environment {env_id}: Reloaded updated model weights.")
+            if forced_action is not None:
+                # The reward and the end of the episode belong to the last stored transition, the
+                # decision that led here, when it is one of this episode (a full buffer waits for
+                # the next decision to be shipped, so it is still there). Before the episode's first
+                # decision that is the previous episode's terminal transition or none at all, the
+                # reward is then carried into the episode's first stored transition
+                last = rollout_buffer.pos - 1
+                if last >= 0 and not rollout_buffer.dones[last]:
+                    rollout_buffer.rewards[last] += reward
+                    rollout_buffer.dones[last] = done
+                else:
+                    carried_reward += reward
+                    if done:
+                        logger.debug("Environment %d: Episode ended before its first decision, its reward of %.2f is not stored", env_id, carried_reward)
+                timings.lap("buffer_add")
+            else:
+                values, log_prob, entropy = model.policy.evaluate_actions(obs_tensor, action_tensor)
+                values = model.policy.predict_values(obs_tensor)
+                timings.lap("evaluate_actions")
+
+                rollout_buffer.add(
+                    None,
+                    action_tensor,
+                    reward + carried_reward,
+                    done,
+                    values,
+                    log_prob
+                )
+                timings.lap("buffer_add")
+                carried_reward = 0
+
+                current_step += 1
+
+                if len(rollout_buffer) >= n_steps:
+                    # obs_tensor encodes the current game state, which step() used to re-encode as new_obs
+                    last_values = model.policy.predict_values(obs_tensor)
+                    timings.lap("gae")
             if done:
                 screen_state = game_state['game_state'].get('screen_state', {})
                 victory = screen_state.get('victory', False)
                 floor_reached = game_state['game_state'].get('floor', 0)
 
                 # Update the game stats and card performance before sending any commands
-                update_game_stats_on_game_over(game_state, game_id, total_reward)
-                track_card_performance(game_state['game_state'], floor_reached, victory)
+                game_over_tracking.update_game_stats_on_game_over(game_state, game_id, total_reward)
+                card_tracking.track_card_performance(game_state['game_state'], floor_reached, victory)
+                timings.lap("game_over_tracking")
+            timings.end_step()
 
         episode_rewards.append(total_reward)
         episode_lengths.append(episode_length)
         reward_queue.append(total_reward)
         highest_reward = max(highest_reward, total_reward)
         rolling_avg = sum(reward_queue) / len(reward_queue) if reward_queue else 0
+        logger.info("Environment %d: %d of %d steps had a single legal action, %d forward passes skipped",
+                    env_id, forced_steps, episode_length, forced_steps * FORWARD_PASSES_PER_STEP)
 
         if episode % 10 == 0:
-            plot_performance_metrics(episode_rewards, episode_lengths, [rolling_avg], highest_reward)
+            timings.start()
+            plotting.plot_performance_metrics(episode_rewards, episode_lengths, [rolling_avg], highest_reward)
+            timings.lap("plotting")
+            logger.info("Environment %d: Observation reuse per component: %s", env_id, env.observation_encoder.report())
+            logger.info("Environment %d: %s", env_id, card_row_cache_report())
+            logger.info("Environment %d: %s", env_id, env.action_mask_cache.report())
+            logger.info("Environment %d: Reward per term last episode: %s", env_id, ", ".join(f"{term} {value:.1f}" for term, value in reward_term_totals.items()))
 
         episode += 1
   
-        handle_end_of_episode(client_socket)
+        timings.start()
+        next_state = handle_end_of_episode(connection)
+        timings.lap("end_of_episode")
+        if next_state is None:
+            break
 
-    client_socket.close()
+    timings.flush()
+    connection.close()
@@ -0,0 +1,201 @@
+import selectors
+
+import numpy as np
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.observation_layout import empty_observation, empty_flat_observation
+from util.communication import GameConnection, handle_end_of_episode
+from util.state_frames import StateFrame
+from util.lazy_import import lazy_import
+from util.log import get_logger
+
+# The database trackers (SQLAlchemy, dotenv) are loaded on first use, as in run_env
+data_processor = lazy_import("util.data_processor")
+game_over_tracking = lazy_import("util.game_over_tracking")
+card_tracking = lazy_import("util.card_tracking")
+
+logger = get_logger("vec_env")
+
+
+class SlayTheSpireVecEnv(VecEnv):
+    """
+    N games driven from one process, one middleman connection and one SlayTheSpireEnv per game,
+    so a single MaskablePPO picks the actions of every game with one batched forward pass:
+
+        env = SlayTheSpireVecEnv([9999, 10000, 10001, 10002])
+        model = MaskablePPO("MultiInputPolicy", env)
+        model.learn(total_timesteps)
+
+    step_async sends every game its command, step_wait then handles the next states in the
+    order they arrive, encoding each straight into its row of the (N, ...) observation arrays
+    and computing its row of the action masks while the other games are still answering.
+    Masks are served to MaskablePPO through env_method("action_masks") and get_attr("action_masks").
+
+    With `tracking` every game is tracked in the database as a run_env worker tracks its game:
+    a game ID per episode, process_game_state for every command and the game over and card
+    stats when the episode ends.
+    """
+
+    def __init__(self, ports, host="localhost", flat_observations=False, timeout=10, transport="tcp", tracking=True):
+        self.envs = [SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=flat_observations) for _ in ports]
+        super().__init__(len(ports), self.envs[0].observation_space, self.envs[0].action_space)
+
+        self.flat_observations = flat_observations
+        self.timeout = timeout
+        self.connections = [GameConnection.connect(port, host, timeout, transport) for port in ports]
+        self.selector = selectors.DefaultSelector()
+
+        # Rows of game i, overwritten as its next state arrives. Observations are copied out
+        # before they are returned since MaskablePPO keeps the previous ones
+        if flat_observations:
+            self.observations = empty_flat_observation(batch_size=self.num_envs)
+            self.rows = [self.observations[index] for index in range(self.num_envs)]
+        else:
+            self.observations = empty_observation(batch_size=self.num_envs)
+            self.rows = [{key: array[index] for key, array in self.observations.items()} for index in range(self.num_envs)]
+        self.masks = np.ones((self.num_envs, self.action_space.n), dtype=bool)
+        self.actions = None
+        self.started = False
+
+        self.tracking = tracking
+        self.game_ids = [None] * self.num_envs
+        self.episode_rewards = np.zeros(self.num_envs, dtype=np.float32)
+
+    def encode_state(self, index, state):
+        env = self.envs[index]
+        if isinstance(state, StateFrame):
+            # Encoded and masked by a middleman started with --binary
+            env.update_from_frame(state)
+            state.copy_observation(self.rows[index])
+            self.masks[index] = env.get_frame_action_mask(state)
+            return
+        env.update_game_state(state)
+        if self.flat_observations:
+            env.encode_flat_observation(state, out=self.rows[index])
+        else:
+            env.encode_observation(state, out=self.rows[index])
+        self.masks[index] = env.get_invalid_action_mask(state)
+
+    def receive_states(self, indices):
+        """
+        Receive one state from each game in `indices`, in the order the games start answering.
+        """
+        waiting = set(indices)
+        for index in waiting:
+            self.selector.register(self.connections[index], selectors.EVENT_READ, index)
+        try:
+            while waiting:
+                ready = self.selector.select(self.timeout)
+                if not ready:
+                    logger.warning("Timeout occurred while waiting for game states from %d games.", len(waiting))
+                    continue
+                for key, _ in ready:
+                    index = key.data
+                    # The rest of a started frame follows right away
+                    state = self.connections[index].receive_state()
+                    self.selector.unregister(self.connections[index])
+                    waiting.discard(index)
+                    self.encode_state(index, state)
+        finally:
+            for index in waiting:
+                self.selector.unregister(self.connections[index])
+
+    def copy_observations(self):
+        if self.flat_observations:
+            return self.observations.copy()
+        return {key: array.copy() for key, array in self.observations.items()}
+
+    def copy_row(self, index):
+        if self.flat_observations:
+            return self.observations[index].copy()
+        return {key: array[index].copy() for key, array in self.observations.items()}
+
+    def start_episode(self, index):
+        self.episode_rewards[index] = 0
+        if not self.tracking:
+            return
+        self.game_ids[index] = data_processor.get_next_game_id()
+        if self.game_ids[index] is None:
+            logger.error("Game %d: Error fetching the next game ID, the episode is not tracked.", index)
+
+    def track_game_over(self, index):
+        game_state = self.envs[index].state
+        screen_state = game_state['game_state'].get('screen_state', {})
+        victory = screen_state.get('victory', False)
+        floor_reached = game_state['game_state'].get('floor', 0)
+        game_over_tracking.update_game_stats_on_game_over(game_state, self.game_ids[index], float(self.episode_rewards[index]))
+        card_tracking.track_card_performance(game_state['game_state'], floor_reached, victory)
+
+    def reset(self):
+        # The games can't be restarted from here, only the first reset waits for their first
+        # states, later ones (e.g. a second learn()) continue from the current states
+        if not self.started:
+            for env in self.envs:
+                env.reset()
+            self.receive_states(range(self.num_envs))
+            for index in range(self.num_envs):
+                self.start_episode(index)
+            self.started = True
+        return self.copy_observations()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions)
+        for index, (connection, env, action) in enumerate(zip(self.connections, self.envs, self.actions)):
+            command = env.actions[int(action)]
+            connection.send_command(command)
+            if self.tracking and self.game_ids[index] is not None:
+                data_processor.process_game_state(env.state, command, self.game_ids[index])
+
+    def step_wait(self):
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = [{} for _ in range(self.num_envs)]
+        for index, (env, action) in enumerate(zip(self.envs, self.actions)):
+            rewards[index], dones[index], infos[index] = env.take_action(int(action))
+            self.episode_rewards[index] += rewards[index]
+            # Tracked on the game over state, before the state answering the command replaces it
+            if dones[index] and self.tracking and self.game_ids[index] is not None:
+                self.track_game_over(index)
+
+        self.receive_states(range(self.num_envs))
+
+        # A finished game's row now holds the state that answered its last command, the
+        # terminal observation. The game then goes through the game over screens into a new
+        # run, as run_env does, and its row is overwritten with the first state of that run
+        for index in np.flatnonzero(dones):
+            infos[index]["terminal_observation"] = self.copy_row(index)
+            state = handle_end_of_episode(self.connections[index], answer_received=True)
+            if state is None:
+                raise ConnectionError(f"Game {index} disconnected at the end of its episode")
+            self.envs[index].reset()
+            self.encode_state(index, state)
+            self.start_episode(index)
+
+        return self.copy_observations(), rewards, dones, infos
+
+    def action_masks(self):
+        return self.masks.copy()
+
+    def close(self):
+        self.selector.close()
+        for connection in self.connections:
+            connection.close()
+
+    def get_attr(self, attr_name, indices=None):
+        # The masks of the current states, as env_method("action_masks") returns them
+        if attr_name == "action_masks":
+            return [self.masks[index].copy() for index in self._get_indices(indices)]
+        return [getattr(self.envs[index], attr_name) for index in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for index in self._get_indices(indices):
+            setattr(self.envs[index], attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # Masks are computed as the states arrive, not by the envs on request
+        if method_name == "action_masks":
+            return [self.masks[index].copy() for index in self._get_indices(indices)]
+        return [getattr(self.envs[index], method_name)(*method_args, **method_kwargs) for index in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
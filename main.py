@@ -2,29 +2,69 @@ from multiprocessing import Process, Queue
 from sb3_contrib.ppo_mask import MaskablePPO
 from slay_the_spire_env import SlayTheSpireEnv
 from environment.run_env import run_environment
+from environment.async_run_env import run_environment_async
+from environment.vec_env import SlayTheSpireVecEnv
 from model.model_utils import update_model
 import torch as th
+from util.log import configure_logging
 
 def main():
+    configure_logging()
     num_envs = 4
     base_port = 9999
     experience_queue = Queue()
     n_steps = 2048
+    total_steps = 100000
+    # One flat float32 observation vector per step instead of the 9 component Dict
+    flat_observations = False
+    # All games driven from this process by one model with batched inference (model.learn),
+    # instead of one worker process and model copy per game
+    vectorized = False
+    # All games played by one asyncio worker process that batches the action requests of the
+    # games ready at the same time, instead of one blocking worker process per game
+    multiplexed = False
+    # How the workers connect to the middlemen: "tcp", "unix" (AF_UNIX socket) or "shm" (shared
+    # memory rings), the middlemen must be started with the same --transport
+    transport = "tcp"
     processes = []
 
-    for env_id in range(num_envs):
-        port = base_port + env_id
-        p = Process(target=run_environment, args=(env_id, port, experience_queue))
-        p.start()
-        processes.append(p)
-
     def linear_clip_range(progress_remaining):
        
         return 0.3 * progress_remaining
 
+    if vectorized:
+        env = SlayTheSpireVecEnv([base_port + env_id for env_id in range(num_envs)], flat_observations=flat_observations, transport=transport)
+        model = MaskablePPO(
+            "MlpPolicy" if flat_observations else "MultiInputPolicy",
+            env,
+            n_steps=n_steps,
+            ent_coef=0.03,
+            gamma=0.97,
+            learning_rate=0.0003,
+            clip_range=linear_clip_range,
+            verbose=1,
+            device=th.device("cuda" if th.cuda.is_available() else "cpu")
+        )
+        model.learn(total_timesteps=total_steps)
+        model.save("maskable_ppo_slay_the_spire")
+        env.close()
+        return
+
+    if multiplexed:
+        env_ids = list(range(num_envs))
+        p = Process(target=run_environment_async, args=(env_ids, [base_port + env_id for env_id in env_ids], experience_queue), kwargs={"flat_observations": flat_observations, "transport": transport})
+        p.start()
+        processes.append(p)
+    else:
+        for env_id in range(num_envs):
+            port = base_port + env_id
+            p = Process(target=run_environment, args=(env_id, port, experience_queue), kwargs={"flat_observations": flat_observations, "transport": transport})
+            p.start()
+            processes.append(p)
+
     model = MaskablePPO(
-        "MultiInputPolicy",
-        SlayTheSpireEnv({}),
+        "MlpPolicy" if flat_observations else "MultiInputPolicy",
+        SlayTheSpireEnv({}, flat_observations=flat_observations),
         ent_coef=0.03,
         gamma=0.97,
         learning_rate=0.0003,
@@ -33,7 +73,6 @@ def main():
         device=th.device("cuda" if th.cuda.is_available() else "cpu")
     )
     
-    total_steps = 100000
     current_step = 0
     
     while current_step < total_steps:
@@ -1,12 +1,38 @@
+import argparse
+import os
+import selectors
 import socket
 import sys
 import json
+import threading
 import time
+from util import transports
+from util.framing import MESSAGE_STATE, MESSAGE_COMMAND, MESSAGE_RESEND, MESSAGE_STATE_FRAME, MessageBuffer, send_message
+from util.lazy_import import lazy_import
+from util.log import configure_logging, get_logger
 
-def log_message(message):
-    """Log messages to a file."""
-    with open("middleman_log.txt", "a") as log_file:
-        log_file.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+# The encoder (numpy, gymnasium, the observation modules) is only loaded with --binary
+slay_the_spire_env = lazy_import("slay_the_spire_env")
+state_frames = lazy_import("util.state_frames")
+
+# stdout is the channel to the game, logs only ever go to this file
+LOG_FILE = "middleman_log.txt"
+# Size at which the log file is rotated, and the number of rotated files kept
+LOG_MAX_MB = 10
+LOG_BACKUPS = 3
+# Every this many states the whole state is logged (at DEBUG), the others only by their size
+LOG_STATES_EVERY = 100
+
+# Seconds a state waits for its command before a warning is logged (it is never dropped)
+ANSWER_WARNING = 10
+# Seconds sending a state may block on a worker that does not read before it is disconnected
+SEND_TIMEOUT = 10
+# Bytes read from stdin or the worker per wake
+READ_SIZE = 65536
+# The worker's connection stays blocking for sendall, its reads must not block the loop
+RECEIVE_FLAGS = getattr(socket, "MSG_DONTWAIT", 0)
+
+logger = get_logger("middleman")
 
 def save_game_state(game_state_json):
     """Save the game state to a file with a timestamp."""
@@ -15,98 +41,279 @@ def save_game_state(game_state_json):
     with open(filename, 'w') as f:
         f.write(game_state_json)
 
-def find_free_port(start_port=9999):
+def record_game_state(record_file, game_state_json, latency):
+    """
+    Append a state to a recording for replay_middleman.py, one {"latency", "state"} object per
+    line. latency is the seconds the game took to answer the previous command (None for the
+    first state), the pacing replay_middleman.py reproduces.
+    """
+    record_file.write(f'{{"latency": {json.dumps(latency)}, "state": {game_state_json}}}\n')
+    record_file.flush()
+
+def find_free_port(start_port=9999, transport="tcp"):
     """Finds a free port starting from `start_port` and increments by 1 until a free port is found."""
     port = start_port
-    while True:
-        try:
-            # Try to bind to the given port
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(("0.0.0.0", port))
-                return port  # If successful, return the free port
-        except OSError:
-            log_message(f"Port {port} is in use, trying next port...")
-            port += 1  # Increment the port number and try again
-
-def handle_gym_client(gym_client_socket):
-    """Handle communication with the gym client."""
-    last_game_state_json = None  # Store the last game state sent to the gym client
-
-    # Set a timeout on the socket when receiving data from the gym client
-    gym_client_socket.settimeout(10)  # 10 seconds timeout
-
-    while True:
-        try:
-            # Read the game state from stdin
-            game_state_json = sys.stdin.readline().strip()
-            log_message(f"Received game state: {game_state_json}")
+    while transports.address_in_use(transport, port):
+        logger.info("Port %d is in use, trying next port...", port)
+        port += 1  # Increment the port number and try again
+    return port
+
+def open_stdin():
+    """
+    What the event loop watches for the game's lines: stdin itself, or on Windows, where
+    select() only takes sockets, a socket a thread copies stdin into.
+    """
+    if sys.platform != "win32":
+        return sys.stdin.fileno()
+    reader, writer = socket.socketpair()
+
+    def copy():
+        while True:
+            data = sys.stdin.buffer.raw.read(READ_SIZE)
+            if not data:
+                break
+            writer.sendall(data)
+        writer.close()
+
+    threading.Thread(target=copy, name="stdin", daemon=True).start()
+    return reader
+
+class Middleman:
+    """
+    Event loop relaying the game's states to the worker and its commands back, woken only by
+    a line on stdin, a connecting worker or a message from the worker (nothing polls or
+    sleeps). Every state is numbered and stays pending until a command carrying its number
+    arrives, the only command written to the game for it:
+
+    - a worker that reconnects is sent the pending state again
+    - a state identical to the pending one is dropped, a different one replaces it (the
+      command for the old one is then ignored)
+    - an unanswered state is never given up on, a warning is logged after ANSWER_WARNING seconds
+
+    Every `record_every`-th state is appended to `record_file` if given. With a
+    StateFrameEncoder the worker gets binary state frames instead of the JSON. Every
+    `log_states_every`-th state is logged in full (0 for none).
+    """
+
+    def __init__(self, server, record_file=None, frame_encoder=None, record_every=1, log_states_every=LOG_STATES_EVERY):
+        self.server = server
+        self.record_file = record_file
+        self.frame_encoder = frame_encoder
+        self.record_every = record_every
+        self.log_states_every = log_states_every
+
+        self.selector = selectors.DefaultSelector()
+        self.stdin = None
+        self.stdin_buffer = bytearray()
+        self.client = None
+        self.client_buffer = None
+        self.receive_buffer = bytearray(READ_SIZE)
+        self.running = False
+
+        self.sequence = 0  # Number of the last state, the framed protocol numbers them from 1
+        self.pending = None  # (sequence, JSON, message type, payload) of the unanswered state
+        self.pending_since = None
+        self.warned = False
+        self.command_sent_time = None
+
+    def run(self):
+        """
+        Relay until the game closes stdin.
+        """
+        self.stdin = open_stdin()
+        self.selector.register(self.stdin, selectors.EVENT_READ, self.read_stdin)
+        # accept() is only called when a worker is waiting, it must not block on a spurious wake
+        self.server.settimeout(0)
+        self.selector.register(self.server, selectors.EVENT_READ, self.accept_client)
+        self.running = True
+        while self.running:
+            timeout = None
+            if self.pending is not None and not self.warned:
+                timeout = max(0, self.pending_since + ANSWER_WARNING - time.perf_counter())
+            for key, _ in self.selector.select(timeout):
+                key.data()
+            if self.pending is not None and not self.warned and time.perf_counter() - self.pending_since >= ANSWER_WARNING:
+                logger.warning("State %d unanswered for %d seconds, still waiting for the worker", self.pending[0], ANSWER_WARNING)
+                self.warned = True
+        self.disconnect()
+        self.selector.close()
+
+    def read_stdin(self):
+        if isinstance(self.stdin, socket.socket):
+            data = self.stdin.recv(READ_SIZE)
+        else:
+            data = os.read(self.stdin, READ_SIZE)
+        if not data:
+            logger.info("The game closed stdin, stopping.")
+            self.running = False
+            # The last line may not end in a newline
+            data = b"\n" if self.stdin_buffer else b""
+        self.stdin_buffer += data
+        *lines, rest = self.stdin_buffer.split(b"\n")
+        self.stdin_buffer = bytearray(rest)
+        for line in lines:
+            game_state_json = line.decode('utf-8').strip()
             if not game_state_json:
-                log_message("No game state received, waiting for the next update.")
-                time.sleep(0.1)  # Reduced sleep time
+                logger.debug("No game state received, waiting for the next update.")
                 continue
+            self.handle_state(game_state_json)
 
-            # Parse the JSON game state
-            try:
-                game_state = json.loads(game_state_json)
-            except json.JSONDecodeError:
-                log_message("Received invalid JSON. Waiting for the next update...")
-                continue
+    def handle_state(self, game_state_json):
+        logger.debug("Received game state of %d bytes", len(game_state_json))
 
-            # Save the valid game state to resend if needed
-            last_game_state_json = game_state_json
-
-            # Forward the valid game state to the gym client
-            gym_client_socket.sendall(game_state_json.encode('utf-8'))
-
-            # Receive the response (chosen action) from the gym client
-            while True:
-                try:
-                    response = gym_client_socket.recv(4096)
-                    if response:
-                        # Print the received command to stdout
-                        command = response.decode('utf-8')
-                        log_message(f"Received command from gym client: {command}")
-
-                        # Send the response back to the game via stdout
-                        sys.stdout.write(command + "\n")
-                        sys.stdout.flush()
-                        log_message(f"Sent command to game: {command}")
-                        break  # Break out of the inner loop to process next game state
-                except socket.timeout:
-                    # Timeout occurred, check if new game state is available
-                    log_message("No response from gym client within timeout period, checking for new game state.")
-                    break  # Break to read the next game state
-
-        except Exception as e:
-            log_message(f"Exception: {e}")
-            break
-
-    gym_client_socket.close()
+        # Parse the JSON game state
+        try:
+            game_state = json.loads(game_state_json)
+        except json.JSONDecodeError:
+            logger.warning("Received invalid JSON. Waiting for the next update...")
+            return
+
+        if self.pending is not None:
+            if game_state_json == self.pending[1]:
+                logger.debug("Dropped a repeat of state %d", self.pending[0])
+                return
+            logger.warning("State %d replaced by a new state before it was answered", self.pending[0])
+
+        self.sequence += 1
+        sequence = self.sequence
+        if self.log_states_every and sequence % self.log_states_every == 0:
+            logger.debug("Game state %d: %s", sequence, game_state_json)
+        if self.record_file is not None and sequence % self.record_every == 0:
+            latency = time.perf_counter() - self.command_sent_time if self.command_sent_time is not None else None
+            record_game_state(self.record_file, game_state_json, latency)
+
+        # Forward the valid game state to the gym client as the next numbered state frame
+        if self.frame_encoder is not None:
+            state_type = MESSAGE_STATE_FRAME
+            state_payload = self.frame_encoder.encode(game_state, game_state_json)
+        else:
+            state_type = MESSAGE_STATE
+            state_payload = game_state_json.encode('utf-8')
+        self.pending = (sequence, game_state_json, state_type, state_payload)
+        self.pending_since = time.perf_counter()
+        self.warned = False
+        self.send_pending()
+
+    def send_pending(self):
+        sequence, _, state_type, state_payload = self.pending
+        if self.client is None:
+            logger.debug("No gym client connected, state %d waits for one", sequence)
+            return
+        try:
+            send_message(self.client, state_type, sequence, state_payload)
+        except OSError as e:
+            logger.warning("Could not send state %d to the gym client: %s", sequence, e)
+            self.disconnect()
+
+    def accept_client(self):
+        try:
+            client, addr = self.server.accept()
+        except (BlockingIOError, socket.timeout):
+            return
+        # A new worker replaces the last one (shared memory connections reuse its doorbell,
+        # so it is unregistered first)
+        if self.client is not None:
+            logger.info("Replacing the connected gym client")
+            self.disconnect()
+        logger.info("Accepted connection from %s", addr)
+        client.settimeout(SEND_TIMEOUT)
+        self.client = client
+        self.client_buffer = MessageBuffer()
+        self.selector.register(client, selectors.EVENT_READ, self.read_client)
+        if self.pending is not None:
+            logger.info("Resending state %d to the new gym client", self.pending[0])
+            self.send_pending()
+
+    def read_client(self):
+        try:
+            count = self.client.recv_into(self.receive_buffer, 0, RECEIVE_FLAGS)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.warning("Gym client connection failed: %s", e)
+            self.disconnect()
+            return
+        if not count:
+            logger.info("Gym client disconnected")
+            self.disconnect()
+            return
+        self.client_buffer.feed(memoryview(self.receive_buffer)[:count])
+        try:
+            for message in self.client_buffer.messages():
+                self.handle_message(*message)
+        except ConnectionError as e:
+            logger.warning("Gym client sent an invalid message: %s", e)
+            self.disconnect()
+
+    def handle_message(self, message_type, answered, payload):
+        sequence = self.pending[0] if self.pending is not None else self.sequence
+        if message_type == MESSAGE_RESEND:
+            # The client is behind this state (e.g. it waited on a slow game and asked again),
+            # resending is harmless since it skips states it already has
+            if self.pending is not None and answered < sequence:
+                logger.debug("Resending state %d", sequence)
+                self.send_pending()
+            return
+        if message_type != MESSAGE_COMMAND or self.pending is None or answered != sequence:
+            logger.warning("Ignored message of type %d for state %d while waiting on state %d", message_type, answered, sequence)
+            return
+
+        command = payload.decode('utf-8')
+        logger.debug("Received command from gym client: %s", command)
+
+        # Send the response back to the game via stdout
+        sys.stdout.write(command + "\n")
+        sys.stdout.flush()
+        self.command_sent_time = time.perf_counter()
+        self.pending = None
+        logger.debug("Sent command to game: %s", command)
+
+    def disconnect(self):
+        if self.client is None:
+            return
+        self.selector.unregister(self.client)
+        self.client.close()
+        self.client = None
+        self.client_buffer = None
 
 def main():
+    parser = argparse.ArgumentParser(description="Relay CommunicationMod states to a gym client over TCP.")
+    parser.add_argument("--record", help="Append every state with the game's response time to this .jsonl file, for replay_middleman.py")
+    parser.add_argument("--record-every", type=int, default=1, help="Only record every N-th state")
+    parser.add_argument("--binary", action="store_true", help="Encode and mask the states here and send the worker binary state frames")
+    parser.add_argument("--log-states-every", type=int, default=LOG_STATES_EVERY, help="Log every N-th state in full at DEBUG, 0 for none")
+    parser.add_argument("--log-max-mb", type=float, default=LOG_MAX_MB, help="Rotate the log file at this size")
+    parser.add_argument("--log-backups", type=int, default=LOG_BACKUPS, help="Number of rotated log files kept")
+    parser.add_argument("--transport", choices=transports.TRANSPORTS, default="tcp",
+                        help="How the worker connects: TCP, a Unix socket or shared memory, the worker must use the same")
+    args = parser.parse_args()
+
+    # Buffered, rotated and written by the logging thread, off the path from stdin to the
+    # socket. Not rate limited: the full states are sampled, every other event is kept
+    configure_logging(stream=None, log_file=LOG_FILE, rate_limit=None,
+                      max_bytes=int(args.log_max_mb * 2**20), backup_count=args.log_backups)
+    record_file = open(args.record, "a") if args.record else None
+    frame_encoder = None
+    if args.binary:
+        env = slay_the_spire_env.SlayTheSpireEnv({}, incremental_encoding=True, flat_observations=True)
+        frame_encoder = state_frames.StateFrameEncoder(env)
+
     # Find a free port starting from 9999
-    port = find_free_port()
+    port = find_free_port(transport=args.transport)
     
-    # Create a TCP socket
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind(("0.0.0.0", port))
-    server.listen(5)
+    # Listen on it, over TCP unless configured otherwise (util/transports.py)
+    server = transports.listen(args.transport, port)
     sys.stdout.write(f"{port}\n")  # Inform the game about the port being used
     sys.stdout.flush()
-    log_message(f"Middleman process started and listening on port {port}.")
-
-    while True:
-        try:
-            # Accept a connection from the environment process
-            client_socket, addr = server.accept()
-            log_message(f"Accepted connection from {addr}")
+    logger.info("Middleman process started and listening on port %d (%s).", port, args.transport)
 
-            # Handle the gym client in the current thread to maintain continuous communication
-            handle_gym_client(client_socket)
+    try:
+        Middleman(server, record_file, frame_encoder, args.record_every, args.log_states_every).run()
+    except Exception as e:
+        logger.error("Exception in main loop: %s", e)
 
-        except Exception as e:
-            log_message(f"Exception in main loop: {e}")
-            break
+    # Removes the shared memory of the shm transport
+    server.close()
 
 if __name__ == "__main__":
     main()
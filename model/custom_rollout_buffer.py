@@ -2,14 +2,14 @@ import numpy as np
 from stable_baselines3.common.buffers import RolloutBuffer
 from collections import defaultdict
 import torch as th
+from gymnasium import spaces
 
 class CustomRolloutBuffer(RolloutBuffer):
     def __init__(self, buffer_size, observation_space, action_space, device, gamma=0.99, gae_lambda=0.95, n_envs=1):
         super().__init__(buffer_size, observation_space, action_space, device, gamma, gae_lambda, n_envs)
 
         # Instead of single numpy array, we store observation component separately
-        self.observations = {key: np.zeros((self.buffer_size, self.n_envs, *space.shape), dtype=space.dtype)
-                             for key, space in observation_space.spaces.items()}
+        self.observations = self._empty_observations()
         self.values = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
         self.device = device
 
@@ -18,8 +18,7 @@ class CustomRolloutBuffer(RolloutBuffer):
         Reset the buffer by filling it with zeros for each observation component.
         """
         # Reset dictionary based observations since standard SB3 rollout buffer does not
-        self.observations = {key: np.zeros((self.buffer_size, self.n_envs, *space.shape), dtype=space.dtype)
-                             for key, space in self.observation_space.spaces.items()}
+        self.observations = self._empty_observations()
         self.actions = np.zeros((self.buffer_size, self.action_dim), dtype=np.float32)
         self.rewards = np.zeros((self.buffer_size,), dtype=np.float32)
         self.returns = np.zeros((self.buffer_size,), dtype=np.float32)
@@ -33,16 +32,38 @@ class CustomRolloutBuffer(RolloutBuffer):
         self.pos = 0
         self.full = False
 
+    def _empty_observations(self):
+        # One array per component for a Dict observation space, a single array for a flat Box
+        if isinstance(self.observation_space, spaces.Dict):
+            return {key: np.zeros((self.buffer_size, self.n_envs, *space.shape), dtype=space.dtype)
+                    for key, space in self.observation_space.spaces.items()}
+        return np.zeros((self.buffer_size, self.n_envs, *self.observation_space.shape), dtype=self.observation_space.dtype)
+
+    def observation_slot(self):
+        """
+        Views of every observation component at the current position, shaped (n_envs, *obs_shape),
+        or a single (n_envs, *obs_shape) view with a flat observation space.
+
+        Encoding the observation straight into these views (and handing the same memory to the
+        policy) avoids copying it into the buffer afterwards, call add() with obs=None for that step.
+        """
+        if not isinstance(self.observations, dict):
+            return self.observations[self.pos]
+        return {key: observation[self.pos] for key, observation in self.observations.items()}
+
     def add(self, obs, action, reward, done, value, log_prob):
         """
         Add a new transition to the buffer.
         """
         idx = self.pos
 
-        # Store dict observation components
-        for key in obs:
-            # Convert tensors to numpy arrays and store them per observation key
-            self.observations[key][idx] = obs[key].detach().cpu().numpy()
+        # Store dict observation components, unless they were already written through observation_slot()
+        if obs is not None and not isinstance(self.observations, dict):
+            self.observations[idx] = obs.detach().cpu().numpy()
+        elif obs is not None:
+            for key in obs:
+                # Convert tensors to numpy arrays and store them per observation key
+                self.observations[key][idx] = obs[key].detach().cpu().numpy()
 
         # Store other values as usual
         self.actions[idx] = action.cpu().numpy()
@@ -67,12 +88,15 @@ class CustomRolloutBuffer(RolloutBuffer):
         for start in range(0, self.pos, batch_size):
             end = start + batch_size
 
-            # Process each observation component separately
-            obs_batch = {key: self.observations[key][start:end] for key in self.observations}
+            # Process each observation component separately, a flat observation is a single array
+            if isinstance(self.observations, dict):
+                obs_batch = {key: self.to_torch(self.observations[key][start:end]).view(batch_size, -1).to(device) for key in self.observations}
+            else:
+                obs_batch = self.to_torch(self.observations[start:end]).view(batch_size, -1).to(device)
 
             # Convert data to torch tensors, flattening observations for model consumption
             yield {
-                "observations": {key: self.to_torch(obs).view(batch_size, -1).to(device) for key, obs in obs_batch.items()},
+                "observations": obs_batch,
                 "actions": self.to_torch(self.actions[start:end]).to(device),
                 "rewards": self.to_torch(self.rewards[start:end]).to(device),
                 "dones": self.to_torch(self.dones[start:end]).to(device),
@@ -1,5 +1,8 @@
 import torch as th
 import time 
+from util.log import get_logger
+
+logger = get_logger("model_utils")
 
 def update_model(model, rollout_buffer, current_step, total_steps):
     n_epochs = 10
@@ -13,7 +16,10 @@ def update_model(model, rollout_buffer, current_step, total_steps):
                 # Convert actions into tensors
                 actions = th.tensor(rollout_data["actions"], dtype=th.long).flatten().to(model.device)
                 observations = rollout_data["observations"]
-                observations_tensor = {key: th.tensor(value).to(model.device) for key, value in observations.items()}
+                if isinstance(observations, dict):
+                    observations_tensor = {key: th.tensor(value).to(model.device) for key, value in observations.items()}
+                else:
+                    observations_tensor = th.tensor(observations).to(model.device)
 
                 # Caluclate value (Value estiamtes from critic which predicts future reward from a given state), 
                 # Log_probality (how likely the policy is to select an action in a given state) and entropy (randomness exploration) 
@@ -46,8 +52,8 @@ def update_model(model, rollout_buffer, current_step, total_steps):
             except Exception as e:
                 with open("model_update_log.txt", "a") as log_file:
                     log_file.write(f"Error during model update at {time.strftime('%Y-%m-%d %H:%M:%S')}: {str(e)}\n")
-                print(f"Error during model update: {e}")
+                logger.error("Error during model update: %s", e)
 
         with open("model_update_log.txt", "a") as log_file:
             log_file.write(f"Model was updated at {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-        print("Model Updated and logged.")
+        logger.info("Model Updated and logged.")
@@ -1,41 +1,47 @@
 import numpy as np
 from util.tokenizers import card_tokenizer, card_type_tokenizer, card_rarity_tokenizer
+from util.card_cache import cached_card_row
 
-def get_deck_observation(game_state):
-    deck = game_state.get("deck", [])
-    max_deck_size = 100
-    deck_observation = []
+MAX_DECK_SIZE = 100
+DECK_CARD_FEATURES = 8
 
-    for card in deck[:max_deck_size]:
-        card_name_token = card_tokenizer.texts_to_sequences([card["name"]])[0][0] if card_tokenizer.texts_to_sequences([card["name"]]) else 0
-        card_type_token = card_type_tokenizer.texts_to_sequences([card["type"]])[0][0] if card_type_tokenizer.texts_to_sequences([card["type"]]) else 0
-        card_rarity_token = card_rarity_tokenizer.texts_to_sequences([card["rarity"]])[0][0] if card_rarity_tokenizer.texts_to_sequences([card["rarity"]]) else 0
+@cached_card_row
+def encode_deck_card(card):
+    card_name_token = card_tokenizer.encode(card["name"])
+    card_type_token = card_type_tokenizer.encode(card["type"])
+    card_rarity_token = card_rarity_tokenizer.encode(card["rarity"])
 
-        # Handle card cost
-        cost = card.get("cost", None)
-        if cost is None:
-            card_cost = -1
-        elif cost == 'X':
-            card_cost = -2
-        else:
-            card_cost = float(cost)
+    # Handle card cost
+    cost = card.get("cost", None)
+    if cost is None:
+        card_cost = -1
+    elif cost == 'X':
+        card_cost = -2
+    else:
+        card_cost = float(cost)
 
-        # Construct card observation
-        card_observation = [
-            float(card["exhausts"]),
-            card_cost,
-            card_name_token,
-            card_type_token,
-            card_rarity_token,
-            float(card["ethereal"]),
-            float(card["upgrades"] > 0),
-            float(card["has_target"]),
-        ]
+    # Construct card observation
+    return [
+        float(card["exhausts"]),
+        card_cost,
+        card_name_token,
+        card_type_token,
+        card_rarity_token,
+        float(card["ethereal"]),
+        float(card["upgrades"] > 0),
+        float(card["has_target"]),
+    ]
 
-        deck_observation.append(card_observation)
+def get_deck_observation(game_state, out=None):
+    deck = game_state.get("deck", [])[:MAX_DECK_SIZE]
 
-    # Pad the observation if the deck has fewer than 100 cards
-    while len(deck_observation) < max_deck_size:
-        deck_observation.append([0.0] * 8)
+    # Rows past the end of the deck stay zero padded, `out` is filled in place when given
+    if out is None:
+        deck_observation = np.zeros((MAX_DECK_SIZE, DECK_CARD_FEATURES), dtype=np.float32)
+    else:
+        deck_observation = out
+        deck_observation.fill(0)
+    if deck:
+        deck_observation[:len(deck)] = [encode_deck_card(card) for card in deck]
 
-    return np.array(deck_observation, dtype=np.float32)
\ No newline at end of file
+    return deck_observation
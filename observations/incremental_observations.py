@@ -0,0 +1,125 @@
+import numpy as np
+
+from observations.player_observations import get_player_observation
+from observations.hand_observations import get_hand_observation
+from observations.monster_observations import get_monster_observation
+from observations.map_observations import get_map_observation
+from observations.potion_observations import get_potion_observation
+from observations.relic_observations import get_relic_observation
+from observations.extra_info_observations import get_extra_info_observation
+from observations.deck_observations import get_deck_observation
+from observations.screen_observations import get_screen_observation
+from observations.observation_layout import OBSERVATION_SHAPES, empty_observation
+
+def _deck(state):
+    return state["game_state"].get("deck", [])
+
+def _map_key(state):
+    # The map is generated once per act and never changes while the act lasts, comparing the
+    # nodes themselves would cost as much as encoding them
+    game_state = state["game_state"]
+    return game_state.get("seed"), game_state.get("act"), len(game_state.get("map", []))
+
+def _relics(state):
+    return state["game_state"].get("relics", [])
+
+def _potions(state):
+    return state["game_state"].get("potions", [])
+
+# Component -> (part of the state it reads, encoder writing it in place). The part is compared
+# with == to the one of the previous state, the lists of dicts of a parsed state are compared
+# in C without building any key. Components without a part change on nearly every combat
+# action and are always re-encoded.
+COMPONENTS = {
+    "player": (None, lambda state, out: get_player_observation(state["game_state"], out=out)),
+    "hand": (None, lambda state, out: get_hand_observation(state["game_state"].get("combat_state", None), out=out)),
+    "monsters": (None, lambda state, out: get_monster_observation(state["game_state"], out=out)),
+    "potion": (_potions, lambda state, out: get_potion_observation(state["game_state"], out=out)),
+    "deck": (_deck, lambda state, out: get_deck_observation(state["game_state"], out=out)),
+    "map": (_map_key, lambda state, out: get_map_observation(state["game_state"], out=out)),
+    "relics": (_relics, lambda state, out: get_relic_observation(state["game_state"], out=out)),
+    "screen": (None, lambda state, out: get_screen_observation(state, out=out)),
+    "extra_info": (None, lambda state, out: get_extra_info_observation(state["game_state"], out=out)),
+}
+
+class IncrementalObservationEncoder:
+    """
+    Re-encodes only the components whose part of the game state changed since the last state
+    of this game. Changed components are encoded straight into the destination, an unchanged
+    one is copied from wherever it was last written, or left alone when that is the
+    destination itself (e.g. a SlayTheSpireVecEnv row or the frame of a StateFrameEncoder).
+
+    Arrays the encoder wrote (`out` or its own, returned when no `out` is given) may be read
+    by the next call, so the caller must not write into them afterwards.
+
+    With a `full_encode` function (e.g. SlayTheSpireEnv.flatten_observation) every result is
+    also checked against a full re-encode and a ValueError is raised on any difference.
+    """
+
+    def __init__(self, full_encode=None):
+        self.full_encode = full_encode
+        self.observation = empty_observation()
+        self.hits = dict.fromkeys(OBSERVATION_SHAPES, 0)
+        self.misses = dict.fromkeys(OBSERVATION_SHAPES, 0)
+        self.reset()
+
+    def reset(self):
+        self.parts = dict.fromkeys(OBSERVATION_SHAPES)
+        # Component -> array holding its latest encoding
+        self.latest = dict(self.observation)
+        self.last_state = None
+
+    def encode(self, state, out=None):
+        """
+        Encode a state of this game, writing into `out` when given, otherwise returning the
+        encoder's own arrays (overwritten by the next call).
+        """
+        if out is None:
+            out = self.observation
+        if "game_state" not in state:
+            for key, component in out.items():
+                component.fill(0)
+                self.latest[key] = component
+                self.misses[key] += 1
+            self.parts = dict.fromkeys(OBSERVATION_SHAPES)
+        else:
+            # The same message encoded twice (e.g. by the worker and then by env.step) is
+            # reused whole
+            same_state = state is self.last_state
+            for key, (part, encode) in COMPONENTS.items():
+                component = out[key]
+                current = part(state) if part is not None and not same_state else None
+                if same_state or current is not None and current == self.parts[key]:
+                    self.hits[key] += 1
+                    latest = self.latest[key]
+                    if latest is not component:
+                        np.copyto(component, latest)
+                        self.latest[key] = component
+                    continue
+                encode(state, component)
+                self.latest[key] = component
+                self.parts[key] = current
+                self.misses[key] += 1
+        self.last_state = state
+
+        if self.full_encode is not None:
+            self.verify(state, out)
+        return out
+
+    def verify(self, state, observation):
+        expected = self.full_encode(state)
+        for key, component in observation.items():
+            if not np.array_equal(component, expected[key]):
+                raise ValueError(f"Incremental encoding of '{key}' differs from a full re-encode")
+
+    def hit_rates(self):
+        """
+        Fraction of encodes per component that reused the previous result.
+        """
+        return {
+            key: self.hits[key] / (self.hits[key] + self.misses[key]) if self.hits[key] + self.misses[key] else 0.0
+            for key in self.hits
+        }
+
+    def report(self):
+        return ", ".join(f"{key} {rate:.0%}" for key, rate in self.hit_rates().items())
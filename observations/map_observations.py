@@ -1,18 +1,136 @@
+from collections import OrderedDict
+from itertools import takewhile
+
 import numpy as np
 from util.tokenizers import map_symbol_tokenizer
 
-def get_map_observation(game_state):
-    map_state = game_state.get("map", [])
-    max_map_nodes = 100
-    map_observation = []
+MAX_MAP_NODES = 100
+
+# Room symbols counted on the paths still reachable from a node: elites, rest sites and shops
+REACHABLE_SYMBOLS = ("E", "R", "$")
+MAP_INDEX_CACHE_SIZE = 4
+
+def encode_map_columns(nodes):
+    # Symbol token, x, y and number of children of every node, one list per feature column
+    encode_symbol = map_symbol_tokenizer.encode
+    return (
+        [encode_symbol(node["symbol"]) for node in nodes],
+        [node["x"] for node in nodes],
+        [node["y"] for node in nodes],
+        [len(node.get("children", [])) for node in nodes],
+    )
+
+def _count_symbols(mask, symbol_masks):
+    return tuple(bin(mask & symbol_mask).count("1") for symbol_mask in symbol_masks)
+
+class MapIndex:
+    """
+    Everything derived from one act's map, built once when the act starts: the encoded
+    (MAX_MAP_NODES, 4) map observation, the symbol token of every node, the adjacency from
+    `children` and, for every node, the number of elites, rests and shops reachable from it.
+    """
+
+    def __init__(self, nodes):
+        self.positions = {(node["x"], node["y"]): index for index, node in enumerate(nodes)}
+        self.children = [
+            [self.positions[(child["x"], child["y"])] for child in node.get("children", []) if (child["x"], child["y"]) in self.positions]
+            for node in nodes
+        ]
+
+        columns = encode_map_columns(nodes)
+        self.symbol_tokens = columns[0]
+        self.observation = np.zeros((MAX_MAP_NODES, 4), dtype=np.float32)
+        for column, values in enumerate(columns):
+            self.observation[:min(len(nodes), MAX_MAP_NODES), column] = values[:MAX_MAP_NODES]
+
+        # Bitmask of the nodes reachable from each node, children are always on a higher floor
+        # so walking the floors top down sees every child before its parents
+        reachable = [0] * len(nodes)
+        for index in sorted(range(len(nodes)), key=lambda index: nodes[index]["y"], reverse=True):
+            mask = 0
+            for child in self.children[index]:
+                mask |= (1 << child) | reachable[child]
+            reachable[index] = mask
+
+        symbol_masks = [
+            sum(1 << index for index, node in enumerate(nodes) if node["symbol"] == symbol)
+            for symbol in REACHABLE_SYMBOLS
+        ]
+        # Counts after leaving a node and counts on the paths going through it
+        self.counts_after = [_count_symbols(mask, symbol_masks) for mask in reachable]
+        self.counts_through = [_count_symbols(mask | (1 << index), symbol_masks) for index, mask in enumerate(reachable)]
+
+        first_floor = min((node["y"] for node in nodes), default=0)
+        start_mask = 0
+        for index, node in enumerate(nodes):
+            if node["y"] == first_floor:
+                start_mask |= (1 << index) | reachable[index]
+        self.start_counts = _count_symbols(start_mask, symbol_masks)
+
+    def node_at(self, x, y):
+        """
+        Index of the node at (x, y), None when there is no such node (e.g. the boss).
+        """
+        return self.positions.get((x, y))
+
+    def symbol_token(self, node):
+        index = self.node_at(node["x"], node["y"])
+        if index is None:
+            return map_symbol_tokenizer.encode(node["symbol"])
+        return self.symbol_tokens[index]
+
+    def remaining_counts(self, node):
+        """
+        (elites, rests, shops) still reachable after leaving `node`.
+        """
+        index = self.node_at(node["x"], node["y"])
+        return self.counts_after[index] if index is not None else (0,) * len(REACHABLE_SYMBOLS)
+
+    def path_counts(self, node):
+        """
+        (elites, rests, shops) on the paths going through `node`, the node included.
+        """
+        index = self.node_at(node["x"], node["y"])
+        return self.counts_through[index] if index is not None else (0,) * len(REACHABLE_SYMBOLS)
+
+_map_indexes = OrderedDict()
+
+def get_map_index(game_state):
+    """
+    MapIndex of the current act, None when the state has no map. Maps are keyed by seed, act
+    and the floor 0 layout, so building one only happens once per act.
+    """
+    nodes = game_state.get("map", [])
+    if not nodes:
+        return None
+
+    first_floor = nodes[0]["y"]
+    floor_zero = tuple(
+        (node["x"], node["symbol"], tuple(child["x"] for child in node.get("children", [])))
+        for node in takewhile(lambda node: node["y"] == first_floor, nodes)
+    )
+    key = (game_state.get("seed"), game_state.get("act"), len(nodes), floor_zero)
+
+    map_index = _map_indexes.get(key)
+    if map_index is None:
+        map_index = _map_indexes[key] = MapIndex(nodes)
+        if len(_map_indexes) > MAP_INDEX_CACHE_SIZE:
+            _map_indexes.popitem(last=False)
+    else:
+        _map_indexes.move_to_end(key)
+    return map_index
 
-    for node in map_state[:max_map_nodes]:
-        symbol_sequence = map_symbol_tokenizer.texts_to_sequences([node["symbol"]])
-        map_symbol_token = symbol_sequence[0][0] if symbol_sequence and symbol_sequence[0] else 0
-        node_observation = [map_symbol_token, node["x"], node["y"], len(node.get("children", []))]
-        map_observation.append(node_observation)
+def get_map_observation(game_state, out=None):
+    map_index = get_map_index(game_state)
 
-    while len(map_observation) < max_map_nodes:
-        map_observation.append([0.0] * 4)
+    if out is None:
+        if map_index is None:
+            return np.zeros((MAX_MAP_NODES, 4), dtype=np.float32)
+        return map_index.observation.copy()
 
-    return np.array(map_observation, dtype=np.float32)
+    # The cached array is shared by every step of the act, it is only ever copied out
+    if map_index is None:
+        out.fill(0)
+    else:
+        np.copyto(out, map_index.observation)
+    return out
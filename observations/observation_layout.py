@@ -0,0 +1,66 @@
+import numpy as np
+
+# Shape of every component of the Dict observation returned by SlayTheSpireEnv.flatten_observation
+OBSERVATION_SHAPES = {
+    "player": (24,),
+    "hand": (10, 8),
+    "potion": (5, 4),
+    "deck": (100, 8),
+    "monsters": (5, 30),
+    "map": (100, 4),
+    "relics": (30, 2),
+    "screen": (50,),
+    "extra_info": (5,),
+}
+
+def empty_observation(batch_size=None):
+    """
+    Zero filled observation components, with a leading batch dimension when batch_size is given.
+    """
+    batch_shape = () if batch_size is None else (batch_size,)
+    return {key: np.zeros(batch_shape + shape, dtype=np.float32) for key, shape in OBSERVATION_SHAPES.items()}
+
+def _flat_slices(shapes):
+    slices = {}
+    offset = 0
+    for key in sorted(shapes):
+        size = int(np.prod(shapes[key]))
+        slices[key] = slice(offset, offset + size)
+        offset += size
+    return slices, offset
+
+# Flat observation: every component flattened (row major) and concatenated in sorted key order,
+# the order of the env's spaces.Dict and the one SB3's CombinedExtractor concatenates it in.
+#
+#   deck          0 -  800    (100, 8)
+#   extra_info  800 -  805    (5,)
+#   hand        805 -  885    (10, 8)
+#   map         885 - 1285    (100, 4)
+#   monsters   1285 - 1435    (5, 30)
+#   player     1435 - 1459    (24,)
+#   potion     1459 - 1479    (5, 4)
+#   relics     1479 - 1539    (30, 2)
+#   screen     1539 - 1589    (50,)
+OBSERVATION_SLICES, FLAT_OBSERVATION_SIZE = _flat_slices(OBSERVATION_SHAPES)
+
+def empty_flat_observation(batch_size=None):
+    """
+    Zero filled flat observation of FLAT_OBSERVATION_SIZE floats, with a leading batch dimension
+    when batch_size is given.
+    """
+    batch_shape = () if batch_size is None else (batch_size,)
+    return np.zeros(batch_shape + (FLAT_OBSERVATION_SIZE,), dtype=np.float32)
+
+def observation_views(flat_observation):
+    """
+    Dict of named component views into a flat observation (or a batch of them), no data is copied
+    so writing into a view writes into the flat array.
+    """
+    batch_shape = flat_observation.shape[:-1]
+    views = {}
+    for key, components in OBSERVATION_SLICES.items():
+        view = flat_observation[..., components].view()
+        # Setting the shape raises instead of silently copying when a view isn't possible
+        view.shape = batch_shape + OBSERVATION_SHAPES[key]
+        views[key] = view
+    return views
@@ -2,9 +2,10 @@ import numpy as np
 from util.tokenizers import potion_tokenizer
 from observation_processing import tokenize_potions
 
-def get_potion_observation(game_state):
+MAX_POTIONS = 5
+
+def get_potion_observation(game_state, out=None):
     potions = game_state.get("potions", [])
-    max_potions = 5
-    potion_observation = tokenize_potions(potions, max_potions, potion_tokenizer)
+    potion_observation = tokenize_potions(potions, MAX_POTIONS, potion_tokenizer, out=out)
     
-    return potion_observation
\ No newline at end of file
+    return potion_observation
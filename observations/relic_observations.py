@@ -1,16 +1,21 @@
 import numpy as np
 from util.tokenizers import relic_tokenizer
 
-def get_relic_observation(game_state):
-    relics = game_state.get("relics", [])
-    max_relics = 30
-    relic_observation = []
+MAX_RELICS = 30
 
-    for relic in relics[:max_relics]:
-        relic_token = relic_tokenizer.texts_to_sequences([relic["name"]])[0][0] if relic_tokenizer.texts_to_sequences([relic["name"]]) else 0
-        relic_observation.append([float(relic_token), float(relic.get("counter", -1))])
+def encode_relic(relic):
+    relic_token = relic_tokenizer.encode(relic["name"])
+    return [float(relic_token), float(relic.get("counter", -1))]
 
-    while len(relic_observation) < max_relics:
-        relic_observation.append([0.0, 0.0])
+def get_relic_observation(game_state, out=None):
+    relics = game_state.get("relics", [])[:MAX_RELICS]
 
-    return np.array(relic_observation, dtype=np.float32)
+    if out is None:
+        relic_observation = np.zeros((MAX_RELICS, 2), dtype=np.float32)
+    else:
+        relic_observation = out
+        relic_observation.fill(0)
+    if relics:
+        relic_observation[:len(relics)] = [encode_relic(relic) for relic in relics]
+
+    return relic_observation
@@ -0,0 +1,159 @@
+"""
+Stand-in for middleman_process.py that replays recorded CommunicationMod states instead of
+relaying a running game, so main.py and run_env.py can be run, benchmarked and profiled on a
+machine without Slay the Spire.
+
+Every instance listens on its own port and speaks the middleman's framed protocol
+(util/framing.py): it sends a state, waits for the command and answers it with the next state
+of the trace. The commands do not
+change what comes next, the trace is replayed as recorded (and from the start again once it
+runs out). Traces are the .jsonl files middleman_process.py writes with --record (they carry
+the game's response time of every state), .jsonl files with one state per line or the
+game_state_*.json files of middleman_process.save_game_state.
+
+    python replay_middleman.py --trace "recordings/*.jsonl" --instances 4 --pacing recorded
+
+serves 4 games on ports 9999-10002, the ports main.py connects to by default.
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from util import transports
+from util.framing import MESSAGE_STATE, MESSAGE_COMMAND, MESSAGE_RESEND, send_message, receive_message
+from util.log import LOG_LEVEL_VARIABLE, configure_logging, get_logger
+
+logger = get_logger("replay_middleman")
+
+# "fast" answers at once, "recorded" waits the game's recorded response time (--latency where
+# the trace has none), "fixed" always waits --latency
+PACING_MODES = ["fast", "recorded", "fixed"]
+
+
+def load_trace(pattern):
+    """
+    (latency, state) of every recorded state matching a glob pattern, in file name order.
+    latency is the game's recorded response time to the previous command in seconds, None
+    when the trace does not have it. States stay encoded as the bytes sent to the client.
+    """
+    trace = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            if not path.endswith(".jsonl"):
+                trace.append((None, json.dumps(json.load(f)).encode('utf-8')))
+                continue
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "state" in record:
+                    trace.append((record.get("latency"), json.dumps(record["state"]).encode('utf-8')))
+                else:
+                    trace.append((None, line.strip().encode('utf-8')))
+    return trace
+
+
+def response_delay(latency, pacing, default_latency, speed):
+    if pacing == "fast":
+        return 0
+    if pacing == "recorded" and latency is not None:
+        return latency / speed
+    return default_latency / speed
+
+
+def replay(client_socket, trace, position, pacing, default_latency, speed):
+    """
+    Serve the trace from `position` until the client disconnects. Returns the position to
+    continue from and the number of states sent.
+    """
+    sent = 0
+    while True:
+        state = trace[position][1]
+        try:
+            send_message(client_socket, MESSAGE_STATE, sent + 1, state)
+            while True:
+                message_type, answered, command = receive_message(client_socket)
+                if message_type == MESSAGE_RESEND and answered <= sent:
+                    send_message(client_socket, MESSAGE_STATE, sent + 1, state)
+                elif message_type == MESSAGE_COMMAND and answered == sent + 1:
+                    break
+        except (OSError, ConnectionError) as e:
+            # Usually a client that closed with a state still unread
+            logger.info("Connection closed: %s", e)
+            return position, sent
+        logger.debug("Received command: %s", command.decode('utf-8'))
+        sent += 1
+        position = (position + 1) % len(trace)
+        delay = response_delay(trace[position][0], pacing, default_latency, speed)
+        if delay:
+            time.sleep(delay)
+
+
+def serve(server, port, trace, start, pacing, default_latency, speed):
+    """
+    Accept clients on `server` one after the other, each continuing the trace where the last
+    one disconnected, as a middleman keeps playing the same game.
+    """
+    position = start
+    while True:
+        client_socket, addr = server.accept()
+        logger.info("Port %d: accepted connection from %s", port, addr)
+        start_time = time.perf_counter()
+        with client_socket:
+            position, sent = replay(client_socket, trace, position, pacing, default_latency, speed)
+        elapsed = time.perf_counter() - start_time
+        logger.info("Port %d: served %d states in %.1fs (%.0f states/s)", port, sent, elapsed, sent / elapsed if elapsed else 0)
+
+
+def start_instances(trace, instances, port, pacing="fast", default_latency=0.0, speed=1.0, stagger=False, host="0.0.0.0", transport="tcp"):
+    """
+    Serve the trace on `instances` consecutive ports from `port` (0 for any free ports, TCP
+    only) with one daemon thread each. With stagger the instances start at evenly spaced
+    points of the trace instead of all at its first state. Returns the ports.
+    """
+    if not port and transport != "tcp":
+        raise ValueError(f"Transport '{transport}' needs the port of the first instance")
+    ports = []
+    for index in range(instances):
+        server = transports.listen(transport, port + index if port else 0, host)
+        ports.append(server.getsockname()[1] if transport == "tcp" else port + index)
+        start = index * len(trace) // instances if stagger else 0
+        threading.Thread(target=serve, args=(server, ports[-1], trace, start, pacing, default_latency, speed), daemon=True).start()
+    return ports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded CommunicationMod states over the middleman protocol.")
+    parser.add_argument("--trace", default="game_state_*.json", help="Glob of recorded states (.jsonl recordings or .json states)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Replay this many synthetic states when --trace matches nothing")
+    parser.add_argument("--instances", type=int, default=1, help="Number of games, served on consecutive ports")
+    parser.add_argument("--port", type=int, default=9999, help="Port of the first instance")
+    parser.add_argument("--pacing", choices=PACING_MODES, default="fast")
+    parser.add_argument("--latency", type=float, default=0.0, help="Response time in ms for fixed pacing and states without a recorded one")
+    parser.add_argument("--speed", type=float, default=1.0, help="Divides every response time, 2 replays twice as fast")
+    parser.add_argument("--transport", choices=transports.TRANSPORTS, default="tcp", help="Transport the workers connect over")
+    parser.add_argument("--stagger", action="store_true", help="Start the instances at different points of the trace")
+    parser.add_argument("--log-level", default=os.environ.get(LOG_LEVEL_VARIABLE, "INFO"))
+    args = parser.parse_args()
+
+    configure_logging(level=args.log_level)
+    trace = load_trace(args.trace)
+    if not trace and args.synthetic:
+        from benchmarks.sample_states import synthetic_trajectory
+        trace = [(None, json.dumps(state).encode('utf-8')) for state in synthetic_trajectory(args.synthetic)]
+    if not trace:
+        logger.error("No states match %s, record some with middleman_process.py --record or use --synthetic", args.trace)
+        return
+
+    ports = start_instances(trace, args.instances, args.port, args.pacing, args.latency / 1000, args.speed, args.stagger, transport=args.transport)
+    logger.info("Replaying %d states with %s pacing on ports %s", len(trace), args.pacing, ", ".join(map(str, ports)))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
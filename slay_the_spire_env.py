@@ -1,8 +1,11 @@
 import gymnasium as gym
-import copy
 import numpy as np
 from gymnasium import spaces
 from util.tokenizers import screen_type_tokenizer
+from util.action_masks import ActionMetadata, ActionMaskCache
+from util.reward_snapshot import RewardSnapshot
+from util.reward_terms import evaluate_reward
+from util.log import get_logger
 import random
 
 from observations.player_observations import get_player_observation
@@ -14,22 +17,53 @@ from observations.relic_observations import get_relic_observation
 from observations.extra_info_observations import get_extra_info_observation
 from observations.deck_observations import get_deck_observation
 from observations.screen_observations import get_screen_observation
+from observations.observation_layout import OBSERVATION_SHAPES, OBSERVATION_SLICES, empty_observation, empty_flat_observation, observation_views
+from observations.incremental_observations import IncrementalObservationEncoder
+
+logger = get_logger("env")
 
 class SlayTheSpireEnv(gym.Env):
-    def __init__(self, initial_state):
+    def __init__(self, initial_state, incremental_encoding=False, verify_encoding=False, flat_observations=False):
         super(SlayTheSpireEnv, self).__init__()
         self.state = initial_state
         self.previous_state = None
+        # Reward relevant fields of the current and previous state, see update_game_state
+        self.snapshot = RewardSnapshot(initial_state)
+        self.previous_snapshot = None
+        self.reward_terms = {}
         self.previous_action = None
         self.curr_action = None
         self.action_taken = False  # Define the available commands and action space permutations
         self.recent_actions = []  # Store recent actions to avoid loops
         self.recent_action_limit = 5
         self.commands = ['start', 'potion', 'play', 'end', 'proceed', 'return', 'choose', 'confirm', "leave"]
-        self.action_space, self.actions = self.create_action_space()
+        self.action_space, self.actions, self.action_metadata = self.create_action_space()
+        # Masks of recently seen decision states, keyed by a signature of what the mask reads
+        self.action_mask_cache = ActionMaskCache(self.action_metadata)
 
         # Define observation space (preserving the structure you provided)
+        # In flat mode observations are one float32 vector, see observation_layout.OBSERVATION_SLICES
+        self.flat_observations = flat_observations
         self.observation_space = self.create_observation_space()
+        if flat_observations:
+            self.observation_space = self.create_flat_observation_space(self.observation_space)
+
+        # Arrays step() encodes into, they are overwritten by the next step so copy to keep them
+        if flat_observations:
+            self.step_observation = empty_flat_observation()
+            self.step_views = observation_views(self.step_observation)
+        else:
+            self.step_observation = empty_observation()
+
+        # Re-encode only the components that changed since the previous state of this game,
+        # verify_encoding checks every result against a full flatten_observation
+        self.observation_encoder = None
+        if incremental_encoding:
+            self.observation_encoder = IncrementalObservationEncoder(
+                full_encode=self.flatten_observation if verify_encoding else None
+            )
+        # Flat array last encoded into and its component views
+        self.flat_views = (None, None)
 
     def create_action_space(self):
         actions = []
@@ -51,7 +85,8 @@ class SlayTheSpireEnv(gym.Env):
         actions.extend(['END', 'PROCEED', 'RETURN', 'CONFIRM', "LEAVE"])
         for choice_index in range(20):
             actions.append(f'CHOOSE {choice_index}')
-        return spaces.Discrete(len(actions)), actions
+        # Static per-action arrays (command, potion slot, card, target, choice) the mask is computed from
+        return spaces.Discrete(len(actions)), actions, ActionMetadata(actions, self.commands)
 
     def create_observation_space(self):
 
@@ -99,42 +134,44 @@ class SlayTheSpireEnv(gym.Env):
 
         return combined_space
 
-    def flatten_observation(self, state):
+    def create_flat_observation_space(self, dict_space):
+        """
+        Single Box with the bounds of every Dict component, laid out as in OBSERVATION_SLICES.
+        """
+        keys = sorted(OBSERVATION_SLICES, key=lambda key: OBSERVATION_SLICES[key].start)
+        low = np.concatenate([dict_space[key].low.ravel() for key in keys]).astype(np.float32)
+        high = np.concatenate([dict_space[key].high.ravel() for key in keys]).astype(np.float32)
+        return spaces.Box(low=low, high=high, dtype=np.float32)
+
+    def flatten_observation(self, state, out=None):
+        """
+        Encode a CommunicationMod state into the Dict observation.
+
+        When `out` is given (one array per component, e.g. views into a rollout buffer slot)
+        every component is written in place instead of allocating new arrays.
+        """
         if "game_state" not in state:
-            player_observation = np.zeros((24,), dtype=np.float32)
-            hand_observation = np.zeros((10, 8), dtype=np.float32)
-            monster_observation = np.zeros((5, 30), dtype=np.float32)
-            map_observation = np.zeros((100, 4), dtype=np.float32)
-            relic_observation = np.zeros((30, 2), dtype=np.float32)
-            extra_info = np.zeros((5,), dtype=np.float32)
-            potion_observation = np.zeros((5, 4), dtype=np.float32)
-            deck_observation = np.zeros((100, 8), dtype=np.float32) 
-            screen_observation = np.zeros((50,), dtype=np.float32)
-
-            return {
-                "player": player_observation,
-                "hand": hand_observation,
-                "monsters": monster_observation,
-                "map": map_observation,
-                "relics": relic_observation,
-                "deck": deck_observation,
-                "potion": potion_observation,
-                "screen": screen_observation, 
-                "extra_info": extra_info
-            }
+            if out is None:
+                return empty_observation()
+            for component in out.values():
+                component.fill(0)
+            return out
+
+        if out is None:
+            out = dict.fromkeys(OBSERVATION_SHAPES)
 
         game_state = state["game_state"]
         combat_state = game_state.get("combat_state", None)
 
-        player_observation = get_player_observation(game_state)
-        potion_observation = get_potion_observation(game_state)
-        monster_observation = get_monster_observation(game_state)
-        map_observation = get_map_observation(game_state)
-        relic_observation = get_relic_observation(game_state)
-        extra_info_observation = get_extra_info_observation(game_state)
-        hand_observation = get_hand_observation(combat_state)
-        deck_observation = get_deck_observation(state)
-        screen_observation = get_screen_observation(state)
+        player_observation = get_player_observation(game_state, out=out["player"])
+        potion_observation = get_potion_observation(game_state, out=out["potion"])
+        monster_observation = get_monster_observation(game_state, out=out["monsters"])
+        map_observation = get_map_observation(game_state, out=out["map"])
+        relic_observation = get_relic_observation(game_state, out=out["relics"])
+        extra_info_observation = get_extra_info_observation(game_state, out=out["extra_info"])
+        hand_observation = get_hand_observation(combat_state, out=out["hand"])
+        deck_observation = get_deck_observation(game_state, out=out["deck"])
+        screen_observation = get_screen_observation(state, out=out["screen"])
 
         # Combine them into a full observation
         return {
@@ -149,11 +186,35 @@ class SlayTheSpireEnv(gym.Env):
             "extra_info": extra_info_observation,
         }
 
+    def encode_observation(self, state, out=None):
+        """
+        flatten_observation for the states of this env's own game, in order. Uses the
+        incremental encoder when enabled.
+        """
+        if self.observation_encoder is None:
+            return self.flatten_observation(state, out=out)
+        return self.observation_encoder.encode(state, out=out)
+
+    def encode_flat_observation(self, state, out=None):
+        """
+        encode_observation into one flat float32 vector (e.g. a flat rollout buffer slot), every
+        component is written through a zero-copy view of `out`.
+        """
+        if out is None:
+            out = empty_flat_observation()
+        # An array encoded into again (a vec env row, the frame of a StateFrameEncoder) gets the
+        # same views, the incremental encoder then leaves its unchanged components alone
+        if self.flat_views[0] is not out:
+            self.flat_views = (out, observation_views(out))
+        self.encode_observation(state, out=self.flat_views[1])
+        return out
+
     def reset(self, seed=None, options=None):
         # Reset internal variables
         self.current_command = None
         self.current_args = {}
         self.previous_state = None
+        self.previous_snapshot = None
         self.curr_action = None
         self.action_taken = False
 
@@ -162,12 +223,32 @@ class SlayTheSpireEnv(gym.Env):
             raise ValueError("Initial state must be provided by the external process.")
 
         # Flatten the initial observation from the state
-        observation = self.flatten_observation(self.state)
+        if self.flat_observations:
+            observation = empty_flat_observation()
+            self.flatten_observation(self.state, out=observation_views(observation))
+        else:
+            observation = self.flatten_observation(self.state)
 
         # Return the observation and an empty dictionary (or any relevant reset info)
         return observation, {}
 
     def step(self, action):
+        reward, done, info = self.take_action(action)
+
+        # Flatten the observation based on the new game state into the reused step arrays
+        if self.flat_observations:
+            self.encode_observation(self.state, out=self.step_views)
+            observation = self.step_observation
+        else:
+            observation = self.encode_observation(self.state, out=self.step_observation)
+
+        return observation, reward, done, info
+
+    def take_action(self, action):
+        """
+        The bookkeeping of step() without encoding the observation, for callers that encode
+        the state themselves (run_env, SlayTheSpireVecEnv). Returns (reward, done, info).
+        """
         self.previous_action = self.curr_action
         self.curr_action = action
 
@@ -178,6 +259,8 @@ class SlayTheSpireEnv(gym.Env):
 
         # Calculate the reward based on the action taken and state transition
         reward = self.calculate_reward()
+        if self.reward_terms:
+            logger.debug("Reward %.2f for %s: %s", reward, self.actions[self.previous_action], self.reward_terms)
 
         # Check if the episode is done
         done = self.check_if_done()
@@ -186,10 +269,7 @@ class SlayTheSpireEnv(gym.Env):
         self.current_command = None
         self.current_args = {}
 
-        # Flatten the observation based on the new game state
-        observation = self.flatten_observation(self.state)
-
-        return observation, reward, done, {}
+        return reward, done, {"reward_terms": self.reward_terms}
 
     def get_valid_actions(self):
         available_commands = self.state.get('available_commands', [])
@@ -197,242 +277,55 @@ class SlayTheSpireEnv(gym.Env):
         return valid_actions
 
     def update_game_state(self, state):
-        self.previous_state = copy.deepcopy(self.state) 
+        # The previous state is only kept by reference, the reward compares snapshots taken
+        # when each state arrived
+        self.previous_state = self.state
+        self.previous_snapshot = self.snapshot
+        self.snapshot = RewardSnapshot(state, self.previous_snapshot)
         self.state = state
 
+    def update_from_frame(self, frame):
+        """
+        update_game_state for a StateFrame (util/state_frames.py), the middleman took the
+        snapshot. self.state is the frame's state, raw only for the tracked screens.
+        """
+        self.previous_state = self.state
+        self.previous_snapshot = self.snapshot
+        self.snapshot = frame.snapshot
+        self.state = frame.state
+
     def calculate_reward(self):
-        reward = 0
-        invalid_action_mask = self.get_invalid_action_mask(self.previous_state)
+        """
+        Sum of the registered reward terms (util/reward_terms.py) for the transition from the
+        previous to the current state, credited to the previous action. The value of every
+        term is kept in self.reward_terms, step() returns it in info.
+        """
+        self.reward_terms = {}
         # Check if previous_state and current state exist
-        if self.previous_state is None or self.state is None or self.previous_action is None:
-            return reward
-
-        previous_game_state = self.previous_state.get('game_state', None)
-        current_game_state = self.state.get('game_state', None)
-
-        # Check if game states exist
-        if previous_game_state is None or current_game_state is None:
-            return reward
-
-        previous_combat_state = previous_game_state.get('combat_state', {})
-        current_combat_state = current_game_state.get('combat_state', {})
-        previous_monsters = previous_combat_state.get('monsters', [])
-        current_monsters = current_combat_state.get('monsters', [])
-
-        if len(previous_combat_state) > 0:
-            for prev_monster, curr_monster in zip(previous_monsters, current_monsters):
-                if curr_monster.get('current_hp', 0) < prev_monster.get('current_hp', 0):
-                    print("Monster Damage Reward ", self.actions[self.previous_action])
-                    max_hp = curr_monster.get('max_hp', 1)
-                    health_diff = prev_monster.get('current_hp', 0) - curr_monster.get('current_hp', 0)
-                    percentage_damage = health_diff / max_hp
-                    reward += percentage_damage * 10
-                    if curr_monster.get('current_hp', 0) == 0 and prev_monster.get('current_hp', 0) > 0:
-                        print("Monster Kill Reward ", self.actions[self.previous_action])
-                        reward += 20
-
-        if self.previous_state.get("screen_type", None) == "NONE" and self.state.get("screen_type", None) == "COMBAT_REWARD":
-            print("Combat Ended Reward ")
-            reward += 40
-
-        # Penalty for taking damage
-        previous_hp = previous_game_state.get('current_hp', 0)
-        current_hp = current_game_state.get('current_hp', 0)
-        if current_hp < previous_hp:
-            print("HP Damage Penalty ", self.actions[self.previous_action])
-            reward -= (previous_hp - current_hp) * 3
-                
-        # Check for floor progression
-        if current_game_state.get('floor', 0) > previous_game_state.get('floor', 0):
-            print("Floor Climbing Reward ", self.actions[self.previous_action])
-            reward += 10
-                
-        # Additional reward for potion use
-        if self.actions[self.previous_action].startswith('POTION Use'):
-            print("Potion Use Reward ", self.actions[self.previous_action])
-            reward += 10
-
-        if self.actions[self.previous_action].startswith('POTION Discard'):
-            print("Potion Discard Penalty ", self.actions[self.previous_action])
-            reward -= 10
-
-        # Reward for acquiring a relic
-        previous_relics = previous_game_state.get('relics', [])
-        current_relics = current_game_state.get('relics', [])
-        if len(current_relics) > len(previous_relics):
-            print("Relic taken reward ", self.actions[self.previous_action])
-            reward += 50  # Adjust the reward value as you see fit
-
-        # Reward/Penalty for gold changes
-        previous_gold = previous_game_state.get('gold', 0)
-        current_gold = current_game_state.get('gold', 0)
-        gold_difference = current_gold - previous_gold
-        if gold_difference > 0:
-            print("Gold Gained Reward ", self.actions[self.previous_action])
-            reward += (gold_difference / 10)  # 1 point for each 10 gold gained
-        elif gold_difference < 0:
-            print("Gold Lost Penalty ", self.actions[self.previous_action])
-            reward += (gold_difference * 0.05)  # -0.05 points for each gold lost
-
-        # Reward for adding a card to the deck
-        previous_deck = previous_game_state.get('deck', [])
-        current_deck = current_game_state.get('deck', [])
-        if len(current_deck) > len(previous_deck):
-            new_card = current_deck[-1]  # Assuming the new card is added at the end
-            rarity = new_card.get('rarity', 'COMMON').upper()  # Default to 'COMMON' if rarity is not found
-            if rarity == 'COMMON':
-                print("Common Card Reward ", self.actions[self.previous_action])
-                reward += 3
-            elif rarity == 'UNCOMMON':
-                print("Uncommon Card Reward", self.actions[self.previous_action])
-                reward += 4.3
-            elif rarity == 'RARE':
-                print("Rare Card Reward ", self.actions[self.previous_action])
-                reward += 10
-
-        # Reward for removing CURSE cards from the deck
-        previous_curse_count = sum(1 for card in previous_deck if card.get('rarity', '').upper() == 'CURSE')
-        current_curse_count = sum(1 for card in current_deck if card.get('rarity', '').upper() == 'CURSE')
-        if current_curse_count < previous_curse_count:
-            print("Curse Removal Reward ", self.actions[self.previous_action])
-            reward += 15
-        
-        # Small penalty per action to encourage efficiency
-        reward -= 0.1
-
-        # Return the calculated reward
-        return reward
-    
-    def get_invalid_action_mask(self, state):
-        invalid_action_mask = np.zeros(len(self.actions), dtype=bool)
+        if self.previous_snapshot is None or self.state is None or self.previous_action is None:
+            return 0
 
-        # Process available commands
-        available_commands = state.get('available_commands', [])
-        for i, action in enumerate(self.actions):
-            command = action.split()[0].lower()
-            if command not in available_commands:
-                invalid_action_mask[i] = True
+        self.reward_terms = evaluate_reward(self.previous_snapshot, self.snapshot, self.previous_action, self.action_metadata)
+        return sum(self.reward_terms.values())
 
-        # Check if 'game_state' exists
-        game_state = state.get('game_state', None)
-        if not game_state:
-            # If game_state doesn't exist, assume that only START commands are valid
-            for i, action in enumerate(self.actions):
-                if action not in ["START IRONCLAD 0", "START SILENT 0"]:
-                    invalid_action_mask[i] = True
-            return ~invalid_action_mask  # Invert mask before returning
-
-        # Check if all potion slots are filled
-        potions = game_state.get('potions', [])
-        all_slots_filled = all(potion['id'] != "Potion Slot" for potion in potions)
-        
-        # Handle Potion actions
-        for i, action in enumerate(self.actions):
-            parts = action.split()
-            if parts[0].lower() == 'potion':
-                use_discard = 0 if parts[1].lower() == 'use' else 1
-                potion_slot = int(parts[2])
-                
-                if potion_slot >= len(potions):
-                    invalid_action_mask[i] = True
-                    continue
-
-                potion = potions[potion_slot]
-
-                if not potion['can_use'] and use_discard == 0:
-                    invalid_action_mask[i] = True
-                    continue
-                if not potion['can_discard'] and use_discard == 1:
-                    invalid_action_mask[i] = True
-                    continue
-                if potion['requires_target']:
-                    if len(parts) < 4:
-                        invalid_action_mask[i] = True
-                        continue
-                    
-                    target_index = int(parts[3])
-                    monsters = game_state.get('combat_state', {}).get('monsters', [])
-                    valid_monster_indices = [idx for idx, monster in enumerate(monsters) if not monster.get('is_gone', False)]
-                    
-                    if target_index not in valid_monster_indices:
-                        invalid_action_mask[i] = True
-                        continue
-
-                if not potion['requires_target'] and len(parts) == 4:
-                    invalid_action_mask[i] = True
-
-        # Handle choice-related actions
-        choice_list = game_state.get('choice_list', [])
-        screen_type = game_state.get('screen_type', '')
-        if len(choice_list) != 0:
-            for i, action in enumerate(self.actions):
-                parts = action.split()
-                if parts[0].lower() == 'choose':
-                    choice_index = int(parts[1])
-                    if choice_index >= len(choice_list):
-                        invalid_action_mask[i] = True
-                        continue
-                    
-                    # Invalidate choosing a potion if all slots are filled
-                    if screen_type == "COMBAT_REWARD" and all_slots_filled:
-                        if "potion" in choice_list[choice_index].lower():
-                            invalid_action_mask[i] = True
-
-        # Prevent "RETURN" action immediately after "PROCEED"
-        if self.previous_action is not None:
-            previous_command = self.actions[self.previous_action].split()[0].lower()
-            if previous_command == 'proceed' or previous_command == "choose" or previous_command == "return":
-                for i, action in enumerate(self.actions):
-                    if action.split()[0].lower() == 'return':
-                        invalid_action_mask[i] = True
-            if previous_command == 'leave':
-                for i, action in enumerate(self.actions):
-                    if action.lower() == 'choose 0':
-                        invalid_action_mask[i] = True
-
-        # Handle combat-related actions
-        combat_state = game_state.get('combat_state', None)
-        if not combat_state:
-            # If combat_state doesn't exist, restrict combat-related actions
-            for i, action in enumerate(self.actions):
-                if action.startswith('PLAY'):
-                    invalid_action_mask[i] = True
-            return ~invalid_action_mask  # Invert mask before returning
-
-        hand = combat_state.get('hand', [])
-        monsters = combat_state.get('monsters', [])
-        has_playable_cards = any(card.get('is_playable') for card in hand)
-
-        # If no action has been taken and there are playable cards, invalidate "END"
-        if not self.action_taken and has_playable_cards:
-            for i, action in enumerate(self.actions):
-                if action.lower() == 'end':
-                    invalid_action_mask[i] = True
-
-        valid_monster_indices = [i for i, monster in enumerate(monsters) if not monster['is_gone']]
-        for i, action in enumerate(self.actions):
-            parts = action.split()
-            if parts[0].lower() == 'play':
-                card_index = int(parts[1]) - 1
-                if card_index >= len(hand):
-                    invalid_action_mask[i] = True
-                    continue
-                card = hand[card_index]
-                if not card['is_playable']:
-                    invalid_action_mask[i] = True
-                    continue
-                if card['has_target'] and len(parts) < 3:
-                    invalid_action_mask[i] = True
-                    continue
-                if not card['has_target'] and len(parts) == 3:
-                    invalid_action_mask[i] = True
-                    continue
-                if len(parts) == 3:
-                    target_index = int(parts[2])
-                    if target_index not in valid_monster_indices:
-                        invalid_action_mask[i] = True
-
-        return ~invalid_action_mask  # Invert mask before returning
+    def get_invalid_action_mask(self, state):
+        """
+        Boolean mask of the legal actions in `state` (True = allowed), computed from the static
+        action metadata built by create_action_space and cached per decision state signature.
+        """
+        return self.action_mask_cache.valid_mask(state, self.previous_action, self.action_taken)
+
+    def get_frame_action_mask(self, frame):
+        """
+        get_invalid_action_mask for a StateFrame: the middleman's mask with the rules on this
+        env's previous action applied.
+        """
+        mask = frame.mask
+        if frame.decision_state:
+            previous_invalid = self.action_metadata.previous_action_invalid(self.previous_action)
+            if previous_invalid is not None:
+                mask &= ~previous_invalid
+        return mask
 
     def check_if_done(self):
         game_state = self.state.get("game_state", None)
@@ -0,0 +1,35 @@
+"""
+The vectorized action mask against the original per-action-string implementation.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import random
+
+import numpy as np
+
+from slay_the_spire_env import SlayTheSpireEnv
+from benchmarks.sample_states import benchmark_states
+from benchmarks.action_mask import reference_invalid_action_mask, random_state, outcome
+
+
+def assert_same_masks(env, states, rng):
+    for state in states:
+        env.previous_action = rng.choice([None, rng.randrange(len(env.actions))])
+        env.action_taken = rng.random() < 0.5
+        expected = outcome(reference_invalid_action_mask, env, state)
+        actual = outcome(lambda env, state: env.get_invalid_action_mask(state), env, state)
+        # Malformed states must raise the same exception
+        if isinstance(expected, str) or isinstance(actual, str):
+            assert actual == expected, (state, env.previous_action, env.action_taken)
+        else:
+            assert actual.dtype == expected.dtype and np.array_equal(actual, expected), (state, env.previous_action, env.action_taken)
+
+
+def test_vectorized_masks_equal_the_reference():
+    rng = random.Random(0)
+    env = SlayTheSpireEnv({})
+    random_states = [random_state(rng, env) for _ in range(2000)]
+    # Revisited states are answered by the mask cache
+    revisits = [rng.choice(random_states[:rng.randint(1, 50)]) for _ in range(500)]
+    assert_same_masks(env, random_states + revisits + benchmark_states(200), rng)
@@ -0,0 +1,103 @@
+"""
+Resending a state the worker could not decode, and going from one episode to the next
+through the middleman.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import json
+import os
+import socket
+import threading
+
+import middleman_process
+from middleman_process import Middleman
+from util.communication import GameConnection, handle_end_of_episode
+from util.framing import MESSAGE_STATE, MESSAGE_RESEND, send_message, receive_message
+
+
+def test_corrupted_state_is_requested_again():
+    worker_socket, middleman_socket = socket.socketpair()
+    worker_socket.settimeout(5)
+    middleman_socket.settimeout(5)
+    connection = GameConnection(worker_socket)
+    state = {"in_game": True, "game_state": {"screen_type": "MAP"}}
+
+    send_message(middleman_socket, MESSAGE_STATE, 1, b'{"in_game": tr')
+    # What the middleman answers the resend request with
+    send_message(middleman_socket, MESSAGE_STATE, 1, json.dumps(state).encode('utf-8'))
+
+    assert connection.receive_state() == state
+    assert connection.last_sequence == 1
+    # The request names the last state the worker has, so the middleman sees it is behind
+    assert receive_message(middleman_socket) == (MESSAGE_RESEND, 0, b'')
+    worker_socket.close()
+    middleman_socket.close()
+
+
+def test_middleman_resends_the_state_the_worker_could_not_decode():
+    worker_socket, middleman_socket = socket.socketpair()
+    worker_socket.settimeout(5)
+    middleman = Middleman(server=None)
+    middleman.client = middleman_socket
+    state_json = json.dumps({"in_game": True, "game_state": {"screen_type": "MAP"}})
+
+    middleman.handle_state(state_json)
+    assert receive_message(worker_socket) == (MESSAGE_STATE, 1, state_json.encode('utf-8'))
+
+    middleman.handle_message(MESSAGE_RESEND, 0, b'')
+    assert receive_message(worker_socket) == (MESSAGE_STATE, 1, state_json.encode('utf-8'))
+    worker_socket.close()
+    middleman_socket.close()
+
+
+def serve_game(states, commands, stdin_writer, stdout_reader):
+    """
+    A game answering every command the middleman writes with the next state.
+    """
+    with stdin_writer, stdout_reader:
+        stdin_writer.write(json.dumps(states[0]) + "\n")
+        stdin_writer.flush()
+        for state in states[1:]:
+            commands.append(stdout_reader.readline().strip())
+            stdin_writer.write(json.dumps(state) + "\n")
+            stdin_writer.flush()
+
+
+def test_two_episodes_through_the_middleman(monkeypatch):
+    states = [
+        {"in_game": True, "game_state": {"screen_type": "NONE", "floor": 1}},
+        {"in_game": True, "game_state": {"screen_type": "GAME_OVER", "floor": 1}},
+        {"in_game": True, "game_state": {"screen_type": "GAME_OVER", "floor": 1, "screen_state": {"victory": False}}},
+        {"in_game": False},
+        {"in_game": True, "game_state": {"screen_type": "NONE", "floor": 0}},
+        {"in_game": True, "game_state": {"screen_type": "NONE", "floor": 1}},
+    ]
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    monkeypatch.setattr(middleman_process, "open_stdin", lambda: stdin_read)
+    monkeypatch.setattr(middleman_process.sys, "stdout", os.fdopen(stdout_write, "w"))
+    server = socket.create_server(("localhost", 0))
+    middleman = threading.Thread(target=Middleman(server).run, daemon=True)
+    middleman.start()
+    commands = []
+    game = threading.Thread(target=serve_game, args=(states, commands, os.fdopen(stdin_write, "w"), os.fdopen(stdout_read)), daemon=True)
+    game.start()
+
+    connection = GameConnection(socket.create_connection(server.getsockname(), timeout=5))
+    # First episode: a combat action, then the action on the game over screen ends it
+    assert connection.receive_state() == states[0]
+    connection.send_command("END")
+    assert connection.receive_state() == states[1]
+    connection.send_command("PROCEED")
+
+    # The next episode starts from the state handle_end_of_episode returns
+    assert handle_end_of_episode(connection) == states[4]
+    connection.send_command("END")
+    assert connection.receive_state() == states[5]
+    assert commands == ["END", "PROCEED", "PROCEED", "PROCEED", "END"]
+
+    game.join(5)
+    middleman.join(5)
+    connection.close()
+    server.close()
@@ -0,0 +1,20 @@
+"""
+Decoding framed messages in the middleman's event loop.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+from util.framing import MESSAGE_COMMAND, MessageBuffer, encode_message
+
+
+def test_messages_handed_out_are_not_returned_again_after_an_early_stop():
+    buffer = MessageBuffer()
+    buffer.feed(encode_message(MESSAGE_COMMAND, 1, b'END') + encode_message(MESSAGE_COMMAND, 2, b'PROCEED'))
+
+    # The consumer stops after the first message, as the middleman does on a ConnectionError
+    for message in buffer.messages():
+        assert message == (MESSAGE_COMMAND, 1, b'END')
+        break
+
+    assert list(buffer.messages()) == [(MESSAGE_COMMAND, 2, b'PROCEED')]
+    assert list(buffer.messages()) == []
@@ -0,0 +1,24 @@
+"""
+Encoding observations into preallocated buffers.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+from slay_the_spire_env import SlayTheSpireEnv
+from observations.observation_layout import empty_observation
+from benchmarks.sample_states import benchmark_states, menu_state
+from benchmarks.observation_allocations import retained_array_bytes_per_step
+
+
+def test_encoding_into_a_rollout_buffer_slot_allocates_no_arrays():
+    env = SlayTheSpireEnv({})
+    states = benchmark_states(50) + [menu_state()]
+    buffer = empty_observation(batch_size=1)
+    slot = {key: view[0] for key, view in buffer.items()}
+
+    assert retained_array_bytes_per_step(lambda state: env.flatten_observation(state, out=slot), states) == 0
+    # run_env's path, through the incremental encoder
+    incremental_env = SlayTheSpireEnv({}, incremental_encoding=True)
+    assert retained_array_bytes_per_step(lambda state: incremental_env.encode_observation(state, out=slot), states) == 0
+    # The measurement does see the arrays of the allocating path
+    assert retained_array_bytes_per_step(env.flatten_observation, states) > 0
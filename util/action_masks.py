@@ -0,0 +1,281 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# Actions allowed when there is no game_state (main menu)
+START_ACTIONS = ("START IRONCLAD 0", "START SILENT 0")
+
+MAX_POTION_SLOTS = 5
+MAX_HAND_ACTIONS = 9
+MAX_TARGETS = 5
+MAX_CHOICES = 20
+
+NO_INDEX = -1
+
+
+class ActionMetadata:
+    """
+    Static per-action arrays parsed once from the action strings of create_action_space, so the
+    legal action mask of a state is a handful of boolean array operations instead of splitting
+    and parsing every action string on every call.
+
+    Every array has one entry per action: `command` (index into `commands`), `potion_slot`,
+    `potion_discard`, `card_index` (0 based hand index), `target` and `choice`, with NO_INDEX
+    where an action has no such part.
+    """
+
+    def __init__(self, actions, commands):
+        self.commands = list(commands)
+        self.command = np.array([self.commands.index(action.split()[0].lower()) for action in actions])
+        self.potion_slot = np.full(len(actions), NO_INDEX)
+        self.potion_discard = np.zeros(len(actions), dtype=bool)
+        self.card_index = np.full(len(actions), NO_INDEX)
+        self.target = np.full(len(actions), NO_INDEX)
+        self.choice = np.full(len(actions), NO_INDEX)
+
+        for i, action in enumerate(actions):
+            parts = action.split()
+            command = parts[0].lower()
+            if command == "potion":
+                self.potion_discard[i] = parts[1].lower() != "use"
+                self.potion_slot[i] = int(parts[2])
+                if len(parts) == 4:
+                    self.target[i] = int(parts[3])
+            elif command == "play":
+                self.card_index[i] = int(parts[1]) - 1
+                if len(parts) == 3:
+                    self.target[i] = int(parts[2])
+            elif command == "choose":
+                self.choice[i] = int(parts[1])
+
+        self.is_potion = self.potion_slot != NO_INDEX
+        self.is_play = np.array([action.startswith("PLAY") for action in actions])
+        self.is_choose = self.choice != NO_INDEX
+        self.is_return = self.command == self.commands.index("return")
+        self.is_end = np.array([action.lower() == "end" for action in actions])
+        self.is_choose_zero = np.array([action.lower() == "choose 0" for action in actions])
+        self.is_start = np.array([action in START_ACTIONS for action in actions])
+        self.has_target = self.target != NO_INDEX
+        self.is_potion_use = self.is_potion & ~self.potion_discard
+        self.is_potion_discard = self.is_potion & self.potion_discard
+
+        # Indices that are safe to use on per-state vectors, only read where the action has the part
+        self.potion_slot_index = np.maximum(self.potion_slot, 0)
+        self.card_index_index = np.maximum(self.card_index, 0)
+        self.target_index = np.maximum(self.target, 0)
+        self.choice_index = np.maximum(self.choice, 0)
+
+    def command_of(self, action):
+        return self.commands[self.command[action]]
+
+    def previous_action_invalid(self, previous_action):
+        """
+        Actions the previous action rules out whatever the state (RETURN after PROCEED, CHOOSE
+        or RETURN, CHOOSE 0 after LEAVE), None when it rules out none. Only applies to states
+        with a game_state.
+        """
+        if previous_action is None:
+            return None
+        previous_command = self.command_of(previous_action)
+        if previous_command in ('proceed', 'choose', 'return'):
+            return self.is_return
+        if previous_command == 'leave':
+            return self.is_choose_zero
+        return None
+
+    def valid_mask(self, state, previous_action=None, action_taken=False):
+        """
+        Boolean mask of the legal actions in `state`, True where an action may be taken.
+        `previous_action` is the action index the "no RETURN after PROCEED/CHOOSE/RETURN" and
+        "no CHOOSE 0 after LEAVE" rules look at.
+        """
+        available_commands = state.get('available_commands', [])
+        command_available = np.array([command in available_commands for command in self.commands])
+        invalid = ~command_available[self.command]
+
+        game_state = state.get('game_state', None)
+        if not game_state:
+            # Without a game_state only the START commands are valid
+            return ~invalid & self.is_start
+
+        # Potions: usable/discardable per slot, targeted actions only for potions that need a
+        # target and an alive monster, untargeted actions only for potions that don't
+        potions = game_state.get('potions', [])
+        all_slots_filled = all(potion['id'] != "Potion Slot" for potion in potions)
+
+        slot_exists = np.zeros(MAX_POTION_SLOTS, dtype=bool)
+        can_use = np.zeros(MAX_POTION_SLOTS, dtype=bool)
+        can_discard = np.zeros(MAX_POTION_SLOTS, dtype=bool)
+        requires_target = np.zeros(MAX_POTION_SLOTS, dtype=bool)
+        for slot, potion in enumerate(potions[:MAX_POTION_SLOTS]):
+            slot_exists[slot] = True
+            can_use[slot] = bool(potion['can_use'])
+            can_discard[slot] = bool(potion['can_discard'])
+            requires_target[slot] = bool(potion['requires_target'])
+
+        potion_target_alive = np.zeros(MAX_TARGETS, dtype=bool)
+        if (requires_target & (can_use | can_discard)).any():
+            monsters = game_state.get('combat_state', {}).get('monsters', [])
+            for index, monster in enumerate(monsters[:MAX_TARGETS]):
+                potion_target_alive[index] = not monster.get('is_gone', False)
+
+        slot = self.potion_slot_index
+        potion_invalid = (
+            ~slot_exists[slot]
+            | (~self.potion_discard & ~can_use[slot])
+            | (self.potion_discard & ~can_discard[slot])
+            | (requires_target[slot] & ~self.has_target)
+            | (requires_target[slot] & self.has_target & ~potion_target_alive[self.target_index])
+            | (~requires_target[slot] & self.has_target)
+        )
+        invalid |= self.is_potion & potion_invalid
+
+        # Choices: only indices in the choice list, and no potion rewards with full potion slots
+        choice_list = game_state.get('choice_list', [])
+        screen_type = game_state.get('screen_type', '')
+        if len(choice_list) != 0:
+            choice_valid = np.zeros(MAX_CHOICES, dtype=bool)
+            choice_valid[:len(choice_list)] = True
+            if screen_type == "COMBAT_REWARD" and all_slots_filled:
+                for index, choice in enumerate(choice_list[:MAX_CHOICES]):
+                    if "potion" in choice.lower():
+                        choice_valid[index] = False
+            invalid |= self.is_choose & ~choice_valid[self.choice_index]
+
+        # Prevent "RETURN" action immediately after "PROCEED"
+        previous_invalid = self.previous_action_invalid(previous_action)
+        if previous_invalid is not None:
+            invalid |= previous_invalid
+
+        # Combat: outside of combat no card can be played
+        combat_state = game_state.get('combat_state', None)
+        if not combat_state:
+            return ~(invalid | self.is_play)
+
+        hand = combat_state.get('hand', [])
+        monsters = combat_state.get('monsters', [])
+
+        # If no action has been taken and there are playable cards, END is not allowed
+        if not action_taken and any(card.get('is_playable') for card in hand):
+            invalid |= self.is_end
+
+        target_alive = np.zeros(MAX_TARGETS, dtype=bool)
+        for index, is_alive in enumerate([not monster['is_gone'] for monster in monsters][:MAX_TARGETS]):
+            target_alive[index] = is_alive
+
+        card_exists = np.zeros(MAX_HAND_ACTIONS, dtype=bool)
+        playable = np.zeros(MAX_HAND_ACTIONS, dtype=bool)
+        card_has_target = np.zeros(MAX_HAND_ACTIONS, dtype=bool)
+        for index, card in enumerate(hand[:MAX_HAND_ACTIONS]):
+            card_exists[index] = True
+            playable[index] = bool(card['is_playable'])
+            if playable[index]:
+                card_has_target[index] = bool(card['has_target'])
+
+        card = self.card_index_index
+        play_invalid = (
+            ~card_exists[card]
+            | ~playable[card]
+            | (card_has_target[card] != self.has_target)
+            | (self.has_target & ~target_alive[self.target_index])
+        )
+        invalid |= self.is_play & play_invalid
+
+        return ~invalid
+
+
+def single_valid_action(mask):
+    """
+    Index of the only legal action of a mask, None when there are several (or none). States
+    like these (PROCEED after rewards, CONFIRM, forced choices) need no policy decision.
+    """
+    if np.count_nonzero(mask) != 1:
+        return None
+    return int(mask.argmax())
+
+
+def mask_signature(state, previous_command, action_taken):
+    """
+    Compact hashable summary of exactly what ActionMetadata.valid_mask reads from a state, two
+    states with the same signature have the same legal actions. Raises on malformed states
+    the same way valid_mask does.
+    """
+    available_commands = tuple(state.get('available_commands', []))
+    game_state = state.get('game_state', None)
+    if not game_state:
+        return available_commands, None
+
+    potions = game_state.get('potions', [])
+    all_slots_filled = all(potion['id'] != "Potion Slot" for potion in potions)
+    potion_flags = tuple(
+        (bool(potion['can_use']), bool(potion['can_discard']), bool(potion['requires_target']))
+        for potion in potions[:MAX_POTION_SLOTS]
+    )
+
+    choice_list = game_state.get('choice_list', [])
+    potion_choices = None
+    if game_state.get('screen_type', '') == "COMBAT_REWARD" and all_slots_filled:
+        potion_choices = tuple("potion" in choice.lower() for choice in choice_list[:MAX_CHOICES])
+
+    # A None combat_state (as opposed to a missing or empty one) fails potion targeting
+    combat_state = game_state.get('combat_state', {})
+    if combat_state is None:
+        combat = None
+    elif not combat_state:
+        combat = ()
+    else:
+        hand = combat_state.get('hand', [])
+        combat = (
+            any(card.get('is_playable') for card in hand),
+            tuple((True, bool(card['has_target'])) if card['is_playable'] else (False, False) for card in hand[:MAX_HAND_ACTIONS]),
+            tuple(not monster['is_gone'] for monster in combat_state.get('monsters', [])),
+        )
+
+    return (available_commands, potion_flags, all_slots_filled, len(choice_list), potion_choices,
+            combat, previous_command, bool(action_taken))
+
+
+class ActionMaskCache:
+    """
+    Bounded LRU cache of legal action masks keyed by mask_signature. Consecutive states often
+    share their legal actions (menus, PROCEED/CONFIRM screens, combat turns where only HP
+    changed), those skip the mask computation entirely.
+    """
+
+    def __init__(self, metadata, maxsize=1024):
+        self.metadata = metadata
+        self.maxsize = maxsize
+        self.masks = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def valid_mask(self, state, previous_action=None, action_taken=False):
+        """
+        Same result as ActionMetadata.valid_mask, returns a new array the caller may modify.
+        """
+        previous_command = self.metadata.command_of(previous_action) if previous_action is not None else None
+        try:
+            key = mask_signature(state, previous_command, action_taken)
+        except (AttributeError, KeyError, TypeError):
+            # Malformed state, let the full computation raise (or answer) as it would uncached
+            return self.metadata.valid_mask(state, previous_action, action_taken)
+
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.masks.move_to_end(key)
+            self.hits += 1
+            return mask.copy()
+
+        self.misses += 1
+        mask = self.metadata.valid_mask(state, previous_action, action_taken)
+        self.masks[key] = mask.copy()
+        if len(self.masks) > self.maxsize:
+            self.masks.popitem(last=False)
+        return mask
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        return f"action masks {self.hit_rate():.0%} ({self.hits} hits, {self.misses} misses, {len(self.masks)} cached)"
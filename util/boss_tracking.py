@@ -1,6 +1,9 @@
 from sqlalchemy.orm import Session
 from db.models import Game
 from db.session import SessionLocal
+from util.log import get_logger
+
+logger = get_logger("boss_tracking")
 
 def update_boss_count(game_state, game_id):
     """
@@ -13,9 +16,9 @@ def update_boss_count(game_state, game_id):
         if game:
             game.boss_defated += 1
         db.commit()
-        print("Boss count updated in the database.")
+        logger.debug("Boss count updated in the database.")
 
         db.close()
 
     except Exception as e:
-        print(f"Error while updating boss count: {e}")
\ No newline at end of file
+        logger.error("Error while updating boss count: %s", e)
\ No newline at end of file
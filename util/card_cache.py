@@ -0,0 +1,59 @@
+import functools
+from operator import itemgetter
+
+# Every attribute an encoded card row is built from. Name, type and rarity normally follow
+# from the id, they are part of the key so a modded or transformed card can't hit a stale row
+CARD_KEY_FIELDS = ("id", "upgrades", "cost", "is_playable", "exhausts", "ethereal", "has_target", "name", "type", "rarity")
+CARD_ROW_CACHE_SIZE = 4096
+
+# Placeholder for an attribute missing from the card, so encoders still apply their defaults
+_MISSING = object()
+
+_card_key = itemgetter(*CARD_KEY_FIELDS)
+
+
+@functools.lru_cache(maxsize=CARD_ROW_CACHE_SIZE)
+def _card_row(encode, key):
+    # Only runs on a miss, the encoders read nothing but the key attributes
+    card = {field: value for field, value in zip(CARD_KEY_FIELDS, key) if value is not _MISSING}
+    return tuple(encode(card))
+
+
+def cached_card_row(encode):
+    """
+    Decorator routing a card row encoder through the shared bounded LRU cache of card rows
+    (hand, deck, grid, hand select and card reward). Cached rows are tuples so no caller can
+    modify them, the undecorated encoder stays available as `.uncached`.
+    """
+    @functools.wraps(encode)
+    def cached(card):
+        try:
+            key = _card_key(card)
+        except KeyError:
+            key = tuple(card.get(field, _MISSING) for field in CARD_KEY_FIELDS)
+        try:
+            return _card_row(encode, key)
+        except TypeError:
+            # Unhashable attribute values can't be cached
+            return tuple(encode(card))
+
+    cached.uncached = encode
+    return cached
+
+
+def card_row_cache_info():
+    """
+    Hits, misses, maxsize and current size of the card row cache.
+    """
+    return _card_row.cache_info()
+
+
+def clear_card_row_cache():
+    _card_row.cache_clear()
+
+
+def card_row_cache_report():
+    info = _card_row.cache_info()
+    lookups = info.hits + info.misses
+    hit_rate = info.hits / lookups if lookups else 0.0
+    return f"card rows {hit_rate:.0%} ({info.hits} hits, {info.misses} misses, {info.currsize} cached)"
@@ -3,6 +3,9 @@ from db.models import CardPicked, CardPerformance
 from db.session import SessionLocal
 import json
 import math
+from util.log import get_logger
+
+logger = get_logger("card_tracking")
 
 def track_card_pick(game_state, action, game_id):
     """
@@ -35,11 +38,11 @@ def track_card_pick(game_state, action, game_id):
                 db.commit()
                 db.close()
 
-                print(f"Card '{chosen_card['name']}' picked and added to the database with options {other_options}.")
+                logger.debug("Card '%s' picked and added to the database with options %s.", chosen_card['name'], other_options)
             else:
-                print("Chosen index is out of range.")
+                logger.warning("Chosen index is out of range.")
         except (IndexError, ValueError):
-            print("Error parsing chosen card index from action.")
+            logger.warning("Error parsing chosen card index from action.")
 
 def track_card_performance(game_state, floor_reached, won):
     """
@@ -99,7 +102,7 @@ def track_card_performance(game_state, floor_reached, won):
 
         db.commit()
     except Exception as e:
-        print(f"Error updating card performance: {e}")
+        logger.error("Error updating card performance: %s", e)
         db.rollback()
     finally:
         db.close()
@@ -2,6 +2,9 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 from db.models import Game
 from db.session import SessionLocal
+from util.log import get_logger
+
+logger = get_logger("class_tracking")
 
 def track_favorite_class(action, game_id):
     """
@@ -29,9 +32,9 @@ def track_favorite_class(action, game_id):
             game_id = new_game.game_id
             db.close()
 
-            print(f"Game started with class '{class_name}' and added to the database with game_id: {game_id}.")
+            logger.debug("Game started with class '%s' and added to the database with game_id: %s.", class_name, game_id)
             return game_id
 
         except Exception as e:
-            print(f"Error while tracking favorite class: {e}")
+            logger.error("Error while tracking favorite class: %s", e)
             return None
\ No newline at end of file
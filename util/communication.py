@@ -1,40 +1,176 @@
+import asyncio
 import json
 import socket
+import struct
+import time
+from util import transports
+from util.framing import MESSAGE_STATE, MESSAGE_COMMAND, MESSAGE_RESEND, MESSAGE_STATE_FRAME, send_message, receive_message, encode_message, receive_message_async
+from util.state_frames import decode_state_frame
+from util.log import get_logger
 
-def handle_end_of_episode(client_socket):
+logger = get_logger("communication")
+
+# Seconds without a state before the worker asks its middleman to send the last one again
+RESEND_TIMEOUT = 10
+
+STATE_MESSAGES = (MESSAGE_STATE, MESSAGE_STATE_FRAME)
+
+# A state payload that does not parse (invalid JSON, a truncated frame)
+DECODE_ERRORS = (ValueError, struct.error)
+
+
+def decode_state(message_type, payload):
     """
-    Handles the end-of-episode scenario by sending the necessary commands
-    to navigate through the game over screen and start a new game.
+    The parsed JSON of a MESSAGE_STATE, the StateFrame of a MESSAGE_STATE_FRAME.
     """
-    commands = ["PROCEED", "PROCEED"]
+    if message_type == MESSAGE_STATE_FRAME:
+        return decode_state_frame(payload)
+    return json.loads(payload)
+
+
+class GameConnection:
+    """
+    Worker end of the framed protocol (util/framing.py) to one middleman. Remembers the number
+    of the last state received, to skip states it already has (answers to a resend request
+    that crossed the state) and to tell the middleman which state a command answers.
+    """
+
+    def __init__(self, sock):
+        self.socket = sock
+        self.last_sequence = 0
+
+    @classmethod
+    def connect(cls, port, host="localhost", timeout=RESEND_TIMEOUT, transport="tcp"):
+        """
+        Connect to the middleman of `port` over `transport` (util/transports.py).
+        """
+        return cls(transports.connect(transport, port, host, timeout))
+
+    def receive_state(self, timings=None):
+        """
+        Receive the next game state, asking for a resend after every RESEND_TIMEOUT without
+        one, and right away for a state that does not decode (its number is only taken once it
+        did, so the middleman sees the worker is still behind it). Returns the parsed state, or
+        a StateFrame from a middleman sending binary frames.
+        With StepTimings the wait is recorded as "receive" and the parsing as "json_parse" (or
+        "frame_decode").
+        """
+        while True:
+            try:
+                message_type, sequence, payload = receive_message(self.socket)
+            except socket.timeout:
+                logger.warning("Timeout occurred while receiving game state. Requesting resend...")
+                send_message(self.socket, MESSAGE_RESEND, self.last_sequence)
+                continue
+            if message_type not in STATE_MESSAGES or sequence <= self.last_sequence:
+                logger.debug("Skipped message of type %d for state %d", message_type, sequence)
+                continue
+
+            parse_start = time.perf_counter()
+            try:
+                game_state = decode_state(message_type, payload)
+            except DECODE_ERRORS as e:
+                logger.warning("Failed to decode state %d: %s. Requesting resend...", sequence, e)
+                send_message(self.socket, MESSAGE_RESEND, self.last_sequence)
+                continue
+            self.last_sequence = sequence
+            if timings is not None:
+                timings.lap("receive", "json_parse" if message_type == MESSAGE_STATE else "frame_decode", time.perf_counter() - parse_start)
+            return game_state
+
+    def send_command(self, command):
+        send_message(self.socket, MESSAGE_COMMAND, self.last_sequence, command.encode('utf-8'))
+
+    def fileno(self):
+        return self.socket.fileno()
 
-    for command in commands:
-        client_socket.sendall(command.encode('utf-8'))
-        print(f"Sent '{command}' command")
-
-        try:
-            game_state = receive_full_json(client_socket)
-            print(f"Game state received after '{command}'")
-
-        except json.JSONDecodeError as e:
-            print(f"Failed to decode JSON after '{command}': {e}")
-            return
-        except ConnectionError as e:
-            print(f"Connection error after '{command}': {e}")
-            return
-
-def receive_full_json(client_socket):
-    data = b''
-    while True:
-        try:
-            part = client_socket.recv(4096)
-            if not part:
-                raise ConnectionError("Socket connection closed")
-            data += part
+    def close(self):
+        self.socket.close()
+
+
+class AsyncGameConnection:
+    """
+    GameConnection over an asyncio stream, for workers that multiplex many games.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_sequence = 0
+
+    @classmethod
+    async def connect(cls, port, host="localhost", transport="tcp"):
+        if transport == "tcp":
+            reader, writer = await asyncio.open_connection(host, port)
+        elif transport == "unix":
+            reader, writer = await asyncio.open_unix_connection(transports.unix_socket_path(port))
+        else:
+            raise ValueError(f"Transport '{transport}' has no asyncio streams, use 'tcp' or 'unix'")
+        return cls(reader, writer)
+
+    async def receive_state(self):
+        while True:
             try:
-                return json.loads(data.decode('utf-8'))
-            except json.JSONDecodeError:
+                message_type, sequence, payload = await receive_message_async(self.reader, RESEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Timeout occurred while receiving game state. Requesting resend...")
+                self.writer.write(encode_message(MESSAGE_RESEND, self.last_sequence))
+                continue
+            if message_type not in STATE_MESSAGES or sequence <= self.last_sequence:
+                logger.debug("Skipped message of type %d for state %d", message_type, sequence)
                 continue
-        except socket.timeout:
-            print("Timeout occurred while receiving game state. Requesting resend...")
-            continue
+            try:
+                game_state = decode_state(message_type, payload)
+            except DECODE_ERRORS as e:
+                logger.warning("Failed to decode state %d: %s. Requesting resend...", sequence, e)
+                self.writer.write(encode_message(MESSAGE_RESEND, self.last_sequence))
+                continue
+            self.last_sequence = sequence
+            return game_state
+
+    async def send_command(self, command):
+        self.writer.write(encode_message(MESSAGE_COMMAND, self.last_sequence, command.encode('utf-8')))
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+
+def handle_end_of_episode(connection, answer_received=False):
+    """
+    Handles the end-of-episode scenario by sending the necessary commands
+    to navigate through the game over screen and start a new game. Every command answers
+    the state received before it, so the state answering the episode's last command is
+    received first (unless the caller already did, `answer_received`). Returns the first
+    state of the new game, which the next episode starts from, None after a connection error.
+    """
+    commands = ["PROCEED", "PROCEED"]
+
+    try:
+        if not answer_received:
+            connection.receive_state()
+        for command in commands:
+            connection.send_command(command)
+            logger.debug("Sent '%s' command", command)
+            game_state = connection.receive_state()
+            logger.debug("Game state received after '%s'", command)
+    except ConnectionError as e:
+        logger.error("Connection error at the end of the episode: %s", e)
+        return None
+    return game_state
+
+async def handle_end_of_episode_async(connection):
+    """
+    handle_end_of_episode over an AsyncGameConnection.
+    """
+    try:
+        await connection.receive_state()
+        for command in ["PROCEED", "PROCEED"]:
+            await connection.send_command(command)
+            logger.debug("Sent '%s' command", command)
+            game_state = await connection.receive_state()
+            logger.debug("Game state received after '%s'", command)
+    except ConnectionError as e:
+        logger.error("Connection error at the end of the episode: %s", e)
+        return None
+    return game_state
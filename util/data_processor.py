@@ -4,6 +4,9 @@ from util.boss_tracking import update_boss_count
 from sqlalchemy.orm import Session
 from db.session import SessionLocal
 from db.models import Game
+from util.log import get_logger
+
+logger = get_logger("data_processor")
 
 def process_game_state(game_state, action, game_id):
     """
@@ -34,5 +37,5 @@ def get_next_game_id():
         db.close()
         return next_game_id
     except Exception as e:
-        print(f"Error while fetching the next game ID: {e}")
+        logger.error("Error while fetching the next game ID: %s", e)
         return None
\ No newline at end of file
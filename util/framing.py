@@ -0,0 +1,115 @@
+"""
+Framed messages between middleman_process.py and the workers. Every message is a 9 byte
+header (type, sequence number, payload length, network byte order) followed by the payload:
+
+- MESSAGE_STATE: a CommunicationMod state as UTF-8 JSON, numbered 1, 2, ... by the middleman
+  (the numbers keep increasing when a worker reconnects)
+- MESSAGE_COMMAND: a command as UTF-8 text, carrying the number of the state it answers
+- MESSAGE_RESEND: asks the middleman to send its last state again, carrying the number of
+  the last state the worker has (no payload)
+- MESSAGE_STATE_FRAME: a state already encoded by the middleman (--binary), numbered like
+  MESSAGE_STATE, see util/state_frames.py
+
+A receiver reads exactly one header and one payload per message, so a state is parsed once
+however many packets it arrives in and back-to-back messages never run together.
+"""
+import asyncio
+import socket
+import struct
+
+HEADER = struct.Struct("!BII")
+
+MESSAGE_STATE = 1
+MESSAGE_COMMAND = 2
+MESSAGE_RESEND = 3
+MESSAGE_STATE_FRAME = 4
+
+# Larger lengths can only come from a peer speaking another protocol
+MAX_PAYLOAD = 64 * 2**20
+
+
+def encode_message(message_type, sequence, payload=b''):
+    return HEADER.pack(message_type, sequence, len(payload)) + payload
+
+def send_message(sock, message_type, sequence, payload=b''):
+    sock.sendall(encode_message(message_type, sequence, payload))
+
+def receive_exactly(sock, size, started=False):
+    """
+    Read exactly `size` bytes. A socket timeout before the first byte of a message (started
+    False) is raised to the caller, one in the middle of a message keeps waiting so a frame is
+    never cut in two.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        try:
+            count = sock.recv_into(view[received:])
+        except socket.timeout:
+            if not started and received == 0:
+                raise
+            continue
+        if not count:
+            raise ConnectionError("Socket connection closed")
+        received += count
+    return buffer
+
+def decode_header(header):
+    message_type, sequence, length = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ConnectionError(f"Message of {length} bytes, the peer does not speak the framed protocol")
+    return message_type, sequence, length
+
+def receive_message(sock):
+    """
+    (message type, sequence number, payload bytes) of the next message. Raises socket.timeout
+    only when no part of a message arrived in time.
+    """
+    message_type, sequence, length = decode_header(receive_exactly(sock, HEADER.size))
+    return message_type, sequence, bytes(receive_exactly(sock, length, started=True)) if length else b''
+
+class MessageBuffer:
+    """
+    Incremental decoder for an event loop: feed() whatever bytes a non-blocking read returned,
+    messages() yields every message that is complete so far and keeps the rest.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def messages(self):
+        # A message counts as consumed once it is handed out, the consumed bytes are trimmed
+        # even when the consumer stops early (e.g. on a ConnectionError from the last one)
+        buffer = self.buffer
+        offset = 0
+        try:
+            while len(buffer) - offset >= HEADER.size:
+                message_type, sequence, length = decode_header(buffer[offset:offset + HEADER.size])
+                end = offset + HEADER.size + length
+                if len(buffer) < end:
+                    break
+                message = message_type, sequence, bytes(buffer[offset + HEADER.size:end])
+                offset = end
+                yield message
+        finally:
+            del buffer[:offset]
+
+async def receive_message_async(reader, timeout=None):
+    """
+    receive_message on an asyncio StreamReader. Raises asyncio.TimeoutError when no header
+    arrived within `timeout` seconds, the header is left unread then (readexactly consumes
+    nothing until it has all the bytes), the payload of a started message is always awaited.
+    """
+    try:
+        if timeout is None:
+            header = await reader.readexactly(HEADER.size)
+        else:
+            header = await asyncio.wait_for(reader.readexactly(HEADER.size), timeout)
+        message_type, sequence, length = decode_header(header)
+        return message_type, sequence, await reader.readexactly(length) if length else b''
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Socket connection closed")
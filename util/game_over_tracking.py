@@ -2,6 +2,9 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 from db.models import Game
 from db.session import SessionLocal
+from util.log import get_logger
+
+logger = get_logger("game_over_tracking")
 
 def update_game_stats_on_game_over(game_state, game_id, total_reward):
     """
@@ -11,11 +14,11 @@ def update_game_stats_on_game_over(game_state, game_id, total_reward):
         # Check if 'game_state' and its required properties exist
         game_state_data = game_state.get("game_state", {})
         if not game_state_data:
-            print("Error: 'game_state' is missing in the provided game state.")
+            logger.warning("Error: 'game_state' is missing in the provided game state.")
             return
 
         if game_state_data.get("screen_type") != "GAME_OVER":
-            print("Error: Screen type is not 'GAME_OVER'. No update is required.")
+            logger.warning("Error: Screen type is not 'GAME_OVER'. No update is required.")
             return
 
         db: Session = SessionLocal()
@@ -29,11 +32,11 @@ def update_game_stats_on_game_over(game_state, game_id, total_reward):
             game.reward = total_reward
 
             db.commit()
-            print(f"Game {game_id} stats updated in the database.")
+            logger.debug("Game %s stats updated in the database.", game_id)
         else:
-            print(f"Game with ID {game_id} not found.")
+            logger.warning("Game with ID %s not found.", game_id)
 
         db.close()
 
     except Exception as e:
-        print(f"Error while updating game stats: {e}")
+        logger.error("Error while updating game stats: %s", e)
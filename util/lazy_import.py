@@ -0,0 +1,24 @@
+import importlib.util
+import sys
+
+
+def lazy_import(module_name):
+    """
+    Return a module whose code only runs on the first attribute access.
+
+    Used by the worker entry points for heavy, rarely needed modules (plotting, database
+    tracking) so a freshly spawned worker can connect to its game without importing them.
+    """
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    spec = importlib.util.find_spec(module_name)
+    if spec is None:
+        raise ImportError(f"No module named '{module_name}'")
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    loader.exec_module(module)
+    return module
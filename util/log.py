@@ -0,0 +1,183 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# Every logger of the project lives under this one, configure_logging only touches it
+ROOT_LOGGER = "sts"
+
+# Level used when none is given, overridden with STS_LOG_LEVEL (e.g. STS_LOG_LEVEL=DEBUG). At the
+# default nothing on the per-step path is logged, per-step messages are DEBUG
+LOG_LEVEL_VARIABLE = "STS_LOG_LEVEL"
+DEFAULT_LOG_LEVEL = "WARNING"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+
+# Seconds a BufferedRotatingFileHandler keeps records in its buffer before writing them out,
+# also how long the logging thread waits for a record before flushing anyway
+FLUSH_INTERVAL = 1.0
+
+_listener = None
+
+
+def get_logger(name):
+    """
+    Logger of a module, e.g. get_logger("run_env") -> "sts.run_env".
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records of the same message (logger and format string, before
+    its arguments are filled in) every `interval` seconds. The next record that gets through
+    says how many were dropped in between. ERROR and above are never dropped.
+    """
+
+    def __init__(self, interval=1.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        # (logger, format string) -> [window start, records in window, records suppressed]
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            self.windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+                record.args = None
+            return True
+
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler that leaves records in the file's buffer and writes them out at most
+    every `flush_interval` seconds, or right away for WARNING and above, instead of one write
+    per record. The file size is counted as records are written rather than asked of the file,
+    which would flush the buffer for every record as well.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count, flush_interval=FLUSH_INTERVAL):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.flush_interval = flush_interval
+        self.flushed_at = time.monotonic()
+        self.urgent = False
+        self.size = os.path.getsize(self.baseFilename)
+        self.record_size = 0
+
+    def shouldRollover(self, record):
+        # Called by emit() before every record
+        self.record_size = len(self.format(record)) + 1
+        return self.maxBytes > 0 and self.size + self.record_size >= self.maxBytes
+
+    def doRollover(self):
+        super().doRollover()
+        self.size = 0
+
+    def emit(self, record):
+        self.urgent = record.levelno >= logging.WARNING
+        super().emit(record)
+        self.size += self.record_size
+
+    def flush(self):
+        now = time.monotonic()
+        if self.urgent or now - self.flushed_at >= self.flush_interval:
+            super().flush()
+            self.flushed_at = now
+
+    def close(self):
+        self.urgent = True
+        super().close()
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that also flushes its handlers whenever no record arrived for
+    `flush_interval` seconds, so what a BufferedRotatingFileHandler holds is written out while
+    the process is idle (e.g. a middleman waiting on the game) instead of with the next record.
+    """
+
+    def __init__(self, records, *handlers, flush_interval=FLUSH_INTERVAL, respect_handler_level=False):
+        super().__init__(records, *handlers, respect_handler_level=respect_handler_level)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def configure_logging(level=None, stream=sys.stderr, log_file=None, rate_limit=1.0, burst=5, max_bytes=None, backup_count=3):
+    """
+    Send every "sts.*" logger of this process through a queue to a background thread that
+    formats and writes the records, so logging never blocks the step loop on the terminal or
+    a file. `stream` and `log_file` are where records end up (None to skip either), identical
+    messages are rate limited per `rate_limit` seconds unless it is None. With `max_bytes` the
+    file is buffered and rotated at that size, keeping `backup_count` old files. Safe to call
+    more than once, later calls replace the earlier setup.
+    """
+    global _listener
+
+    level = level or os.environ.get(LOG_LEVEL_VARIABLE, DEFAULT_LOG_LEVEL)
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+
+    stop_logging()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    if log_file is not None and max_bytes:
+        handlers.append(BufferedRotatingFileHandler(log_file, max_bytes, backup_count))
+    elif log_file is not None:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    if rate_limit is not None:
+        queue_handler.addFilter(RateLimitFilter(rate_limit, burst))
+    logger.addHandler(queue_handler)
+
+    _listener = FlushingQueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    return logger
+
+
+def stop_logging():
+    """
+    Write out the records still queued and stop the background writer.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
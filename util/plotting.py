@@ -1,4 +1,7 @@
 import matplotlib.pyplot as plt
+from util.log import get_logger
+
+logger = get_logger("plotting")
 
 def plot_performance_metrics(episode_rewards, episode_lengths, rolling_avg_rewards, highest_reward, save_path="performance_metrics.png"):
     fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12))
@@ -28,4 +31,4 @@ def plot_performance_metrics(episode_rewards, episode_lengths, rolling_avg_rewar
     plt.savefig(save_path, format='png')
     plt.close(fig)
 
-    print(f"Performance metrics saved to {save_path}")
+    logger.info("Performance metrics saved to %s", save_path)
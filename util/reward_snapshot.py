@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def count_curses(deck):
+    return sum(1 for card in deck if card.get('rarity', '').upper() == 'CURSE')
+
+
+class RewardSnapshot:
+    """
+    The few fields of a CommunicationMod state that calculate_reward compares between two
+    steps, read once when the state arrives instead of deep-copying the whole state (deck, act
+    map, screen state) to keep it around for the next step.
+    """
+
+    __slots__ = (
+        "has_game_state", "screen_type", "in_combat", "monster_hp", "monster_max_hp",
+        "current_hp", "floor", "gold", "relic_count", "deck_length", "last_card_rarity", "curse_count",
+    )
+
+    def __init__(self, state, previous=None):
+        # Top level screen_type, as calculate_reward has always compared it
+        self.screen_type = state.get("screen_type", None) if state is not None else None
+
+        game_state = state.get('game_state', None) if state is not None else None
+        self.has_game_state = game_state is not None
+        if game_state is None:
+            return
+
+        combat_state = game_state.get('combat_state', {}) or {}
+        monsters = combat_state.get('monsters', [])
+        self.in_combat = len(combat_state) > 0
+        self.monster_hp = tuple(monster.get('current_hp', 0) for monster in monsters)
+        self.monster_max_hp = tuple(monster.get('max_hp', 1) for monster in monsters)
+
+        self.current_hp = game_state.get('current_hp', 0)
+        self.floor = game_state.get('floor', 0)
+        self.gold = game_state.get('gold', 0)
+        self.relic_count = len(game_state.get('relics', []))
+
+        # The last card is the one a reward adds when the deck grows
+        deck = game_state.get('deck', [])
+        self.deck_length = len(deck)
+        self.last_card_rarity = deck[-1].get('rarity', 'COMMON').upper() if deck else None
+
+        # Running count: combat never swaps a master deck card for another of the same count, so
+        # from one combat step to the next the previous count carries over and most steps don't
+        # rescan the deck at all
+        if previous is not None and previous.has_game_state and previous.in_combat and self.in_combat and previous.deck_length == self.deck_length:
+            self.curse_count = previous.curse_count
+        else:
+            self.curse_count = count_curses(deck)
+
+
+class SnapshotBatch:
+    """
+    Column form of a list of RewardSnapshots with the same attribute names, one numpy array per
+    field, so the reward terms evaluate a whole recorded run at once. Monster HP is padded to
+    the most monsters in the batch (HP 0, max HP 1) with `monster_count` giving the real count.
+    Snapshots without a game_state contribute zeros.
+    """
+
+    def __init__(self, snapshots):
+        present = [snapshot if snapshot.has_game_state else None for snapshot in snapshots]
+
+        def column(field, default=0, dtype=np.float64):
+            return np.array([getattr(snapshot, field) if snapshot is not None else default for snapshot in present], dtype=dtype)
+
+        self.has_game_state = np.array([snapshot is not None for snapshot in present], dtype=bool)
+        self.screen_type = np.array([snapshot.screen_type for snapshot in snapshots], dtype=object)
+        self.in_combat = column("in_combat", False, bool)
+        self.current_hp = column("current_hp")
+        self.floor = column("floor")
+        self.gold = column("gold")
+        self.relic_count = column("relic_count")
+        self.deck_length = column("deck_length")
+        self.last_card_rarity = column("last_card_rarity", None, object)
+        self.curse_count = column("curse_count")
+
+        self.monster_count = np.array([len(snapshot.monster_hp) if snapshot is not None else 0 for snapshot in present])
+        width = int(self.monster_count.max(initial=0))
+        self.monster_hp = np.zeros((len(snapshots), width))
+        self.monster_max_hp = np.ones((len(snapshots), width))
+        for row, snapshot in enumerate(present):
+            if snapshot is not None:
+                self.monster_hp[row, :len(snapshot.monster_hp)] = snapshot.monster_hp
+                self.monster_max_hp[row, :len(snapshot.monster_max_hp)] = snapshot.monster_max_hp
@@ -0,0 +1,138 @@
+from collections import namedtuple
+
+import numpy as np
+from util.reward_snapshot import RewardSnapshot, SnapshotBatch
+
+# Kind of the action that led to a transition, indexed out of ActionMetadata so no term
+# compares action strings
+TakenAction = namedtuple("TakenAction", ["potion_use", "potion_discard"])
+
+CARD_RARITY_REWARDS = {"COMMON": 3, "UNCOMMON": 4.3, "RARE": 10}
+
+# Term name -> term(previous, current, action), in the order the reward adds them up. A term
+# reads two RewardSnapshots and returns its value, or two SnapshotBatches and returns one
+# value per transition, most terms are arithmetic that works the same on numbers and arrays
+REWARD_TERMS = {}
+
+def reward_term(name):
+    def register(term):
+        REWARD_TERMS[name] = term
+        return term
+    return register
+
+
+def paired_monster_hp(previous, current):
+    """
+    (previous HP, current HP, current max HP) of every monster present in both snapshots. For
+    batches these are arrays with the padding columns of either side zeroed.
+    """
+    if not isinstance(previous, SnapshotBatch):
+        return zip(previous.monster_hp, current.monster_hp, current.monster_max_hp)
+    width = min(previous.monster_hp.shape[1], current.monster_hp.shape[1])
+    present = np.arange(width) < np.minimum(previous.monster_count, current.monster_count)[:, np.newaxis]
+    return previous.monster_hp[:, :width] * present, current.monster_hp[:, :width] * present, current.monster_max_hp[:, :width]
+
+@reward_term("monster_damage")
+def monster_damage(previous, current, action):
+    # 10 for every monster max HP worth of damage dealt
+    if isinstance(previous, SnapshotBatch):
+        previous_hp, current_hp, max_hp = paired_monster_hp(previous, current)
+        damage = ((current_hp < previous_hp) * (previous_hp - current_hp) / max_hp).sum(axis=1)
+    else:
+        # A handful of monsters, plain Python beats numpy on a single transition
+        damage = sum((previous_hp - current_hp) / max_hp for previous_hp, current_hp, max_hp in paired_monster_hp(previous, current) if current_hp < previous_hp)
+    return previous.in_combat * damage * 10
+
+@reward_term("monster_kill")
+def monster_kill(previous, current, action):
+    if isinstance(previous, SnapshotBatch):
+        previous_hp, current_hp, max_hp = paired_monster_hp(previous, current)
+        kills = ((current_hp == 0) & (previous_hp > 0)).sum(axis=1)
+    else:
+        kills = sum(1 for previous_hp, current_hp, max_hp in paired_monster_hp(previous, current) if current_hp == 0 and previous_hp > 0)
+    return previous.in_combat * kills * 20
+
+@reward_term("combat_end")
+def combat_end(previous, current, action):
+    return ((previous.screen_type == "NONE") & (current.screen_type == "COMBAT_REWARD")) * 40
+
+@reward_term("hp_loss")
+def hp_loss(previous, current, action):
+    lost = previous.current_hp - current.current_hp
+    return (lost > 0) * lost * -3
+
+@reward_term("floor")
+def floor(previous, current, action):
+    return (current.floor > previous.floor) * 10
+
+@reward_term("potion_use")
+def potion_use(previous, current, action):
+    return action.potion_use * 10
+
+@reward_term("potion_discard")
+def potion_discard(previous, current, action):
+    return action.potion_discard * -10
+
+@reward_term("relic")
+def relic(previous, current, action):
+    return (current.relic_count > previous.relic_count) * 50
+
+@reward_term("gold")
+def gold(previous, current, action):
+    # 1 point for each 10 gold gained, -0.05 points for each gold lost
+    difference = current.gold - previous.gold
+    return (difference > 0) * difference / 10 + (difference < 0) * difference * 0.05
+
+@reward_term("card_rarity")
+def card_rarity(previous, current, action):
+    # The card added to the deck is assumed to be the last one
+    if isinstance(current.last_card_rarity, np.ndarray):
+        value = np.array([CARD_RARITY_REWARDS.get(rarity, 0) for rarity in current.last_card_rarity])
+    else:
+        value = CARD_RARITY_REWARDS.get(current.last_card_rarity, 0)
+    return (current.deck_length > previous.deck_length) * value
+
+@reward_term("curse_removal")
+def curse_removal(previous, current, action):
+    return (current.curse_count < previous.curse_count) * 15
+
+@reward_term("step_cost")
+def step_cost(previous, current, action):
+    # Small penalty per action to encourage efficiency
+    return -0.1
+
+
+def evaluate_reward(previous, current, action, metadata):
+    """
+    Value of every reward term for one transition between two RewardSnapshots, taken with
+    action index `action`. Empty when either side has no game_state (no reward at all).
+    """
+    if not previous.has_game_state or not current.has_game_state:
+        return {}
+    taken = TakenAction(bool(metadata.is_potion_use[action]), bool(metadata.is_potion_discard[action]))
+    return {name: float(term(previous, current, taken)) for name, term in REWARD_TERMS.items()}
+
+def evaluate_reward_batch(previous, current, actions, metadata):
+    """
+    evaluate_reward over many transitions at once: `previous` and `current` are equally long
+    lists of RewardSnapshots and `actions` the action index of each transition. Returns one
+    array per term, zero for transitions without a game_state on either side.
+    """
+    actions = np.asarray(actions)
+    previous, current = SnapshotBatch(previous), SnapshotBatch(current)
+    taken = TakenAction(metadata.is_potion_use[actions], metadata.is_potion_discard[actions])
+    valid = previous.has_game_state & current.has_game_state
+    return {
+        name: np.where(valid, np.broadcast_to(term(previous, current, taken), valid.shape), 0.0)
+        for name, term in REWARD_TERMS.items()
+    }
+
+def replay_rewards(states, actions, metadata):
+    """
+    Per-term rewards of a recorded game: transition i goes from states[i] to states[i + 1]
+    and is credited to actions[i], as calculate_reward credits the previous action.
+    """
+    snapshots = []
+    for state in states:
+        snapshots.append(RewardSnapshot(state, snapshots[-1] if snapshots else None))
+    return evaluate_reward_batch(snapshots[:-1], snapshots[1:], actions, metadata)
@@ -0,0 +1,429 @@
+"""
+The "shm" transport of util/transports.py: a shared memory block per game with one byte ring
+per direction, and FIFOs as doorbells. A writer writes a byte into the reader's FIFO after
+adding to a ring, so a reader with nothing to read sleeps in select() on its FIFO instead of
+polling the ring. A third FIFO announces connecting workers to the middleman.
+
+FIFOs, select() on file descriptors and MSG_DONTWAIT are POSIX only and the rings need x86's
+store ordering (SharedMemoryRing), so util/transports.py only imports this module when the
+transport is chosen and check_supported() refuses it elsewhere.
+"""
+import functools
+import os
+import platform
+import select
+import socket
+import struct
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+# Bytes per direction of a shared memory connection, longer messages are streamed through
+RING_SIZE = 2**20
+
+# Control words at the start of the shared memory block, unsigned 64 bit each:
+# the pid of the middleman owning the block, the number of the last connection a worker
+# asked for, the last one the middleman accepted and the last one closed by either end,
+# then per ring the bytes ever written, the bytes ever read and whether its writer waits
+# for room
+CONTROL_WORDS = 16
+OWNER, REQUESTED, ACCEPTED, CLOSED = 0, 1, 2, 3
+TO_WORKER, TO_MIDDLEMAN = 4, 8
+WRITTEN, READ, WRITER_WAITING = 0, 1, 2
+CONTROL_SIZE = CONTROL_WORDS * struct.calcsize("Q")
+
+# Bytes of a FIFO (the Linux default), a full doorbell is rung already
+DOORBELL_CAPACITY = 65536
+
+# Seconds a writer waiting for room sleeps before looking again, in case its wake up was missed
+SPACE_POLL = 0.001
+
+# Seconds a reader polls an empty ring before it sleeps on its doorbell, a peer answering
+# within it costs no wake up (see spin_seconds)
+SPIN_SECONDS = 50e-6
+
+# The rings rely on the stores of one process becoming visible to the other in program
+# order (see SharedMemoryRing), which only x86 guarantees
+SUPPORTED_MACHINES = ("x86_64", "amd64", "i386", "i686", "x86")
+
+
+def check_supported():
+    if os.name != "posix":
+        raise ValueError("The shm transport needs FIFOs (POSIX), use 'tcp' on this system")
+    if platform.machine().lower() not in SUPPORTED_MACHINES:
+        raise ValueError(f"The shm transport relies on x86 store ordering, use 'unix' or 'tcp' on {platform.machine()}")
+
+@functools.lru_cache(maxsize=None)
+def spin_seconds():
+    # Only with a second CPU the peer can answer while this one polls
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return SPIN_SECONDS if cpus > 1 else 0.0
+
+def shared_memory_name(port):
+    return f"slay_the_spire_{port}"
+
+# FIFOs of a shared memory connection: the doorbell of each ring and the one workers ring to connect
+DOORBELLS = {TO_WORKER: "to_worker", TO_MIDDLEMAN: "to_middleman", "connect": "connect"}
+
+def doorbell_path(port, doorbell):
+    return os.path.join(tempfile.gettempdir(), f"slay_the_spire_{port}.{DOORBELLS[doorbell]}")
+
+def open_doorbell(path):
+    # Read-write so neither open blocks on the other end and reads never see end of file
+    return os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+def drain(doorbell):
+    try:
+        # One read takes every pending ring, a FIFO never holds more
+        os.read(doorbell, DOORBELL_CAPACITY)
+    except BlockingIOError:
+        pass
+
+
+class SharedMemoryRing:
+    """
+    One direction of a shared memory connection: RING_SIZE bytes of `buffer` and the control
+    words at `base`. Only one process writes and only one reads. The written and read counters
+    only grow, a counter is stored after the bytes it covers and loaded before them.
+
+    Python has no memory barriers, so this is only correct where the hardware keeps a core's
+    stores, and its loads, in program order: x86 (TSO). On ARM or POWER the reader could see a
+    counter before the bytes it covers, check_supported() refuses the transport there. The
+    doorbell write after every update is a system call, so a reader woken by it always sees
+    the bytes.
+    """
+
+    def __init__(self, control, buffer, base):
+        self.control = control
+        self.buffer = buffer
+        self.base = base
+
+    def reset(self):
+        self.control[self.base + WRITTEN] = 0
+        self.control[self.base + READ] = 0
+        self.control[self.base + WRITER_WAITING] = 0
+
+    def available(self):
+        return self.control[self.base + WRITTEN] - self.control[self.base + READ]
+
+    def write(self, data):
+        """
+        Add as much of `data` as fits, returns the number of bytes added.
+        """
+        written = self.control[self.base + WRITTEN]
+        count = min(len(data), RING_SIZE - (written - self.control[self.base + READ]))
+        start = written % RING_SIZE
+        first = min(count, RING_SIZE - start)
+        self.buffer[start:start + first] = data[:first]
+        self.buffer[:count - first] = data[first:count]
+        self.control[self.base + WRITTEN] = written + count
+        return count
+
+    def read_into(self, view):
+        """
+        Move up to len(view) bytes out of the ring, returns the number of bytes moved.
+        """
+        read = self.control[self.base + READ]
+        count = min(len(view), self.control[self.base + WRITTEN] - read)
+        start = read % RING_SIZE
+        first = min(count, RING_SIZE - start)
+        view[:first] = self.buffer[start:start + first]
+        view[first:count] = self.buffer[:count - first]
+        self.control[self.base + READ] = read + count
+        return count
+
+    @property
+    def writer_waiting(self):
+        return self.control[self.base + WRITER_WAITING]
+
+    @writer_waiting.setter
+    def writer_waiting(self, waiting):
+        self.control[self.base + WRITER_WAITING] = int(waiting)
+
+
+class SharedMemoryConnection:
+    """
+    One end of a shared memory connection with the socket methods the framed protocol uses.
+    `generation` is the number of this connection, it is over once either end closes it or a
+    newer worker connects to the same game.
+    """
+
+    def __init__(self, memory, send_base, receive_base, doorbell, peer_doorbell, generation, owner=False):
+        self.memory = memory
+        self.control = memory.buf[:CONTROL_SIZE].cast("Q")
+        buffers = {TO_WORKER: memory.buf[CONTROL_SIZE:CONTROL_SIZE + RING_SIZE],
+                   TO_MIDDLEMAN: memory.buf[CONTROL_SIZE + RING_SIZE:CONTROL_SIZE + 2 * RING_SIZE]}
+        self.send_ring = SharedMemoryRing(self.control, buffers[send_base], send_base)
+        self.receive_ring = SharedMemoryRing(self.control, buffers[receive_base], receive_base)
+        self.doorbell = doorbell
+        self.peer_doorbell = peer_doorbell
+        self.generation = generation
+        # The middleman's listener owns the block and the doorbells, a worker closes its own
+        self.owner = owner
+        self.timeout = None
+        self.closed = False
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def gettimeout(self):
+        return self.timeout
+
+    def fileno(self):
+        # Readable when the peer rang, selectors wait on it like on a socket
+        return self.doorbell
+
+    def is_open(self):
+        return (not self.closed and self.control[CLOSED] != self.generation
+                and self.control[REQUESTED] == self.generation)
+
+    def ring(self):
+        try:
+            os.write(self.peer_doorbell, b"\0")
+        except BlockingIOError:
+            # A full FIFO wakes the peer as well as one more byte would
+            pass
+
+    def wait(self, timeout):
+        """
+        Sleep until the peer rings or `timeout` seconds passed, True when it rang.
+        """
+        readable, _, _ = select.select([self.doorbell], [], [], timeout)
+        if not readable:
+            return False
+        drain(self.doorbell)
+        return True
+
+    def wake(self):
+        # Ring our own doorbell, for an event loop selecting on fileno()
+        try:
+            os.write(self.doorbell, b"\0")
+        except BlockingIOError:
+            pass
+
+    def sendall(self, data):
+        view = memoryview(data).cast("B")
+        waited = False
+        while len(view):
+            if not self.is_open():
+                raise BrokenPipeError("Shared memory connection closed")
+            count = self.send_ring.write(view)
+            if count:
+                view = view[count:]
+                self.ring()
+                continue
+            # Full, the reader rings once it made room
+            self.send_ring.writer_waiting = True
+            if self.send_ring.available() == RING_SIZE:
+                waited = self.wait(SPACE_POLL) or waited
+            self.send_ring.writer_waiting = False
+        # Waiting drained the doorbell, an event loop must still see what the peer sent meanwhile
+        if waited and self.receive_ring.available():
+            self.wake()
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        """
+        Like socket.recv_into: at least one byte, 0 once the connection is closed, and
+        socket.timeout when nothing arrived within the timeout. With socket.MSG_DONTWAIT
+        BlockingIOError when there is nothing to read right away.
+        """
+        view = memoryview(buffer).cast("B")
+        if nbytes:
+            view = view[:nbytes]
+        if flags & socket.MSG_DONTWAIT:
+            return self.receive_ready(view)
+        count = self.receive_ring.read_into(view)
+        spin = spin_seconds()
+        if not count and spin:
+            spin_end = time.perf_counter() + spin
+            while not self.receive_ring.available() and time.perf_counter() < spin_end:
+                pass
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not count:
+            count = self.receive_ring.read_into(view)
+            if count:
+                break
+            if not self.is_open():
+                return 0
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise socket.timeout("timed out")
+            self.wait(remaining)
+        if self.receive_ring.writer_waiting:
+            self.ring()
+        return count
+
+    def receive_ready(self, view):
+        """
+        Non-blocking read for an event loop that selects on fileno(). The doorbell is drained
+        first, and rung again when bytes are left in the ring, so the loop is woken for
+        exactly as long as there is something to read (as for a socket).
+        """
+        drain(self.doorbell)
+        count = self.receive_ring.read_into(view)
+        if not count:
+            if not self.is_open():
+                return 0
+            raise BlockingIOError("Nothing to read")
+        if self.receive_ring.available():
+            self.wake()
+        if self.receive_ring.writer_waiting:
+            self.ring()
+        return count
+
+    def close(self):
+        if self.closed:
+            return
+        if self.is_open():
+            self.control[CLOSED] = self.generation
+            self.ring()
+        self.closed = True
+        self.control.release()
+        self.send_ring.buffer.release()
+        self.receive_ring.buffer.release()
+        if not self.owner:
+            self.memory.close()
+            os.close(self.doorbell)
+            os.close(self.peer_doorbell)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SharedMemoryListener:
+    """
+    Middleman end of the shared memory transport: creates the block and the doorbells of a
+    port and accepts the workers connecting to it one after the other.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.memory = open_shared_memory(port, create=True)
+        self.control = self.memory.buf[:CONTROL_SIZE].cast("Q")
+        for word in range(CONTROL_WORDS):
+            self.control[word] = 0
+        self.control[OWNER] = os.getpid()
+        for doorbell in DOORBELLS:
+            path = doorbell_path(port, doorbell)
+            if os.path.exists(path):
+                os.unlink(path)
+            os.mkfifo(path)
+        self.doorbell = open_doorbell(doorbell_path(port, TO_MIDDLEMAN))
+        self.peer_doorbell = open_doorbell(doorbell_path(port, TO_WORKER))
+        self.connect_doorbell = open_doorbell(doorbell_path(port, "connect"))
+        self.connection = None
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def fileno(self):
+        # Readable when a worker asked to connect, as a listening socket
+        return self.connect_doorbell
+
+    def accept(self):
+        """
+        Wait for a worker to connect, (connection, block name) as socket.accept returns.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        drain(self.connect_doorbell)
+        while self.control[REQUESTED] == self.control[ACCEPTED]:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise socket.timeout("timed out")
+            select.select([self.connect_doorbell], [], [], remaining)
+            drain(self.connect_doorbell)
+
+        generation = self.control[REQUESTED]
+        for ring in (TO_WORKER, TO_MIDDLEMAN):
+            SharedMemoryRing(self.control, None, ring).reset()
+        self.control[ACCEPTED] = generation
+        self.connection = SharedMemoryConnection(self.memory, TO_WORKER, TO_MIDDLEMAN, self.doorbell, self.peer_doorbell, generation, owner=True)
+        self.connection.ring()
+        return self.connection, self.memory.name
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.control.release()
+        unlink_shared_memory(self.memory)
+        os.close(self.doorbell)
+        os.close(self.peer_doorbell)
+        os.close(self.connect_doorbell)
+        for doorbell in DOORBELLS:
+            os.unlink(doorbell_path(self.port, doorbell))
+
+
+def open_shared_memory(port, create=False):
+    """
+    Create or open the block of `port` without leaving it to the resource tracker, which would
+    remove it when the first process using it exits (a worker, or the parent of spawned
+    workers sharing its tracker). The middleman removes it on close, or the next middleman on
+    the port once the owner is gone (address_in_use).
+    """
+    size = CONTROL_SIZE + 2 * RING_SIZE if create else 0
+    memory = shared_memory.SharedMemory(shared_memory_name(port), create=create, size=size)
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+def unlink_shared_memory(memory):
+    # unlink() tells the resource tracker, which has to know the block first
+    resource_tracker.register(memory._name, "shared_memory")
+    memory.close()
+    memory.unlink()
+
+def connect_shared_memory(port, timeout=None):
+    try:
+        memory = open_shared_memory(port)
+    except FileNotFoundError:
+        raise ConnectionRefusedError(f"No middleman listens on shared memory port {port}")
+    control = memory.buf[:CONTROL_SIZE].cast("Q")
+    doorbell = open_doorbell(doorbell_path(port, TO_WORKER))
+    peer_doorbell = open_doorbell(doorbell_path(port, TO_MIDDLEMAN))
+
+    generation = control[REQUESTED] + 1
+    control[REQUESTED] = generation
+    control.release()
+    connection = SharedMemoryConnection(memory, TO_MIDDLEMAN, TO_WORKER, doorbell, peer_doorbell, generation)
+    connect_doorbell = open_doorbell(doorbell_path(port, "connect"))
+    os.write(connect_doorbell, b"\0")
+    os.close(connect_doorbell)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while connection.control[ACCEPTED] != generation:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            connection.close()
+            raise socket.timeout(f"The middleman on shared memory port {port} did not accept in time")
+        connection.wait(remaining)
+    connection.settimeout(timeout)
+    return connection
+
+
+def address_in_use(port):
+    """
+    Whether a middleman owns the block of `port`, a block whose owner is gone is removed.
+    """
+    try:
+        memory = open_shared_memory(port)
+    except FileNotFoundError:
+        return False
+    control = memory.buf[:CONTROL_SIZE].cast("Q")
+    owner = control[OWNER]
+    control.release()
+    try:
+        os.kill(owner, 0)
+        memory.close()
+        return True
+    except (ProcessLookupError, OverflowError):
+        unlink_shared_memory(memory)
+        return False
+    except PermissionError:
+        memory.close()
+        return True
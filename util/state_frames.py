@@ -0,0 +1,182 @@
+"""
+Binary state frames, the payload of MESSAGE_STATE_FRAME (util/framing.py). With
+`middleman_process.py --binary` the middleman parses, encodes and masks every state itself and
+sends the worker what it would have computed from the JSON:
+
+    header       FRAME_HEADER, the reward snapshot scalars, flags and the lengths below
+    observation  FLAT_OBSERVATION_SIZE little endian float32, the flat observation layout
+    mask         np.packbits of the legal action mask, (action count + 7) // 8 bytes
+    monsters     current HP then max HP of every monster, little endian int32
+    strings      the state's screen_type, its game_state's screen_type and the rarity of the
+                 last deck card, UTF-8
+    json         the raw state, only for TRACKED_SCREENS (the database tracking reads them)
+
+The observation and mask are the same size for every state, a frame is about 6.5 KB where the
+JSON of a late game state is tens of KB.
+
+The mask is computed without the previous action, which the middleman does not know (the
+worker may skip states, e.g. at the end of an episode). The worker applies the previous
+action rules itself, see SlayTheSpireEnv.get_frame_action_mask.
+"""
+import json
+import struct
+
+import numpy as np
+
+from util.reward_snapshot import RewardSnapshot
+from observations.observation_layout import FLAT_OBSERVATION_SIZE, empty_flat_observation, observation_views
+
+# flags, current_hp, floor, gold, relic_count, deck_length, curse_count, action count,
+# monster count, the three string lengths and the JSON length
+FRAME_HEADER = struct.Struct("<B6iHHBBBI")
+
+OBSERVATION_DTYPE = np.dtype("<f4")
+HP_DTYPE = np.dtype("<i4")
+
+# The snapshot has a game_state (RewardSnapshot.has_game_state)
+FLAG_GAME_STATE = 1
+# The game_state is not empty, the previous action rules of the mask apply
+FLAG_DECISION_STATE = 2
+FLAG_IN_COMBAT = 4
+# screen_type and last_card_rarity are not None
+FLAG_SCREEN_TYPE = 8
+FLAG_CARD_RARITY = 16
+
+# Screens whose state the worker needs in full: card picks and boss rewards are tracked in
+# the database, the game over state updates the game stats
+TRACKED_SCREENS = ("CARD_REWARD", "BOSS_REWARD", "GAME_OVER")
+
+
+class StateFrame:
+    """
+    A decoded state frame. `state` is the raw state for TRACKED_SCREENS and otherwise a stand-in
+    with only the game_state's screen_type, enough for process_game_state and check_if_done.
+    """
+
+    __slots__ = ("observation", "mask", "snapshot", "state", "decision_state")
+
+    def copy_observation(self, out):
+        """
+        Copy the observation into a flat array or into a dict of component arrays (e.g. the
+        views of a rollout buffer slot).
+        """
+        if isinstance(out, dict):
+            views = observation_views(self.observation)
+            for key, component in out.items():
+                component[...] = views[key]
+        else:
+            out[...] = self.observation
+        return out
+
+
+class StateFrameEncoder:
+    """
+    Middleman side of the frames. `env` is a SlayTheSpireEnv that only ever sees states (it
+    never takes an action), it keeps the incremental observation encoder, the mask cache and
+    the running reward snapshot of the game.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.observation = empty_flat_observation()
+        self.action_count = len(env.actions)
+
+    def encode(self, state, state_json):
+        """
+        Frame of a parsed state, `state_json` is its raw text (attached for TRACKED_SCREENS).
+        """
+        env = self.env
+        env.update_game_state(state)
+        env.encode_flat_observation(state, out=self.observation)
+        mask = env.get_invalid_action_mask(state)
+        snapshot = env.snapshot
+
+        game_state = state.get("game_state", None)
+        game_screen_type = (game_state.get("screen_type") or "") if game_state else ""
+        screen_type = snapshot.screen_type.encode('utf-8') if snapshot.screen_type is not None else b''
+        raw = state_json.encode('utf-8') if game_screen_type in TRACKED_SCREENS else b''
+
+        flags = 0
+        scalars = (0, 0, 0, 0, 0, 0)
+        monster_hp = monster_max_hp = ()
+        rarity = b''
+        if snapshot.screen_type is not None:
+            flags |= FLAG_SCREEN_TYPE
+        if game_state:
+            flags |= FLAG_DECISION_STATE
+        if snapshot.has_game_state:
+            flags |= FLAG_GAME_STATE
+            if snapshot.in_combat:
+                flags |= FLAG_IN_COMBAT
+            if snapshot.last_card_rarity is not None:
+                flags |= FLAG_CARD_RARITY
+                rarity = snapshot.last_card_rarity.encode('utf-8')
+            scalars = (snapshot.current_hp, snapshot.floor, snapshot.gold, snapshot.relic_count, snapshot.deck_length, snapshot.curse_count)
+            monster_hp = snapshot.monster_hp
+            monster_max_hp = snapshot.monster_max_hp
+        game_screen = game_screen_type.encode('utf-8')
+
+        return b''.join((
+            FRAME_HEADER.pack(flags, *scalars, self.action_count, len(monster_hp), len(screen_type), len(game_screen), len(rarity), len(raw)),
+            self.observation.tobytes(),
+            np.packbits(mask).tobytes(),
+            np.array(monster_hp, dtype=HP_DTYPE).tobytes(),
+            np.array(monster_max_hp, dtype=HP_DTYPE).tobytes(),
+            screen_type, game_screen, rarity, raw,
+        ))
+
+
+def decode_state_frame(payload):
+    """
+    StateFrame of a MESSAGE_STATE_FRAME payload. The observation is a read-only view of the
+    payload, the mask a new array the caller may modify.
+    """
+    (flags, current_hp, floor, gold, relic_count, deck_length, curse_count,
+     action_count, monster_count, screen_length, game_screen_length, rarity_length, raw_length) = FRAME_HEADER.unpack_from(payload)
+    offset = FRAME_HEADER.size
+
+    frame = StateFrame()
+    frame.observation = np.frombuffer(payload, dtype=OBSERVATION_DTYPE, count=FLAT_OBSERVATION_SIZE, offset=offset)
+    offset += FLAT_OBSERVATION_SIZE * OBSERVATION_DTYPE.itemsize
+    mask_length = (action_count + 7) // 8
+    frame.mask = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=mask_length, offset=offset), count=action_count).astype(bool)
+    offset += mask_length
+    monster_hp = np.frombuffer(payload, dtype=HP_DTYPE, count=monster_count, offset=offset)
+    offset += monster_count * HP_DTYPE.itemsize
+    monster_max_hp = np.frombuffer(payload, dtype=HP_DTYPE, count=monster_count, offset=offset)
+    offset += monster_count * HP_DTYPE.itemsize
+
+    def text(length):
+        nonlocal offset
+        value = payload[offset:offset + length].decode('utf-8')
+        offset += length
+        return value
+
+    screen_type = text(screen_length)
+    game_screen_type = text(game_screen_length)
+    rarity = text(rarity_length)
+
+    snapshot = RewardSnapshot(None)
+    snapshot.screen_type = screen_type if flags & FLAG_SCREEN_TYPE else None
+    if flags & FLAG_GAME_STATE:
+        snapshot.has_game_state = True
+        snapshot.in_combat = bool(flags & FLAG_IN_COMBAT)
+        snapshot.monster_hp = tuple(monster_hp.tolist())
+        snapshot.monster_max_hp = tuple(monster_max_hp.tolist())
+        snapshot.current_hp = current_hp
+        snapshot.floor = floor
+        snapshot.gold = gold
+        snapshot.relic_count = relic_count
+        snapshot.deck_length = deck_length
+        snapshot.last_card_rarity = rarity if flags & FLAG_CARD_RARITY else None
+        snapshot.curse_count = curse_count
+    frame.snapshot = snapshot
+    frame.decision_state = bool(flags & FLAG_DECISION_STATE)
+
+    if raw_length:
+        frame.state = json.loads(payload[offset:offset + raw_length])
+    elif flags & FLAG_GAME_STATE:
+        frame.state = {"game_state": {"screen_type": game_screen_type}}
+    else:
+        frame.state = {}
+    return frame
@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import time
+from util.log import get_logger
+
+logger = get_logger("step_timing")
+
+# Log-spaced histogram buckets from 1 us to 100 s, 20 per decade (each bucket ~12% wide)
+MIN_SECONDS = 1e-6
+BUCKETS_PER_DECADE = 20
+BUCKETS = 8 * BUCKETS_PER_DECADE
+PERCENTILES = (50, 95, 99)
+
+# Seconds between two flushes of a worker's timings to its file
+FLUSH_INTERVAL = 60.0
+
+# Seconds a worker may take from its start to its first command, overridden with
+# STS_FIRST_ACTION_BUDGET (e.g. STS_FIRST_ACTION_BUDGET=5)
+FIRST_ACTION_BUDGET_VARIABLE = "STS_FIRST_ACTION_BUDGET"
+DEFAULT_FIRST_ACTION_BUDGET = 10.0
+
+
+def check_first_action(name, seconds):
+    """
+    Log a worker's time to first action, as a WARNING (seen at the default log level) when it
+    is over the budget. Returns whether it was within the budget.
+    """
+    budget = float(os.environ.get(FIRST_ACTION_BUDGET_VARIABLE, DEFAULT_FIRST_ACTION_BUDGET))
+    if seconds > budget:
+        logger.warning("%s: Time to first action %.2fs, over the budget of %.2fs", name, seconds, budget)
+        return False
+    logger.info("%s: Time to first action %.2fs (budget %.2fs)", name, seconds, budget)
+    return True
+
+
+class PhaseHistogram:
+    """
+    Durations of one phase as counts per log-spaced bucket, so adding one costs a log10 and an
+    increment and percentiles are exact to a bucket width.
+    """
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds <= MIN_SECONDS:
+            self.counts[0] += 1
+        else:
+            self.counts[min(int(math.log10(seconds / MIN_SECONDS) * BUCKETS_PER_DECADE), BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-th percentile, in seconds.
+        """
+        rank = q / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return MIN_SECONDS * 10 ** ((index + 1) / BUCKETS_PER_DECADE)
+        return MIN_SECONDS * 10 ** (BUCKETS / BUCKETS_PER_DECADE)
+
+    def summary(self):
+        # Milliseconds, as the step phases are best read
+        stats = {"count": self.count, "mean_ms": self.total / self.count * 1e3 if self.count else 0.0}
+        for q in PERCENTILES:
+            stats[f"p{q}_ms"] = self.percentile(q) * 1e3 if self.count else 0.0
+        return stats
+
+
+class StepTimings:
+    """
+    Per-phase wall time of a worker's step loop. The phases of a step run back to back, so
+    each is timed as a lap: start() marks the beginning of the step, lap(phase) records the
+    time since the previous mark under `phase` and moves the mark. One perf_counter per phase.
+
+        timings.start()
+        game_state = connection.receive_state()
+        timings.lap("receive")
+        ...
+        timings.end_step()
+
+    end_step() also records the whole step under "step" and, every `flush_interval` seconds,
+    appends the histograms of the phases since the last flush to `path` as one JSON line
+    {"time", "steps", "seconds", "phases": {phase: {count, mean_ms, p50_ms, p95_ms, p99_ms}}}
+    and starts over.
+    """
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL, name="worker"):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.name = name
+        self.histograms = {}
+        self.steps = 0
+        self.mark = self.step_start = self.flushed_at = time.perf_counter()
+
+    def start(self):
+        self.mark = self.step_start = time.perf_counter()
+
+    def lap(self, phase, part_phase=None, part_seconds=0.0):
+        """
+        Record the time since the last mark under `phase`. `part_seconds` of it, measured by
+        the phase itself, are recorded under `part_phase` instead (e.g. the JSON parsing inside
+        a receive).
+        """
+        now = time.perf_counter()
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = PhaseHistogram()
+        histogram.add(now - self.mark - part_seconds)
+        if part_phase is not None:
+            self.add(part_phase, part_seconds)
+        self.mark = now
+
+    def add(self, phase, seconds):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = PhaseHistogram()
+        histogram.add(seconds)
+
+    def end_step(self):
+        now = time.perf_counter()
+        self.add("step", now - self.step_start)
+        self.steps += 1
+        self.mark = now
+        if now - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def report(self):
+        return {phase: histogram.summary() for phase, histogram in self.histograms.items()}
+
+    def flush(self):
+        """
+        Append the timings since the last flush to the file, log their means and start over.
+        """
+        now = time.perf_counter()
+        report = self.report()
+        if self.path is not None and report:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "steps": self.steps, "seconds": now - self.flushed_at, "phases": report}) + "\n")
+        if report:
+            logger.info("%s: mean ms per phase over %d steps: %s", self.name, self.steps,
+                        ", ".join(f"{phase} {stats['mean_ms']:.2f}" for phase, stats in report.items()))
+        self.histograms = {}
+        self.steps = 0
+        self.flushed_at = now
+        # The flush itself is not part of the next phase
+        self.mark = time.perf_counter()
@@ -1,4 +1,4 @@
-from keras.preprocessing.text import Tokenizer
+from util.vocabulary import Vocabulary
 
 # List of all card names
 card_names = [
@@ -61,22 +61,19 @@ card_names = [
     "Pride", "Burn", "Dazed", "Slimed", "Void", "Wound"
 ]
 
-# Initialize the tokenizer
-card_tokenizer = Tokenizer()
-card_tokenizer.fit_on_texts(card_names)
+# Initialize the vocabulary
+card_tokenizer = Vocabulary(card_names)
 
 card_types = ["ATTACK", "SKILL", "POWER", "STATUS", "CURSE"]
 
-# Initialize the tokenizer
-card_type_tokenizer = Tokenizer()
-card_type_tokenizer.fit_on_texts(card_types)
+# Initialize the vocabulary
+card_type_tokenizer = Vocabulary(card_types)
 
 # Define the card rarities
 card_rarities = ["BASIC", "SPECIAL", "COMMON", "UNCOMMON", "RARE", "CURSE"]
 
-# Initialize the tokenizer
-card_rarity_tokenizer = Tokenizer()
-card_rarity_tokenizer.fit_on_texts(card_rarities)
+# Initialize the vocabulary
+card_rarity_tokenizer = Vocabulary(card_rarities)
 
 intents = [
     "ATTACK", "ATTACK_BUFF", "ATTACK_DEBUFF", "ATTACK_DEFEND", "BUFF", "DEBUFF",
@@ -85,9 +82,8 @@ intents = [
 ]
 
 
-# Initialize the intent tokenizer
-intent_tokenizer = Tokenizer()
-intent_tokenizer.fit_on_texts(intents)
+# Initialize the intent vocabulary
+intent_tokenizer = Vocabulary(intents)
 
 # List of all monster IDs
 monster_ids = [
@@ -104,9 +100,8 @@ monster_ids = [
     "Shelled Parasite"
 ]
 
-# Initialize the monster ID tokenizer
-monster_id_tokenizer = Tokenizer()
-monster_id_tokenizer.fit_on_texts(monster_ids)
+# Initialize the monster ID vocabulary
+monster_id_tokenizer = Vocabulary(monster_ids)
 
 
 screen_types = [
@@ -115,9 +110,8 @@ screen_types = [
     "GRID", "HAND_SELECT", "GAME_OVER", "COMPLETE", "NONE"
 ]
 
-# Initialize the screen type tokenizer
-screen_type_tokenizer = Tokenizer()
-screen_type_tokenizer.fit_on_texts(screen_types)
+# Initialize the screen type vocabulary
+screen_type_tokenizer = Vocabulary(screen_types)
 
 powers = [
     "Accuracy", "After Image", "Amplify", "Anger", "Angry", "Artifact", "Attack Burn", "Barricade", 
@@ -141,18 +135,15 @@ powers = [
 ]
 
 
-power_tokenizer = Tokenizer()
-power_tokenizer.fit_on_texts(powers)
+power_tokenizer = Vocabulary(powers)
 
 # List of all possible map symbols
 map_symbols = ["?", "$", "T", "M", "E", "R"]
 
-# Initialize the tokenizer for map symbols
-map_symbol_tokenizer = Tokenizer()
-map_symbol_tokenizer.fit_on_texts(map_symbols)
+# Initialize the vocabulary for map symbols
+map_symbol_tokenizer = Vocabulary(map_symbols)
 
 
-from keras.preprocessing.text import Tokenizer
 
 # Complete list of all possible relics
 relics_list = [
@@ -189,9 +180,8 @@ relics_list = [
     "Red Mask", "Spirit Poop", "Ssserpent Head", "Warped Tongs"
 ]
 
-# Initialize the tokenizer for relics
-relic_tokenizer = Tokenizer()
-relic_tokenizer.fit_on_texts(relics_list)
+# Initialize the vocabulary for relics
+relic_tokenizer = Vocabulary(relics_list)
 
 # List of all potion types
 potion_types = [
@@ -204,9 +194,8 @@ potion_types = [
     "SteroidPotion", "Strength Potion", "Swift Potion", "Weak Potion", "EntropicBrew", "Entropic Brew"
 ]
 
-# Initialize the potion type tokenizer
-potion_tokenizer = Tokenizer()
-potion_tokenizer.fit_on_texts(potion_types)
+# Initialize the potion type vocabulary
+potion_tokenizer = Vocabulary(potion_types)
 
 rest_options = [
     "rest", 
@@ -214,9 +203,8 @@ rest_options = [
     "recall"
 ]
 
-# Initialize the rest option tokenizer
-rest_tokenizer = Tokenizer()
-rest_tokenizer.fit_on_texts(rest_options)
+# Initialize the rest option vocabulary
+rest_tokenizer = Vocabulary(rest_options)
 
 event_ids = [
     "Falling", "MindBloom", "The Moai Head", "Mysterious Sphere", "SecretPortal", 
@@ -232,14 +220,12 @@ event_ids = [
     "Transmorgrifier", "Upgrade Shring", "WeMeetAgain"
 ]
 
-event_id_tokenizer = Tokenizer()
-event_id_tokenizer.fit_on_texts(event_ids)
+event_id_tokenizer = Vocabulary(event_ids)
 
 reward_types = [
     "CARD", "GOLD", "POTION", "RELIC", "STOLEN_GOLD", 
     "SAPPHIRE_KEY", "EMERALD_KEY", "RUBY_KEY", "HEALING"
 ]
 
-# Initialize and fit the tokenizer for reward types
-reward_type_tokenizer = Tokenizer()
-reward_type_tokenizer.fit_on_texts(reward_types)
\ No newline at end of file
+# Initialize the vocabulary for reward types
+reward_type_tokenizer = Vocabulary(reward_types)
\ No newline at end of file
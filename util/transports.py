@@ -0,0 +1,134 @@
+"""
+Transports of the middleman <-> worker connection. Both ends always run on the same machine,
+so besides TCP (the default, and the only one that reaches another machine) a game can be
+connected through an AF_UNIX socket or a pair of shared memory rings. A game is still known
+by its port number, the other transports derive their address from it:
+
+- "tcp": <host>:<port>
+- "unix": the socket file unix_socket_path(port) in the temp directory
+- "shm": the shared memory block shared_memory_name(port) with one byte ring per direction
+  and FIFOs as doorbells, see util/shared_memory_transport.py
+
+listen() and connect() return socket-likes for every transport. The framing functions only
+use sendall, recv_into and socket.timeout, selectors only fileno, so GameConnection and
+middleman_process.py work unchanged on top of any of them.
+
+Only TCP works everywhere. AF_UNIX sockets need a POSIX system (or a Python exposing them),
+the shared memory transport POSIX on x86, check_supported() says so up front. Its module
+(util/shared_memory_transport.py) is only imported once "shm" is used.
+"""
+import errno
+import os
+import socket
+import tempfile
+
+from util.lazy_import import lazy_import
+
+shared_memory_transport = lazy_import("util.shared_memory_transport")
+
+TRANSPORTS = ("tcp", "unix", "shm")
+
+
+def unix_socket_path(port):
+    return os.path.join(tempfile.gettempdir(), f"slay_the_spire_{port}.sock")
+
+def unix_owner_path(port):
+    """
+    File holding the pid of the middleman listening on unix_socket_path(port), so whether the
+    socket is served can be told without connecting to it (the middleman would take a probe
+    connection for a new worker and drop the connected one).
+    """
+    return unix_socket_path(port) + ".pid"
+
+def unix_owner_alive(port):
+    try:
+        with open(unix_owner_path(port)) as f:
+            owner = int(f.read())
+    except (FileNotFoundError, ValueError):
+        return False
+    try:
+        os.kill(owner, 0)
+        return True
+    except (ProcessLookupError, OverflowError):
+        return False
+    except PermissionError:
+        return True
+
+def check_supported(transport):
+    """
+    Raise ValueError for an unknown transport or one this system lacks.
+    """
+    if transport == "unix" and not hasattr(socket, "AF_UNIX"):
+        raise ValueError("The unix transport needs AF_UNIX sockets, use 'tcp' on this system")
+    if transport == "shm":
+        shared_memory_transport.check_supported()
+    elif transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{transport}', expected one of {', '.join(TRANSPORTS)}")
+
+
+def listen(transport, port, host="0.0.0.0", backlog=5):
+    """
+    Listener of `transport` for the game `port`, with accept() returning (connection, address).
+    """
+    check_supported(transport)
+    if transport == "tcp":
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(backlog)
+        return server
+    if transport in ("unix", "shm") and address_in_use(transport, port):
+        raise OSError(errno.EADDRINUSE, f"Port {port} is in use by another middleman ({transport})")
+    if transport == "unix":
+        with open(unix_owner_path(port), "w") as f:
+            f.write(str(os.getpid()))
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(unix_socket_path(port))
+        server.listen(backlog)
+        return server
+    return shared_memory_transport.SharedMemoryListener(port)
+
+def connect(transport, port, host="localhost", timeout=None):
+    """
+    Worker end of the connection to the middleman of `port`.
+    """
+    check_supported(transport)
+    if transport == "tcp":
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client_socket.settimeout(timeout)
+        client_socket.connect((host, port))
+        return client_socket
+    if transport == "unix":
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.settimeout(timeout)
+        client_socket.connect(unix_socket_path(port))
+        return client_socket
+    return shared_memory_transport.connect_shared_memory(port, timeout)
+
+def address_in_use(transport, port):
+    """
+    Whether a middleman serves `port` on `transport`. Addresses left behind by a middleman that
+    died (a socket file or a block whose owner is gone) are removed and free. Nothing connects
+    to a live middleman to find out.
+    """
+    check_supported(transport)
+    if transport == "tcp":
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                s.bind(("0.0.0.0", port))
+            return False
+        except OSError:
+            return True
+    if transport == "unix":
+        path = unix_socket_path(port)
+        if not os.path.exists(path):
+            return False
+        if unix_owner_alive(port):
+            return True
+        for leftover in (path, unix_owner_path(port)):
+            try:
+                os.unlink(leftover)
+            except FileNotFoundError:
+                pass
+        return False
+    return shared_memory_transport.address_in_use(port)
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Same text normalisation as keras.preprocessing.text.Tokenizer so that the token ids
+# stay identical to the ones the saved models were trained on
+KERAS_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+_FILTER_TABLE = str.maketrans({char: " " for char in KERAS_FILTERS})
+
+# Token returned for any text without a single in-vocabulary word
+OOV_TOKEN = 0
+
+
+def text_to_words(text):
+    """
+    Lowercase a text, strip punctuation and split it into words (keras text_to_word_sequence).
+    """
+    return [word for word in text.lower().translate(_FILTER_TABLE).split(" ") if word]
+
+
+class Vocabulary:
+    """
+    Precompiled exact-match lookup table replacing a fitted keras Tokenizer.
+
+    Word ids are assigned the way Tokenizer.fit_on_texts does (most frequent word first,
+    ties in first-seen order, ids starting at 1). Every text is then interned to the token
+    that `texts_to_sequences([text])[0][0]` used to produce, i.e. the id of its first known
+    word, so an encode is a single dict lookup instead of a lowercase/split per call.
+    """
+
+    def __init__(self, texts):
+        word_counts = {}
+        for text in texts:
+            for word in text_to_words(text):
+                word_counts[word] = word_counts.get(word, 0) + 1
+
+        ordered_words = sorted(word_counts, key=word_counts.get, reverse=True)
+        self.word_index = {word: index for index, word in enumerate(ordered_words, start=1)}
+
+        # Exact text -> token table, texts seen at runtime are interned on first lookup
+        self._lookup = {}
+        for text in texts:
+            self.encode(text)
+
+    def __len__(self):
+        return len(self.word_index)
+
+    def __contains__(self, text):
+        return self.encode(text) != OOV_TOKEN
+
+    def encode(self, text):
+        """
+        Return the token for a single text, OOV_TOKEN if none of its words are known.
+        """
+        try:
+            return self._lookup[text]
+        except (KeyError, TypeError):
+            pass
+
+        if not isinstance(text, str):
+            return OOV_TOKEN
+
+        token = OOV_TOKEN
+        for word in text_to_words(text):
+            index = self.word_index.get(word)
+            if index is not None:
+                token = index
+                break
+
+        self._lookup[text] = token
+        return token
+
+    def encode_many(self, texts, dtype=np.float32):
+        """
+        Encode a sequence of texts into a 1D array of tokens.
+        """
+        encode = self.encode
+        return np.array([encode(text) for text in texts], dtype=dtype)